@@ -0,0 +1,213 @@
+"""
+Versioned changes to the schema of the databases of the SQL backend.
+
+`Base.metadata.create_all` only creates the missing tables, so the
+columns and indexes added to the existing tables since a database was
+created are added by the migrations here.  The migrations are applied
+in order by `ctrl migrate`, and only once: the version of every
+migration applied is recorded in the schema_version table.  The backend
+refuses to start with a database that is missing any of them.
+
+Every migration has to leave a database that already has its changes
+alone, as new databases are created with all of them.
+"""
+
+import logging
+from time import time
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table
+from sqlalchemy.engine.reflection import Inspector
+
+logger = logging.getLogger('mtj.eve.tracker.backend.migration')
+
+
+class SchemaVersionError(ValueError):
+    """
+    The schema of the database is missing some of the migrations.
+    """
+
+
+def _reflect(engine, name):
+    return Table(name, MetaData(), autoload=True, autoload_with=engine)
+
+
+def addColumns(name, *columns):
+    """
+    Return a migration adding the columns to the table with name, if
+    missing from the database.
+    """
+
+    def migrate(engine, metadata):
+        inspector = Inspector.from_engine(engine)
+        existing = set(c['name'] for c in inspector.get_columns(name))
+        preparer = engine.dialect.identifier_preparer
+        for column in columns:
+            if column.name in existing:
+                continue
+            logger.info('Adding column `%s.%s`.', name, column.name)
+            # bound to a table of its own, for the names to be quoted.
+            column = column.copy()
+            table = Table(name, MetaData(), column)
+            engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+                preparer.format_table(table),
+                preparer.format_column(column),
+                column.type.compile(dialect=engine.dialect),
+            ))
+    return migrate
+
+
+def addTables(*tables):
+    """
+    Return a migration creating the tables, along with their indexes,
+    if missing.
+    """
+
+    def migrate(engine, metadata):
+        for table in tables:
+            table.create(engine, checkfirst=True)
+    return migrate
+
+
+def addIndexes(name, *indexes):
+    """
+    Return a migration creating the indexes of the table with name,
+    given as (index name, column names...), if missing.
+    """
+
+    def migrate(engine, metadata):
+        table = _reflect(engine, name)
+        existing = set(i.name for i in table.indexes)
+        for index in indexes:
+            if index[0] in existing:
+                continue
+            logger.info('Creating index `%s`.', index[0])
+            Index(index[0], *[table.c[k] for k in index[1:]]).create(engine)
+    return migrate
+
+
+def combine(*migrations):
+    """
+    Return a migration applying the migrations in order.
+    """
+
+    def migrate(engine, metadata):
+        for migration in migrations:
+            migration(engine, metadata)
+    return migrate
+
+
+# The tables as they were added by the migrations, which must not
+# follow the later changes to the models.
+_tables = MetaData()
+
+latest_completed_usage = Table('latest_completed_usage', _tables,
+    Column('api_key', Integer, primary_key=True, autoincrement=False),
+    Column('usage_id', Integer),
+    Column('start_ts', Integer),
+    Column('end_ts', Integer),
+)
+
+latest_audit = Table('latest_audit', _tables,
+    Column('table', String(255), primary_key=True),
+    Column('rowid', Integer, primary_key=True, autoincrement=False),
+    Column('category_name', String(255), primary_key=True),
+    Column('audit_id', Integer),
+    Column('timestamp', Integer),
+)
+
+# (version, description, migration) of every migration, in order.  The
+# changes of every migration are spelt out, rather than taken from the
+# models, so a version always means the same schema.
+MIGRATIONS = (
+    (1, 'Add the digest and cachedUntil columns of tower_api',
+        addColumns('tower_api',
+            Column('digest', String(40)),
+            Column('cachedUntil', Integer),
+        )),
+    (2, 'Add the latest_completed_usage and latest_audit tables',
+        addTables(latest_completed_usage, latest_audit)),
+    (3, 'Add the indexes of the frequent queries', combine(
+        addIndexes('tower',
+            ('ix_tower_itemID_moonID', 'itemID', 'moonID'),
+        ),
+        addIndexes('tower_log',
+            ('ix_tower_log_tower_id_stateTimestamp_id', 'tower_id',
+                'stateTimestamp', 'id'),
+        ),
+        addIndexes('fuel',
+            ('ix_fuel_tower_id_fuelTypeID_id', 'tower_id', 'fuelTypeID',
+                'id'),
+            ('ix_fuel_tower_id_timestamp_id', 'tower_id', 'timestamp', 'id'),
+        ),
+        addIndexes('audit',
+            ('ix_audit_table_rowid_category_name_timestamp', 'table',
+                'rowid', 'category_name', 'timestamp'),
+            ('ix_audit_table_rowid_timestamp_id', 'table', 'rowid',
+                'timestamp', 'id'),
+            ('ix_audit_timestamp_id', 'timestamp', 'id'),
+        ),
+        addIndexes('api_usage_log',
+            ('ix_api_usage_log_api_key_state_start_ts', 'api_key', 'state',
+                'start_ts'),
+        ),
+    )),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def getVersion(engine, metadata):
+    """
+    Return the version of the schema of the database.
+    """
+
+    table = metadata.tables['schema_version']
+    if not table.exists(bind=engine):
+        return 0
+    result = engine.execute(table.select().order_by(
+        table.c.version.desc()).limit(1)).first()
+    return result and result.version or 0
+
+
+def stamp(engine, metadata, version, description=''):
+    """
+    Record the schema of the database as being at version.
+    """
+
+    table = metadata.tables['schema_version']
+    engine.execute(table.insert().values(version=version,
+        description=description, timestamp=int(time())))
+
+
+def migrate(engine, metadata, migrations=MIGRATIONS):
+    """
+    Apply the migrations after the version of the database, returning
+    the (version, description) of the ones applied.
+    """
+
+    metadata.tables['schema_version'].create(engine, checkfirst=True)
+    current = getVersion(engine, metadata)
+    applied = []
+    for version, description, migration in migrations:
+        if version <= current:
+            continue
+        logger.info('Migrating to version %d: %s', version, description)
+        migration(engine, metadata)
+        stamp(engine, metadata, version, description)
+        applied.append((version, description))
+    return applied
+
+
+def explain(engine, query):
+    """
+    Return the rows of the query plan of the query by the database.
+    """
+
+    compiled = query.statement.compile(dialect=engine.dialect)
+    if compiled.positional:
+        params = [compiled.params[k] for k in compiled.positiontup]
+    else:
+        params = compiled.params
+    prefix = engine.dialect.name == 'sqlite' and 'EXPLAIN QUERY PLAN '
+    return list(engine.execute((prefix or 'EXPLAIN ') + unicode(compiled),
+        params))
@@ -8,6 +8,76 @@ ApiTowerStatus = namedtuple('ApiTowerStatus',
 ApiUsage = namedtuple('ApiUsage',
     ['start_ts', 'end_ts', 'state'])
 
+# A version of the towers in the tracker, as a dict of immutable
+# (`pos.FrozenTower`) towers by id.  The dict must not be modified.
+FleetSnapshot = namedtuple('FleetSnapshot',
+    ['version', 'towers'])
+
+
+def pageCursor(row):
+    """
+    Return the cursor for the page of a log after the row, which is the
+    values of the `pageKeys` of its class, e.g. '1325376000.42'.
+    """
+
+    values = [getattr(row, k) for k in type(row).pageKeys]
+    return '.'.join(v is not None and str(v) or '' for v in values)
+
+
+class TowerIndex(object):
+    """
+    Lookup of the towers by their natural keys: the unique (itemID,
+    moonID) pair of the API, and the attributes listed in `keys` which
+    are shared by a number of towers.
+
+    Kept in step with the towers of a backend as they are added or
+    reloaded.
+    """
+
+    keys = ('locationID', 'regionName')
+
+    def __init__(self, towers=()):
+        self._items = {}
+        self._groups = {k: {} for k in self.keys}
+        for tower in towers:
+            self.add(tower)
+
+    def add(self, tower):
+        self._items[(tower.itemID, tower.moonID)] = tower.id
+        for key, group in self._groups.iteritems():
+            group.setdefault(getattr(tower, key, None), set()).add(tower.id)
+
+    def remove(self, tower):
+        """
+        Remove the entries of tower, as they were when it was added.
+        """
+
+        if self._items.get((tower.itemID, tower.moonID)) == tower.id:
+            del self._items[(tower.itemID, tower.moonID)]
+        for key, group in self._groups.iteritems():
+            value = getattr(tower, key, None)
+            ids = group.get(value)
+            if ids is None:
+                continue
+            ids.discard(tower.id)
+            if not ids:
+                del group[value]
+
+    def get(self, itemID, moonID, default=None):
+        """
+        Return the id of the tower with the itemID at moonID.
+        """
+
+        return self._items.get((itemID, moonID), default)
+
+    def find(self, key, value):
+        """
+        Return the sorted ids of the towers with the value for key.
+        """
+
+        return sorted(self._groups[key].get(value, ()))
+
+
 api_usage_states = {
     -1: 'running',
     0: 'completed',
@@ -0,0 +1,140 @@
+"""
+Snapshot and journal files for the tracker backend.
+
+The snapshot is the hydrated state of all the towers and their fuel
+buffers, along with the change sequence (see `sql.ChangeLog`) it is
+current to.  The journal is an append-only log of the tower and fuel
+writes made after that.  Restoring both avoids the evedb, API helper
+and database lookups done by a full reinstantiation.
+
+Both files are pickled tuples; the snapshot is written to a temporary
+file that replaces the previous one, so a partially written snapshot is
+never read.  A truncated journal entry (such as one from a crash during
+writing) ends the replay.
+"""
+
+import errno
+import os
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+SNAPSHOT_MAGIC = 'mtj.eve.tracker.snapshot'
+JOURNAL_MAGIC = 'mtj.eve.tracker.journal'
+
+# Increment when the layout of the records changes.
+SNAPSHOT_VERSION = 1
+
+PICKLE_PROTOCOL = 2
+
+
+class SnapshotVersionError(ValueError):
+    """
+    The snapshot was written by an incompatible version.
+    """
+
+
+def dumpSnapshot(path, version, watermark, records):
+    """
+    Write the snapshot to path.
+
+    version
+        The version of the records, to be verified on load.
+    watermark
+        The change sequence the records are current to.
+    records
+        The tower records.
+    """
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.snapshot')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump((SNAPSHOT_MAGIC, version), fp, PICKLE_PROTOCOL)
+            pickle.dump((watermark, records), fp, PICKLE_PROTOCOL)
+        os.rename(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def loadSnapshot(path, version):
+    """
+    Return the (watermark, records) stored in the snapshot at path, or
+    None if there is no snapshot.
+
+    Raises `SnapshotVersionError` if the version doesn't match.
+    """
+
+    try:
+        fp = open(path, 'rb')
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+    with fp:
+        header = pickle.load(fp)
+        if header != (SNAPSHOT_MAGIC, version):
+            raise SnapshotVersionError(
+                'snapshot `%s` has header %r, expected %r' % (
+                    path, header, (SNAPSHOT_MAGIC, version)))
+        return pickle.load(fp)
+
+
+class Journal(object):
+    """
+    The append-only journal of writes made after a snapshot.
+
+    Entries are tuples with the change sequence as the second element.
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+
+    def append(self, entry):
+        with open(self.path, 'ab') as fp:
+            if not fp.tell():
+                pickle.dump((JOURNAL_MAGIC, self.version), fp,
+                    PICKLE_PROTOCOL)
+            # written as a single block so concurrent writers don't
+            # interleave within an entry.
+            fp.write(pickle.dumps(entry, PICKLE_PROTOCOL))
+
+    def entries(self, after=0):
+        """
+        Iterate through the entries with a change sequence after the
+        one specified.  Nothing is returned if the journal doesn't
+        exist or was written by a different version.
+        """
+
+        try:
+            fp = open(self.path, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+
+        with fp:
+            try:
+                if pickle.load(fp) != (JOURNAL_MAGIC, self.version):
+                    return
+                while True:
+                    entry = pickle.load(fp)
+                    if entry[1] > after:
+                        yield entry
+            except Exception:
+                # end of the journal, or an incomplete final entry.
+                return
+
+    def truncate(self):
+        try:
+            os.unlink(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
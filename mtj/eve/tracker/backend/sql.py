@@ -1,13 +1,20 @@
 from time import time
+import contextlib
+import itertools
 import logging
+import threading
 
 import sqlalchemy
-from sqlalchemy import func, desc, and_, or_
+from sqlalchemy import func, desc, and_
 from sqlalchemy import Column, Integer, String, Boolean, Float, MetaData, Text
+from sqlalchemy import Index
 from sqlalchemy import create_engine
+from sqlalchemy.engine.reflection import Inspector
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy.sql.util import ClauseAdapter
 
 import zope.interface
 import zope.component
@@ -18,8 +25,15 @@ from mtj.eve.tracker.backend.interfaces import ISQLAlchemyBackend
 from mtj.eve.tracker.backend.interfaces import ISQLAPIKeyManager
 from mtj.eve.tracker.backend.model import ApiTowerStatus
 from mtj.eve.tracker.backend.model import ApiUsage
+from mtj.eve.tracker.backend.model import FleetSnapshot
+from mtj.eve.tracker.backend.model import TowerIndex
+from mtj.eve.tracker.backend.model import pageCursor
+from mtj.eve.tracker.backend import migration
+from mtj.eve.tracker.backend import snapshot
 from mtj.eve.tracker import pos
 from mtj.eve.tracker import evelink
+from mtj.eve.tracker.events import EventLog
+from mtj.eve.tracker.projection import FleetProjection
 
 
 _marker = object()
@@ -37,10 +51,22 @@ logger = logging.getLogger('mtj.eve.tracker.backend.sql')
 #     For the abstract silo contents.
 # audit
 #     For logging of audit actions, note down who did what.
+# change_log
+#     The sequence of writes done to towers, for incremental reloads.
 
 
-class Tower(Base, pos.Tower):
+class Tower(Base):
+    """
+    The row of a tower.  The live towers are plain `pos.Tower` objects,
+    with the values of the columns copied from the rows by
+    `towerFromValues` on load and back by `towerValues` on write.
+    """
+
     __tablename__ = 'tower'
+    __table_args__ = (
+        # for `SQLAlchemyBackend._queryTower`
+        Index('ix_tower_itemID_moonID', 'itemID', 'moonID'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -53,45 +79,77 @@ class Tower(Base, pos.Tower):
     onlineTimestamp = Column(Integer)
     standingOwnerID = Column(Integer)
 
-    def __init__(self, *a, **kw):
-        pos.Tower.__init__(self, *a, **kw)
 
-    def _reloadResources(self, session):
-        """
-        Reload resources from database.
-        """
+def towerFromValues(values):
+    """
+    Return a `pos.Tower` with the values of the columns of its row, in
+    the order of the columns, without its derived values, which are
+    set by `pos.Tower._initDerived` or `pos.Tower.restoreSnapshotState`.
+    """
+
+    tower = pos.Tower.__new__(pos.Tower)
+    for k, v in zip(Tower.__table__.c.keys(), values):
+        setattr(tower, k, v)
+    return tower
+
+
+def towerValues(tower):
+    """
+    Return the values of the columns of the row of the tower, in the
+    order of the columns.
+    """
+
+    return [getattr(tower, k, None) for k in Tower.__table__.c.keys()]
 
-        self.initResources()
 
-        # load pos fuel info.
-        # dict comprehension
-        all_fuels = {v['resourceTypeID']: v for v in
-            pos.pos_info.getControlTowerResource(self.typeID)}
+def reloadResources(tower, session, results=None):
+    """
+    Reload the resources of the tower from the database.
+
+    results
+        The latest `Fuel` rows for the tower.  If not provided they
+        will be queried using the session.
+    """
 
-        # query for stuff
-        results = session.query(Fuel).filter(
-            Fuel.tower_id == self.id).group_by(
-                Fuel.fuelTypeID).having(func.max(Fuel.id))
+    profile = tower.getProfile()
+    tower.initResources(profile)
+
+    # load pos fuel info.
+    all_fuels = profile.resources
+
+    if results is None:
+        results = queryLatestFuels(session, tower.id).all()
+
+    for result in results:
+        resourceTypeID = result.fuelTypeID
+        fuel = all_fuels.get(resourceTypeID)
+        timestamp = tower.resourcePulseTimestamp(result.timestamp)
+        res_buffer = pos.TowerResourceBuffer(
+            tower=tower,
+            delta=result.delta,
+            timestamp=timestamp,
+            purpose=fuel['purpose'],
+            value=result.value,
+            resourceTypeName=fuel['typeName'],
+            unitVolume=fuel['volume'],
+        )
+        tower.fuels[resourceTypeID] = res_buffer
 
-        for result in results.all():
-            resourceTypeID = result.fuelTypeID
-            fuel = all_fuels.get(resourceTypeID)
-            timestamp = self.resourcePulseTimestamp(result.timestamp)
-            res_buffer = pos.TowerResourceBuffer(
-                tower=self,
-                delta=result.delta,
-                timestamp=timestamp,
-                purpose=fuel['purpose'],
-                value=result.value,
-                resourceTypeName=fuel['typeName'],
-                unitVolume=fuel['volume'],
-            )
-            self.fuels[resourceTypeID] = res_buffer
+    tower._invalidateDerived()
 
 
 class TowerLog(Base):
     # See SQLAlchemyBackend.addTower
     __tablename__ = 'tower_log'
+    __table_args__ = (
+        # for the pages of `SQLAlchemyBackend.getTowerLog`
+        Index('ix_tower_log_tower_id_stateTimestamp_id', 'tower_id',
+            'stateTimestamp', 'id'),
+    )
+
+    # the columns the log is paged by, see `queryPage`.
+    pageKeys = ('stateTimestamp', 'id')
+    pageNullKeys = ('stateTimestamp',)
 
     id = Column(Integer, primary_key=True)
 
@@ -143,9 +201,17 @@ class TowerApi(Base):
     # If present in TowerList but a transient error happened this is
     # incremented.  Otherwise it should always be set to 0.
     api_error_count = Column(Integer)
+    # Digest of the last starbase details processed for this tower, so
+    # an unchanged (i.e. cached) response can be skipped.  Added to the
+    # existing databases by migration 1.
+    digest = Column(String(40))
+    # The cachedUntil of the starbase details; they won't be requested
+    # again before this.  Added to the existing databases by migration
+    # 1.
+    cachedUntil = Column(Integer)
 
     def __init__(self, tower_id, api_key, currentTime, timestamp=None,
-            api_error_count=0):
+            api_error_count=0, digest=None, cachedUntil=None):
 
         self.tower_id = tower_id
         self.api_key = api_key
@@ -154,10 +220,22 @@ class TowerApi(Base):
         # the staleness of the data's currentTime.
         self.timestamp = timestamp is None and int(time()) or timestamp
         self.api_error_count = api_error_count
+        self.digest = digest
+        self.cachedUntil = cachedUntil
 
 
 class Fuel(Base):
     __tablename__ = 'fuel'
+    __table_args__ = (
+        # for `queryLatestFuels`
+        Index('ix_fuel_tower_id_fuelTypeID_id', 'tower_id', 'fuelTypeID',
+            'id'),
+        # for `SQLAlchemyBackend.getFuelLog`
+        Index('ix_fuel_tower_id_timestamp_id', 'tower_id', 'timestamp', 'id'),
+    )
+
+    # the columns the log is paged by, see `queryPage`.
+    pageKeys = ('timestamp', 'id')
 
     id = Column(Integer, primary_key=True)
 
@@ -185,6 +263,219 @@ class Fuel(Base):
         self.value = value
 
 
+def latestStrategy(dialect):
+    """
+    Return the strategy `queryLatest` uses for the dialect: 'distinct'
+    for DISTINCT ON, 'window' for ROW_NUMBER() OVER (PARTITION BY ...)
+    or 'correlated' for correlated max subqueries.
+    """
+
+    if dialect.name == 'postgresql':
+        return 'distinct'
+    if dialect.name == 'sqlite':
+        version = getattr(dialect.dbapi, 'sqlite_version_info', ())
+        return version >= (3, 25, 0) and 'window' or 'correlated'
+    if dialect.name == 'mysql':
+        version = tuple(v for v in dialect.server_version_info or ()
+            if isinstance(v, int))
+        if getattr(dialect, '_is_mariadb', False):
+            return version >= (10, 2) and 'window' or 'correlated'
+        return version >= (8, 0) and 'window' or 'correlated'
+    if dialect.name in ('oracle', 'mssql'):
+        return 'window'
+    return 'correlated'
+
+
+def queryLatest(session, cls, partition, order=None, filters=None,
+        earliest=False, strategy=None):
+    """
+    Query for the latest row of cls for every distinct combination of
+    the values of the partition columns, that is the row with the
+    greatest value of the order column, or the greatest id if order is
+    not specified.  Between the rows with the same value of the order
+    column the one with the least id is used, as SQLite does for the
+    bare columns of a group.
+
+    cls
+        The mapped class, with an id primary key.
+    partition
+        The names of the columns to partition the rows by.
+    order
+        The name of the column ordering the rows.
+    filters
+        The condition on cls for the rows to consider.
+    earliest
+        Return the earliest rows instead, by the least values.
+    strategy
+        One of the strategies of `latestStrategy`, which is used to
+        pick one for the database if not specified.
+    """
+
+    if strategy is None:
+        strategy = latestStrategy(session.bind.dialect)
+
+    table = cls.__table__
+    columns = [table.c[k] for k in partition]
+    direction = earliest and (lambda c: c) or desc
+    if order is None:
+        orders = [direction(table.c.id)]
+    else:
+        orders = [direction(table.c[order]), table.c.id]
+
+    if strategy == 'distinct':
+        latest = session.query(table.c.id.label('id')).distinct(*columns)
+        if filters is not None:
+            latest = latest.filter(filters)
+        latest = latest.order_by(*(columns + orders))
+        latest = latest.subquery()
+        return session.query(cls).join(latest, cls.id == latest.c.id)
+
+    if strategy == 'window':
+        rank = func.row_number().over(partition_by=columns,
+            order_by=orders)
+        latest = session.query(table.c.id.label('id'), rank.label('rank'))
+        if filters is not None:
+            latest = latest.filter(filters)
+        latest = latest.subquery()
+        return session.query(cls).join(latest, (cls.id == latest.c.id) &
+            (latest.c.rank == 1))
+
+    if strategy != 'correlated':
+        raise ValueError('unknown strategy `%s`' % strategy)
+
+    gfunc = earliest and func.min or func.max
+    q = session.query(cls)
+    if filters is not None:
+        q = q.filter(filters)
+
+    if order is None:
+        # the ids are the order, so they can be grouped.
+        latest = session.query(gfunc(table.c.id).label('id')).group_by(
+            *columns)
+        if filters is not None:
+            latest = latest.filter(filters)
+        latest = latest.subquery()
+        return q.join(latest, cls.id == latest.c.id)
+
+    def correlated(column):
+        alias = table.alias()
+        condition = and_(*[alias.c[k] == table.c[k] for k in partition])
+        if filters is not None:
+            condition = condition & ClauseAdapter(alias).traverse(filters)
+        return alias, condition
+
+    alias, condition = correlated(order)
+    top = session.query(gfunc(alias.c[order])).filter(condition).correlate(
+        table).as_scalar()
+    alias, condition = correlated('id')
+    top_id = session.query(func.min(alias.c.id)).filter(
+        condition & (alias.c[order] == top)).correlate(table).as_scalar()
+    return q.filter(cls.id == top_id)
+
+
+def queryLatestFuels(session, tower_id=None, tower_ids=None,
+        strategy=None):
+    """
+    Query for the latest `Fuel` row of every fuel type of every tower,
+    or only for the tower with tower_id or the towers in tower_ids if
+    specified.
+    """
+
+    conditions = []
+    if tower_id is not None:
+        conditions.append(Fuel.tower_id == tower_id)
+    if tower_ids is not None:
+        conditions.append(Fuel.tower_id.in_(tower_ids))
+    filters = conditions and and_(*conditions) or None
+    return queryLatest(session, Fuel, ('tower_id', 'fuelTypeID'),
+        filters=filters, strategy=strategy)
+
+
+def parseCursor(cls, cursor):
+    """
+    Return the values of the `pageKeys` of cls from the cursor, raising
+    ValueError if it is not a valid cursor for cls.
+    """
+
+    nullable = getattr(cls, 'pageNullKeys', ())
+    values = []
+    try:
+        for value in cursor.split('.'):
+            if value == '':
+                values.append(None)
+            else:
+                values.append(int(value))
+    except (AttributeError, ValueError):
+        raise ValueError('invalid cursor `%s`' % cursor)
+    if len(values) != len(cls.pageKeys) or any(v is None and
+            k not in nullable for k, v in zip(cls.pageKeys, values)):
+        raise ValueError('invalid cursor `%s`' % cursor)
+    return values
+
+
+def explicitNullsLast(dialect):
+    """
+    Return whether NULLS LAST is spelt out for a descending order on
+    the dialect.  MySQL and the SQLite before 3.30.0 lack the syntax,
+    but sort the NULL values first in ascending order, so last in
+    descending order, already.
+    """
+
+    if dialect.name == 'sqlite':
+        version = getattr(dialect.dbapi, 'sqlite_version_info', ())
+        return version >= (3, 30, 0)
+    return dialect.name != 'mysql'
+
+
+def queryPage(query, cls, count=None, after=None):
+    """
+    Order the query for rows of cls by the descending values of the
+    `pageKeys` of cls, which end with the id so every row has its own
+    place, and limit it to the page of count rows after the cursor.
+
+    Rather than skipping the rows before the page with an offset, the
+    page starts with a condition on the keys (keyset pagination), so
+    with an index on them every page is as quick to get as the first.
+
+    The NULL values of the `pageNullKeys` of cls are sorted after all
+    others (see `explicitNullsLast`).
+    """
+
+    table = cls.__table__
+    nullable = getattr(cls, 'pageNullKeys', ())
+    columns = [table.c[k] for k in cls.pageKeys]
+    explicit = explicitNullsLast(query.session.bind.dialect)
+    orders = []
+    for column in columns:
+        order = desc(column)
+        if explicit and column.name in nullable:
+            order = sqlalchemy.nullslast(order)
+        orders.append(order)
+    query = query.order_by(*orders)
+
+    if after is not None:
+        values = parseCursor(cls, after)
+        # (a, b) < (x, y) spelt out, as row values are not portable.
+        keys = list(zip(columns, values))
+        column, value = keys.pop()
+        condition = column < value
+        for column, value in reversed(keys):
+            if value is None:
+                condition = (column == None) & condition
+                continue
+            condition = (column < value) | ((column == value) & condition)
+            if column.name in nullable:
+                condition = condition | (column == None)
+            else:
+                # so the index range is used for the leading key.
+                condition = (column <= value) & condition
+        query = query.filter(condition)
+
+    if count:
+        query = query.limit(count)
+    return query
+
+
 class Silo(Base):
     __tablename__ = 'silo'
 
@@ -253,6 +544,19 @@ class Audit(Base):
     """
 
     __tablename__ = 'audit'
+    __table_args__ = (
+        # for the latest audits of every category of every row.
+        Index('ix_audit_table_rowid_category_name_timestamp', 'table',
+            'rowid', 'category_name', 'timestamp'),
+        # for the pages of `SQLAlchemyBackend.getAuditEntriesFor`
+        Index('ix_audit_table_rowid_timestamp_id', 'table', 'rowid',
+            'timestamp', 'id'),
+        # for the pages of `SQLAlchemyBackend.getAuditEntriesRecent`
+        Index('ix_audit_timestamp_id', 'timestamp', 'id'),
+    )
+
+    # the columns the entries are paged by, see `queryPage`.
+    pageKeys = ('timestamp', 'id')
 
     id = Column(Integer, primary_key=True)
 
@@ -275,6 +579,67 @@ class Audit(Base):
         self.timestamp = timestamp
 
 
+class LatestAudit(Base):
+    """
+    The latest `Audit` of every category of every row, maintained by
+    `SQLAlchemyBackend.addAudit` for `SQLAlchemyBackend.getAuditForTable`.
+    """
+
+    __tablename__ = 'latest_audit'
+
+    table = Column(String(255), primary_key=True)
+    rowid = Column(Integer, primary_key=True, autoincrement=False)
+    category_name = Column(String(255), primary_key=True)
+    audit_id = Column(Integer)
+    timestamp = Column(Integer)
+
+    def __init__(self, table, rowid, category_name, audit_id, timestamp):
+        self.table = table
+        self.rowid = rowid
+        self.category_name = category_name
+        self.audit_id = audit_id
+        self.timestamp = timestamp
+
+
+class SchemaVersion(Base):
+    """
+    The versions of the `migration.MIGRATIONS` applied to the database.
+    """
+
+    __tablename__ = 'schema_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer)
+    description = Column(Text)
+    timestamp = Column(Integer)
+
+
+class ChangeLog(Base):
+    """
+    Log of the writes done to the tower related tables.
+
+    The id is the change sequence; an instance that has applied all
+    changes up to some id only needs to reload the towers with entries
+    after that id to be current again.
+    """
+
+    __tablename__ = 'change_log'
+
+    id = Column(Integer, primary_key=True)
+    tower_id = Column(Integer)
+    # name of the table written to
+    table = Column(String(255))
+    timestamp = Column(Integer)
+
+    def __init__(self, tower_id, table, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time())
+
+        self.tower_id = tower_id
+        self.table = table
+        self.timestamp = timestamp
+
+
 class APIKey(Base):
 
     __tablename__ = 'api_key'
@@ -290,6 +655,11 @@ class APIKey(Base):
 class ApiUsageLog(Base):
 
     __tablename__ = 'api_usage_log'
+    __table_args__ = (
+        # for the completed usages of a key around a timestamp.
+        Index('ix_api_usage_log_api_key_state_start_ts', 'api_key', 'state',
+            'start_ts'),
+    )
 
     id = Column(Integer, primary_key=True)
     api_key = Column(Integer, index=True)
@@ -304,6 +674,27 @@ class ApiUsageLog(Base):
         self.end_ts = None
 
 
+class LatestCompletedUsage(Base):
+    """
+    The latest completed `ApiUsageLog` of every api key, maintained by
+    `SQLAlchemyBackend.endApiUsage` so the towers still reported by the
+    API can be found without going through the whole usage log.
+    """
+
+    __tablename__ = 'latest_completed_usage'
+
+    api_key = Column(Integer, primary_key=True, autoincrement=False)
+    usage_id = Column(Integer)
+    start_ts = Column(Integer)
+    end_ts = Column(Integer)
+
+    def __init__(self, api_key, usage_id, start_ts, end_ts):
+        self.api_key = api_key
+        self.usage_id = usage_id
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+
+
 @zope.interface.implementer(ISQLAlchemyBackend)
 class SQLAlchemyBackend(object):
     """
@@ -324,23 +715,72 @@ class SQLAlchemyBackend(object):
         [(1, u'silo', 24, u'skimmed 100 tech', u'dj', u'', 1359350165)]
     """
 
-    def __init__(self, src=None):
+    # maximum amount of ids to put in a single IN clause.
+    in_clause_limit = 500
+
+    def __init__(self, src=None, snapshot_path=None):
         if not src:
             src = 'sqlite://'
 
         self._conn = create_engine(src)
-        self._metadata = MetaData()
-        self._metadata.reflect(bind=self._conn)
-        Base.metadata.create_all(self._conn)
+        self._checkSchemaVersion()
         self._sessions = sessionmaker(
             bind=self._conn,
             expire_on_commit=False,
         )
 
         self._towers = {}
+        # the ids of the towers by their natural keys.
+        self._index = TowerIndex()
+        # the immutable copy of the towers for readers, replaced as a
+        # whole by `_publishFleet`.
+        self._fleet = FleetSnapshot(0, {})
+        self._fleet_lock = threading.Lock()
+        # the (fleet version, projection) of `getFleetProjection`.
+        self._projection = None
+        # pending writes for `batch`, per thread.
+        self._local = threading.local()
+        # the last change applied to the towers.
+        self._watermark = None
+        # bumped on every change to the data served by the tracker.
+        self._versions = itertools.count(1)
+        self._version = 0
+        # the change events of the towers.
+        self.events = EventLog()
         self._setAuditables(Fuel, Tower, TowerLog, Silo)
 
+        self._snapshot_path = snapshot_path
+        self._journal = None
+        if snapshot_path:
+            self._journal = snapshot.Journal(snapshot_path + '.journal',
+                self._snapshotVersion())
+
         self._addDefaultData()
+        self._backfillLatestCompletedUsage()
+        self._backfillLatestAudit()
+
+    def _checkSchemaVersion(self):
+        if not Inspector.from_engine(self._conn).get_table_names():
+            createSchema(self._conn)
+            return
+        # the models are mapped to the current schema, so the database
+        # can't be used until the migrations are applied (see
+        # `migrateSchema`).
+        version = self.getSchemaVersion()
+        if version < migration.SCHEMA_VERSION:
+            raise migration.SchemaVersionError(
+                'database schema is at version %d, version %d is required; '
+                'apply the migrations with `migrate`' % (
+                    version, migration.SCHEMA_VERSION))
+
+    def getSchemaVersion(self):
+        return migration.getVersion(self._conn, Base.metadata)
+
+    def hotQueries(self):
+        return hotQueries(self.session())
+
+    def explainHotQueries(self):
+        return explainHotQueries(self._conn)
 
     def _setAuditables(self, *cls):
         self._auditable = {c.__tablename__: c for c in cls}
@@ -357,27 +797,157 @@ class SQLAlchemyBackend(object):
     def session(self):
         return self._sessions()
 
-    def _queryApiUsage(self, gfunc, extrafilters=None, completed=False):
+    def _changed(self):
+        # next() on the counter is atomic, unlike an increment.
+        self._version = next(self._versions)
+
+    def _publishFleet(self, tower_ids=None):
+        """
+        Publish the next version of the fleet, with fresh copies of the
+        towers with tower_ids (or all towers if None) and the copies
+        from the current version for the rest.
+        """
+
+        with self._fleet_lock:
+            current = self._fleet
+            if tower_ids is None:
+                towers = {k: v.freeze() for k, v in self._towers.items()}
+            else:
+                towers = dict(current.towers)
+                for tower_id in tower_ids:
+                    tower = self._towers.get(tower_id)
+                    if tower is None:
+                        towers.pop(tower_id, None)
+                    else:
+                        towers[tower_id] = tower.freeze()
+            self._fleet = FleetSnapshot(current.version + 1, towers)
+
+    def getFleet(self):
+        """
+        Return the current `FleetSnapshot`.  The towers in it are not
+        changed by the writes that follow, which produce a new version.
+        """
+
+        return self._fleet
+
+    def getFleetProjection(self):
+        """
+        Return the `FleetProjection` of the towers of the current
+        `FleetSnapshot`, which is made once per version of the fleet.
+        """
+
+        fleet = self._fleet
+        cached = self._projection
+        if cached is not None and cached[0] == fleet.version:
+            return cached[1]
+        # a race only results in projecting twice.
+        projection = FleetProjection(fleet.towers.values())
+        self._projection = (fleet.version, projection)
+        return projection
+
+    def getDataVersion(self):
+        """
+        Return a number that changes whenever the data in the tracker
+        (towers, fuels, API usage and audits) is changed through this
+        backend.
+        """
+
+        return self._version
+
+    def _logChange(self, session, tower_id, table):
+        change = ChangeLog(tower_id, table)
+        session.add(change)
+        return change
+
+    def _journalChange(self, *entry):
+        if self._journal is None:
+            return
+        try:
+            self._journal.append(entry)
+        except (IOError, OSError):
+            # the change log will have the tower reloaded on restore.
+            logger.exception('Failed to write to journal.')
+
+    def _queryWatermark(self, session):
+        return session.query(func.max(ChangeLog.id)).scalar() or 0
+
+    def _queryApiUsage(self, earliest=False, extrafilters=None,
+            completed=False):
         session = self.session()
-        logs = session.query(ApiUsageLog)
-        logs = logs.order_by(
-            desc(ApiUsageLog.start_ts)).group_by(ApiUsageLog.api_key
-                ).having(gfunc(ApiUsageLog.start_ts))
+        filters = ApiUsageLog.start_ts != None
 
         if completed:
-            logs = logs.filter((ApiUsageLog.end_ts != None) &
-                (ApiUsageLog.state == 0))
+            filters = filters & (ApiUsageLog.end_ts != None) & (
+                ApiUsageLog.state == 0)
 
         if extrafilters is not None:
-            logs = logs.filter(extrafilters)
+            filters = filters & extrafilters
 
+        logs = queryLatest(session, ApiUsageLog, ('api_key',), 'start_ts',
+            filters=filters, earliest=earliest)
         results = {log.api_key: ApiUsage(log.start_ts, log.end_ts, log.state)
             for log in logs}
 
         return results
 
+    def _queryCompletedUsage(self, session, api_key):
+        return session.query(ApiUsageLog).filter(
+            (ApiUsageLog.api_key == api_key) &
+            (ApiUsageLog.state == 0) &
+            (ApiUsageLog.end_ts != None) &
+            (ApiUsageLog.start_ts != None)
+        )
+
+    def _backfillLatestCompletedUsage(self, force=False):
+        """
+        Fill in the latest completed usages from the usage log, for
+        databases created before they were kept.  Only done if there
+        are none unless forced.  Returns the number of usages.
+        """
+
+        session = self.session()
+        if session.query(LatestCompletedUsage).first() is not None:
+            if not force:
+                return 0
+            session.query(LatestCompletedUsage).delete()
+        logs = queryLatest(session, ApiUsageLog, ('api_key',), 'start_ts',
+            filters=(ApiUsageLog.state == 0) & (ApiUsageLog.end_ts != None) &
+                (ApiUsageLog.start_ts != None)).all()
+        for log in logs:
+            session.add(LatestCompletedUsage(log.api_key, log.id,
+                log.start_ts, log.end_ts))
+        session.commit()
+        return len(logs)
+
+    def _updateLatestCompletedUsage(self, session, usage):
+        latest = session.query(LatestCompletedUsage).get(usage.api_key)
+        if usage.state == 0 and usage.start_ts is not None:
+            if latest is None:
+                session.add(LatestCompletedUsage(usage.api_key, usage.id,
+                    usage.start_ts, usage.end_ts))
+            elif usage.id == latest.usage_id or (usage.start_ts,
+                    -usage.id) > (latest.start_ts, -latest.usage_id):
+                latest.usage_id = usage.id
+                latest.start_ts = usage.start_ts
+                latest.end_ts = usage.end_ts
+            return
+
+        if latest is None or latest.usage_id != usage.id:
+            return
+
+        # that usage is no longer completed, go back to the one before.
+        session.flush()
+        previous = self._queryCompletedUsage(session, usage.api_key
+            ).order_by(desc(ApiUsageLog.start_ts), ApiUsageLog.id).first()
+        if previous is None:
+            session.delete(latest)
+        else:
+            latest.usage_id = previous.id
+            latest.start_ts = previous.start_ts
+            latest.end_ts = previous.end_ts
+
     def earliestApiUsage(self, completed=False):
-        return self._queryApiUsage(func.min, completed=completed)
+        return self._queryApiUsage(earliest=True, completed=completed)
 
     def currentApiUsage(self, completed=False, timestamp=None):
         """
@@ -409,6 +979,11 @@ class SQLAlchemyBackend(object):
             filters usage entries up to that timestamp, inclusive.
         """
 
+        if completed and not timestamp:
+            session = self.session()
+            return {r.api_key: ApiUsage(r.start_ts, r.end_ts, 0)
+                for r in session.query(LatestCompletedUsage)}
+
         extrafilters = None
         results = {}
         if timestamp:
@@ -417,7 +992,7 @@ class SQLAlchemyBackend(object):
             results.update(self.earliestApiUsage(completed=completed))
             extrafilters = (ApiUsageLog.start_ts <= timestamp)
         results.update(
-            self._queryApiUsage(func.max, extrafilters, completed=completed))
+            self._queryApiUsage(False, extrafilters, completed=completed))
         return results
 
     def completedApiUsage(self, timestamp=None):
@@ -435,6 +1010,7 @@ class SQLAlchemyBackend(object):
         session.add(usage)
         session.commit()
         session.expunge(usage)
+        self._changed()
         return usage
 
     def endApiUsage(self, usage, state, timestamp=None):
@@ -450,56 +1026,60 @@ class SQLAlchemyBackend(object):
         usage.end_ts = timestamp
         session = self.session()
         session.merge(usage)
+        self._updateLatestCompletedUsage(session, usage)
         session.commit()
+        self._changed()
 
     def getApiTowerIdTimestamp(self, id_, timestamp):
-        # Get the timestamp of the most recent completed usage prior to
-        # timestamp.
-        completed = self.completedApiUsage(timestamp)
-
-        #conditions = []
-        #for k, v in completed.iteritems():
-        #    begin, end, state = v
-        #    # Use that timestamp and find the tower api entry iff it's
-        #    # after that.  This completes the conditional check.
-        #    conditions.append(
-        #        (TowerApi.api_key == k) & (TowerApi.timestamp >= begin))
-
         session = self.session()
         q = session.query(TowerApi).filter(TowerApi.tower_id == id_)
         r = q.one()
-        check = completed.get(r.api_key)
+
+        # Get the most recent completed usage of the api key of this
+        # tower prior to timestamp, or the earliest one if none.
+        completed = self._queryCompletedUsage(session, r.api_key)
+        check = completed.filter(ApiUsageLog.start_ts <= timestamp).order_by(
+            desc(ApiUsageLog.start_ts), ApiUsageLog.id).first()
+        if check is None:
+            check = completed.order_by(ApiUsageLog.start_ts,
+                ApiUsageLog.id).first()
+
         if not check:
             return {}
         if r.timestamp < check.start_ts:
             return {}
         return {r.tower_id: ApiTowerStatus(r.currentTime, r.api_error_count)}
 
-    def getApiTowerIds(self):
-        completed = self.completedApiUsage()
-
-        conditions = []
-        for k, v in completed.iteritems():
-            begin, end, state = v
-            conditions.append(
-                (TowerApi.api_key == k) & (TowerApi.timestamp >= begin))
+    @staticmethod
+    def _queryApiTowerIds(session):
+        # the towers reported since the start of the latest completed
+        # usage of their api key.
+        return session.query(TowerApi.tower_id, TowerApi.currentTime,
+            TowerApi.api_error_count).join(LatestCompletedUsage,
+                LatestCompletedUsage.api_key == TowerApi.api_key).filter(
+                    TowerApi.timestamp >= LatestCompletedUsage.start_ts)
 
+    def getApiTowerIds(self):
         session = self.session()
-        q = session.query(TowerApi.tower_id, TowerApi.currentTime,
-            TowerApi.api_error_count).filter(or_(*conditions))
+        q = self._queryApiTowerIds(session)
         return {i[0]: ApiTowerStatus(i[1], i[2]) for i in q.all()}
 
     def cacheApiTowerIds(self):
         self._api_tower_ids = self.getApiTowerIds()
+        self._changed()
 
     def getTowerApiTimestamp(self, id_, timestamp=None):
         if timestamp is None:
             return self._api_tower_ids.get(id_, None)
-        return self.getApiTowerIdTimestamp(self, id_, timestamp)
+        return self.getApiTowerIdTimestamp(id_, timestamp)
 
-    def reinstantiate(self):
+    def reinstantiate(self, bulk=True):
         """
         Recreate all the objects in the tracker from the database.
+
+        bulk
+            Load the fuels of all towers using a single query, rather
+            than one query per tower.
         """
 
         # TODO ensure that _any_ updates done to towers done to this
@@ -510,7 +1090,10 @@ class SQLAlchemyBackend(object):
         logger.info('Reinstantiation requested.')
         self.cacheApiTowerIds()
         session = self.session()
-        towerq = session.query(Tower)
+        # taken before loading, so changes committed while loading are
+        # picked up again by the next incremental reload.
+        watermark = self._queryWatermark(session)
+        towerq = session.query(*Tower.__table__.c)
         towers = {}
 
         towers_raw = towerq.all()
@@ -518,10 +1101,20 @@ class SQLAlchemyBackend(object):
 
         logger.info('%d towers to reinstantiate.', count)
 
-        for c, tower in enumerate(towers_raw):
+        fuels = None
+        if bulk:
+            fuels = {}
+            for fuel in queryLatestFuels(session).all():
+                fuels.setdefault(fuel.tower_id, []).append(fuel)
+
+        for c, row in enumerate(towers_raw):
             logger.debug('(%d/%d) towers reinstantiated.', c, count)
+            tower = towerFromValues(row)
             tower._initDerived()
-            tower._reloadResources(session)
+            if fuels is None:
+                reloadResources(tower, session)
+            else:
+                reloadResources(tower, session, fuels.get(tower.id, []))
             towers[tower.id] = tower
 
         # detatch all objects loaded with this session.
@@ -529,9 +1122,228 @@ class SQLAlchemyBackend(object):
         session.expunge_all()
 
         self._towers = towers
+        self._index = TowerIndex(towers.values())
+        self._watermark = watermark
+        self._publishFleet()
+        self._changed()
+        self.events.publish('reload', None)
 
         return count
 
+    def reinstantiateChanged(self):
+        """
+        Recreate only the towers changed since the last reinstantiation.
+
+        The changed towers are swapped into the tracker in one step.
+        Does a full `reinstantiate` if that was never done.  Returns the
+        number of towers recreated.
+        """
+
+        if self._watermark is None:
+            return self.reinstantiate()
+
+        logger.info('Incremental reinstantiation requested.')
+        session = self.session()
+        watermark = self._queryWatermark(session)
+        tower_ids = sorted(set(r.tower_id for r in session.query(
+            ChangeLog.tower_id).filter(ChangeLog.id > self._watermark).filter(
+                ChangeLog.id <= watermark).distinct()))
+
+        count = len(tower_ids)
+        logger.info('%d towers changed since change %d.', count,
+            self._watermark)
+
+        if not tower_ids:
+            self._watermark = watermark
+            return 0
+
+        self.cacheApiTowerIds()
+        changed = self._loadTowers(session, tower_ids)
+
+        towers = dict(self._towers)
+        towers.update(changed)
+        for tower_id, tower in changed.iteritems():
+            # the changed tower may have moved.
+            previous = self._towers.get(tower_id)
+            if previous is not None:
+                self._index.remove(previous)
+            self._index.add(tower)
+        self._towers = towers
+        self._watermark = watermark
+        self._publishFleet(changed)
+        self._changed()
+        for tower_id in sorted(changed):
+            self.events.publish('reload', tower_id)
+
+        logger.info('(%d/%d) towers reinstantiated.', len(changed), count)
+        return len(changed)
+
+    def _loadTowers(self, session, tower_ids):
+        """
+        Load the towers with the tower_ids from the database, returning
+        them in a dict keyed by id.
+        """
+
+        result = {}
+        # keep the number of bound parameters within the database limits.
+        for i in xrange(0, len(tower_ids), self.in_clause_limit):
+            ids = tower_ids[i:i + self.in_clause_limit]
+            fuels = {}
+            for fuel in queryLatestFuels(session, tower_ids=ids).all():
+                fuels.setdefault(fuel.tower_id, []).append(fuel)
+
+            for row in session.query(*Tower.__table__.c).filter(
+                    Tower.id.in_(ids)):
+                tower = towerFromValues(row)
+                tower._initDerived()
+                reloadResources(tower, session, fuels.get(tower.id, []))
+                result[tower.id] = tower
+
+        session.expunge_all()
+        return result
+
+    def _snapshotVersion(self):
+        return (snapshot.SNAPSHOT_VERSION, tuple(Tower.__table__.c.keys()))
+
+    def saveSnapshot(self):
+        """
+        Write the current towers into the snapshot file and start a new
+        journal.  Returns True if written.
+        """
+
+        if not self._snapshot_path or self._watermark is None:
+            return False
+
+        records = [(tuple(towerValues(tower)),) + tower.getSnapshotState()
+            for tower in self._towers.values()]
+        snapshot.dumpSnapshot(self._snapshot_path, self._snapshotVersion(),
+            self._watermark, records)
+        # everything journaled is in the snapshot.
+        self._journal.truncate()
+        logger.info('Snapshot of %d towers at change %d written to `%s`.',
+            len(records), self._watermark, self._snapshot_path)
+        return True
+
+    def _restoreTower(self, columns, derived, fuels):
+        tower = towerFromValues(columns)
+        tower.restoreSnapshotState(derived, fuels)
+        return tower
+
+    def _refreezeFuels(self, tower):
+        """
+        Rebuild the fuel buffers of the tower for its current state.
+
+        The fuels of a change of state are journaled before the tower,
+        so their buffers are rebuilt while the tower still has the
+        previous state, which decides whether a buffer is frozen.
+        """
+
+        for k, fuel in tower.fuels.items():
+            if fuel is None:
+                continue
+            tower.fuels[k] = pos.TowerResourceBuffer(tower=tower,
+                delta=fuel.delta, timestamp=fuel.timestamp,
+                expiry=fuel.expiry, value=fuel.value,
+                resourceType=fuel.resourceType)
+        tower._invalidateDerived()
+
+    def _replayJournal(self, towers, watermark):
+        """
+        Apply the journal entries after watermark onto towers, returning
+        the change sequences that got applied.
+        """
+
+        columns = Tower.__table__.c.keys()
+        applied = set()
+
+        for entry in self._journal.entries(watermark):
+            kind, seq, tower_id = entry[:3]
+            tower = towers.get(tower_id)
+            if tower is None:
+                continue
+
+            if kind == 'tower':
+                state = tower.state
+                for k, v in zip(columns, entry[3]):
+                    setattr(tower, k, v)
+                tower._setStateTimestamp(tower.stateTimestamp)
+                tower.allianceID = tower.queryAllianceID()
+                if tower.state != state:
+                    self._refreezeFuels(tower)
+            elif kind == 'fuel':
+                (fuelTypeID, delta, timestamp, value, purpose,
+                    resourceTypeName, unitVolume) = entry[3:]
+                tower.fuels[fuelTypeID] = pos.TowerResourceBuffer(
+                    tower=tower, delta=delta, timestamp=timestamp,
+                    purpose=purpose, value=value,
+                    resourceTypeName=resourceTypeName, unitVolume=unitVolume)
+                tower._invalidateDerived()
+            else:
+                continue
+
+            applied.add(seq)
+
+        return applied
+
+    def restore(self):
+        """
+        Restore the towers from the snapshot and the journal, then
+        reload from the database the towers with changes that were not
+        journaled.
+
+        Returns the number of towers restored, or None if there is no
+        usable snapshot and `reinstantiate` should be used instead.
+        """
+
+        if not self._snapshot_path:
+            return None
+
+        version = self._snapshotVersion()
+        try:
+            data = snapshot.loadSnapshot(self._snapshot_path, version)
+        except snapshot.SnapshotVersionError as e:
+            logger.warning('Snapshot not restored: %s', e)
+            return None
+        except Exception:
+            logger.exception('Snapshot `%s` could not be read.',
+                self._snapshot_path)
+            return None
+
+        if data is None:
+            logger.info('No snapshot at `%s`.', self._snapshot_path)
+            return None
+
+        watermark, records = data
+        logger.info('Restoring %d towers from snapshot at change %d.',
+            len(records), watermark)
+
+        towers = {}
+        for record in records:
+            tower = self._restoreTower(*record)
+            towers[tower.id] = tower
+
+        applied = self._replayJournal(towers, watermark)
+
+        session = self.session()
+        current = self._queryWatermark(session)
+        stale = sorted(set(r.tower_id for r in session.query(
+            ChangeLog.id, ChangeLog.tower_id).filter(
+                ChangeLog.id > watermark).filter(ChangeLog.id <= current)
+            if r.id not in applied))
+
+        logger.info('%d journal entries replayed, %d towers to reload.',
+            len(applied), len(stale))
+        towers.update(self._loadTowers(session, stale))
+
+        self.cacheApiTowerIds()
+        self._towers = towers
+        self._index = TowerIndex(towers.values())
+        self._watermark = current
+        self._publishFleet()
+        self._changed()
+
+        return len(towers)
+
     def _queryTower(self, session, itemID, moonID):
         # see if we already have this tower_id registered.
         q = session.query(Tower).filter(
@@ -565,45 +1377,84 @@ class SQLAlchemyBackend(object):
         # be maintained separately from it.  For now this will do for a
         # basic demo of just the fuel tracking.
 
-        session = self.session()
         # 2 is the positional argument for moonID in `Tower`
         moonID = kw.get('moonID', *a[2:3])
 
         if itemID:
             # XXX the check should include rest of the fields.
+            tower = self._towers.get(self._index.get(itemID, moonID))
+            if tower is not None:
+                return tower
+
+        session = self.session()
+        if itemID:
+            # not one of the towers loaded, but could have been added
+            # to the database since.
             result = self._queryTower(session, itemID, moonID)
             if result:
                 return self._towers[result.id]
 
-        tower = Tower(itemID, *a, **kw)
-        session.add(tower)
+        tower = pos.Tower(itemID, *a, **kw)
+        row = Tower(**dict(zip(Tower.__table__.c.keys(), towerValues(tower))))
+        session.add(row)
+        session.flush()
+        tower.id = row.id
+        self._logChange(session, tower.id, Tower.__tablename__)
         session.commit()
 
         self._towers[tower.id] = tower
-        session.expunge(tower)
+        self._index.add(tower)
+        session.expunge(row)
+        self._publishFleet([tower.id])
+        self._changed()
+        self.events.publish('added', tower.id)
 
         return tower
 
-    def getFuelLog(self, tower_id, count=None):
+    @staticmethod
+    def _queryFuelLog(session, tower_id, count=None, after=None):
+        return queryPage(session.query(Fuel).filter(
+            Fuel.tower_id == tower_id), Fuel, count, after)
+
+    def getFuelLog(self, tower_id, count=None, after=None):
         """
-        Return the fuel logs for tower_id
+        Return the fuel logs for tower_id, latest first.
+
+        count
+            amount to return, all if not specified.
+        after
+            the `pageCursor` of the last log of the previous page.
         """
 
         session = self.session()
-        q = session.query(Fuel).filter(Fuel.tower_id == tower_id).order_by(
-            desc(Fuel.timestamp), desc(Fuel.id))
-        if count:
-            q = q.limit(count)
-        result = q.all()
+        result = self._queryFuelLog(session, tower_id, count, after).all()
         session.expunge_all()
         return result
 
+    def iterFuelLog(self, tower_id, size=100):
+        """
+        Iterate through all the fuel logs for tower_id, latest first,
+        getting them size at a time.
+        """
+
+        return self._iterPages(self.getFuelLog, size, tower_id)
+
+    def _iterPages(self, getPage, size, *a):
+        after = None
+        while True:
+            page = getPage(*a, count=size, after=after)
+            for row in page:
+                yield row
+            if len(page) < size:
+                return
+            after = pageCursor(page[-1])
+
     def getTower(self, tower_id, default=_marker):
         """
-        Return a copy of the tower at its current state.
+        Return the tower, which is the object the changes are made
+        through.  For a copy that won't change use `getFleet`.
         """
 
-        # XXX not actually a copy yet.
         if default is not _marker:
             return self._towers.get(tower_id, default)
         return self._towers[tower_id]
@@ -611,77 +1462,247 @@ class SQLAlchemyBackend(object):
     def getTowerIds(self):
         return self._towers.keys()
 
-    def getTowerLog(self, tower_id, count=None):
+    def findTowerIds(self, key, value):
+        """
+        Return the ids of the towers with the value for key, which is
+        one of `TowerIndex.keys`, e.g. locationID or regionName.
+        """
+
+        return self._index.find(key, value)
+
+    def getDerivedCacheStats(self):
         """
-        Return the tower logs for tower_id
+        Return the derived value cache hit and miss counts summed over
+        all the towers.
+        """
+
+        result = {'hits': 0, 'misses': 0}
+        for tower in self._towers.values():
+            for k, v in tower.getDerivedCacheStats().iteritems():
+                result[k] += v
+        return result
+
+    @staticmethod
+    def _queryTowerLog(session, tower_id, count=None, after=None):
+        return queryPage(session.query(TowerLog).filter(
+            TowerLog.tower_id == tower_id), TowerLog, count, after)
+
+    def getTowerLog(self, tower_id, count=None, after=None):
+        """
+        Return the tower logs for tower_id, latest stateTimestamp first.
+
+        count
+            amount to return, all if not specified.
+        after
+            the `pageCursor` of the last log of the previous page.
         """
 
         session = self.session()
-        q = session.query(TowerLog).filter(TowerLog.tower_id == tower_id
-            ).order_by(desc(TowerLog.stateTimestamp))
-        if count:
-            q = q.limit(count)
-        result = q.all()
+        result = self._queryTowerLog(session, tower_id, count, after).all()
         session.expunge_all()
         return result
 
-    def updateTower(self, tower):
+    def iterTowerLog(self, tower_id, size=100):
+        """
+        Iterate through all the tower logs for tower_id, latest
+        stateTimestamp first, getting them size at a time.
         """
-        Update this tower.
 
-        Returns True if updated, False otherwise.
+        return self._iterPages(self.getTowerLog, size, tower_id)
+
+    def _pendingWrites(self):
+        return getattr(self._local, 'pending', None)
+
+    @contextlib.contextmanager
+    def batch(self):
         """
+        Collect the writes done by `updateTower`, `addFuel` and
+        `setTowerApi` within this context in the current thread, and
+        write them in a single transaction on exit.
 
-        # TODO proper error/exception handling.
-        session = self.session()
+        Nested batches are written by the outermost one.
+        """
+
+        if self._pendingWrites() is not None:
+            yield
+            return
 
-        session.add(tower)
+        pending = self._local.pending = []
+        try:
+            yield
+        finally:
+            self._local.pending = None
+            self._writePending(pending)
+
+    def _write(self, *item):
+        pending = self._pendingWrites()
+        if pending is None:
+            self._writePending([item])
+        else:
+            pending.append(item)
+
+    def _writePending(self, pending):
+        """
+        Write the pending items in a single transaction.
+        """
+
+        if not pending:
+            return
 
-        tower_attrs = [getattr(tower, c) for c in tower.__table__.c.keys()]
-        tower_log = TowerLog(*tower_attrs)
-        session.add(tower_log)
+        session = self.session()
+        towers = {}
+        tower_apis = {}
+        journal = []
+        changed = {}
+
+        for item in pending:
+            kind = item[0]
+            if kind == 'tower':
+                tower, tower_attrs = item[1:]
+                towers[tower.id] = tower
+                session.add(TowerLog(*tower_attrs))
+                changed.setdefault(tower.id, set()).add(kind)
+                change = self._logChange(session, tower.id, kind)
+                journal.append((kind, change, tower.id, tuple(tower_attrs)))
+            elif kind == 'fuel':
+                fuel, extra = item[1:]
+                session.add(fuel)
+                changed.setdefault(fuel.tower_id, set()).add(kind)
+                change = self._logChange(session, fuel.tower_id, kind)
+                journal.append((kind, change, fuel.tower_id, fuel.fuelTypeID,
+                    fuel.delta, fuel.timestamp, fuel.value) + extra)
+            elif kind == 'tower_api':
+                tower_id = item[1]
+                tower_apis.setdefault(tower_id, []).append(item[2:])
+                self._logChange(session, tower_id, kind)
+
+        # only the final state of the towers need to be written.
+        if towers:
+            table = Tower.__table__
+            session.execute(table.update().where(
+                    table.c.id == sqlalchemy.bindparam('_id')),
+                [dict(zip(table.c.keys(), towerValues(tower)), _id=tower.id)
+                    for tower in towers.values()])
+
+        self._mergeTowerApis(session, tower_apis)
 
         session.commit()
-        session.expunge(tower)
+        session.expunge_all()
+        self._publishFleet(changed)
+        self._changed()
+
+        for entry in journal:
+            self._journalChange(entry[0], entry[1].id, *entry[2:])
+
+        for tower_id, kinds in sorted(changed.items()):
+            tower = self._towers.get(tower_id)
+            self.events.publish('update', tower_id, changes=sorted(kinds),
+                state=getattr(tower, 'state', None),
+                stateTimestamp=getattr(tower, 'stateTimestamp', None))
+
+    def _mergeTowerApis(self, session, tower_apis):
+        # the existing rows are loaded with an IN query per chunk of ids,
+        # rather than a query per `session.merge`, and all written by the
+        # one flush of the commit.
+        tower_ids = sorted(tower_apis)
+        existing = {}
+        for i in xrange(0, len(tower_ids), self.in_clause_limit):
+            ids = tower_ids[i:i + self.in_clause_limit]
+            existing.update((row.tower_id, row) for row in session.query(
+                TowerApi).filter(TowerApi.tower_id.in_(ids)))
+
+        columns = TowerApi.__table__.c.keys()
+        for tower_id, calls in tower_apis.iteritems():
+            row = existing.get(tower_id)
+            api_error_count = row is not None and row.api_error_count or 0
+            for (api_key, currentTime, timestamp, api_error, digest,
+                    cachedUntil) in calls:
+                # increment on errors, otherwise reset.
+                api_error_count = api_error and api_error_count + 1 or 0
+            tower_api = TowerApi(tower_id, api_key, currentTime, timestamp,
+                api_error_count, digest, cachedUntil)
+            if row is None:
+                session.add(tower_api)
+                continue
+            for key in columns:
+                setattr(row, key, getattr(tower_api, key))
+
+    def updateTower(self, tower):
+        """
+        Update this tower.
+
+        Returns True if updated, False otherwise.
+        """
 
+        # TODO proper error/exception handling.
+        tower_attrs = towerValues(tower)
+        self._write(Tower.__tablename__, tower, tower_attrs)
         return True
 
     def addFuel(self, tower=None, fuelTypeID=None, delta=None, timestamp=None,
             value=None, *a, **kw):
+        """
+        Add a fuel entry for tower.  Within a `batch` the returned fuel
+        will only be written on exit.
+        """
 
-        tower_id = tower.id
-        fuel = Fuel(tower_id, fuelTypeID, delta, timestamp, value)
-
-        session = self.session()
-        session.add(fuel)
-        session.commit()
-
+        fuel = Fuel(tower.id, fuelTypeID, delta, timestamp, value)
+        self._write(Fuel.__tablename__, fuel, (kw.get('purpose'),
+            kw.get('resourceTypeName'), kw.get('unitVolume')))
         return fuel
 
     def setTowerApi(self, tower_id, api_key, currentTime, timestamp=None,
-            api_error=False):
+            api_error=False, digest=None, cachedUntil=None):
         """
-        Sets the tower API.
+        Sets the tower API, along with the digest and the cachedUntil of
+        the starbase details processed.
         """
 
         # don't trigger autoincrement.
         assert tower_id is not None
-        session = self.session()
+        if timestamp is None:
+            timestamp = int(time())
+        self._write(TowerApi.__tablename__, tower_id, api_key, currentTime,
+            timestamp, api_error, digest, cachedUntil)
 
-        api_error_count = 0
-        if api_error:
-            q = session.query(TowerApi).filter_by(tower_id=tower_id)
-            current_tower_api = q.first()
-            if current_tower_api:
-                api_error_count = current_tower_api.api_error_count
+    def getTowerApiDigests(self, itemIDs=None):
+        """
+        Return the digests of the last processed starbase details, by
+        tower id.  Only for the towers with itemIDs, if specified.
+        """
+
+        session = self.session()
+        q = session.query(TowerApi.tower_id, TowerApi.digest).filter(
+            TowerApi.digest != None)
+        if itemIDs is None:
+            result = dict(q.all())
+        else:
+            result = {}
+            itemIDs = sorted(itemIDs)
+            q = q.join(Tower, Tower.id == TowerApi.tower_id)
+            for i in xrange(0, len(itemIDs), self.in_clause_limit):
+                ids = itemIDs[i:i + self.in_clause_limit]
+                result.update(q.filter(Tower.itemID.in_(ids)))
+        session.close()
+        return result
 
-            # increment.
-            api_error_count += 1
+    def getCachedTowerApis(self, api_key, timestamp):
+        """
+        Return the tower APIs of api_key with starbase details still
+        cached at timestamp, by the (itemID, moonID) of their tower.
+        """
 
-        tower_api = TowerApi(tower_id, api_key, currentTime, timestamp,
-            api_error_count)
-        session.merge(tower_api)
-        session.commit()
+        session = self.session()
+        q = session.query(Tower.itemID, Tower.moonID, TowerApi).filter(
+            Tower.id == TowerApi.tower_id,
+            TowerApi.api_key == api_key,
+            TowerApi.cachedUntil > timestamp,
+            TowerApi.api_error_count == 0,
+        )
+        result = {(itemID, moonID): tower_api
+            for itemID, moonID, tower_api in q.all()}
+        session.expunge_all()
+        return result
 
     def getTowerApis(self, api_key=None):
         # TODO implement filters.
@@ -721,11 +1742,69 @@ class SQLAlchemyBackend(object):
         table = obj.__table__.name
         rowid = obj.id
 
+        try:
+            self._addAudit(table, rowid, reason, user, category, timestamp)
+        except IntegrityError:
+            # another writer (e.g. `ctrl` next to the server) added the
+            # latest audit after it was looked up, so it is there to be
+            # updated the second time.
+            self._addAudit(table, rowid, reason, user, category, timestamp)
+        self._changed()
+
+    def _addAudit(self, table, rowid, reason, user, category, timestamp):
         audit = Audit(table, rowid, reason, user, category, timestamp)
 
         session = self.session()
-        session.add(audit)
+        try:
+            session.add(audit)
+            session.flush()
+            latest = session.query(LatestAudit).get(
+                (table, rowid, audit.category_name))
+            if latest is None:
+                session.add(LatestAudit(table, rowid, audit.category_name,
+                    audit.id, audit.timestamp))
+            elif audit.timestamp > latest.timestamp:
+                latest.audit_id = audit.id
+                latest.timestamp = audit.timestamp
+            session.commit()
+        except:
+            session.rollback()
+            raise
+
+    def _backfillLatestAudit(self, force=False):
+        """
+        Fill in the latest audits from the audit table, for databases
+        created before they were kept.  Only done if there are none
+        unless forced.  Returns the number of latest audits.
+        """
+
+        session = self.session()
+        if session.query(LatestAudit).first() is not None:
+            if not force:
+                return 0
+            session.query(LatestAudit).delete()
+        audits = queryLatest(session, Audit,
+            ('table', 'rowid', 'category_name'), 'timestamp').all()
+        for audit in audits:
+            session.add(LatestAudit(audit.table, audit.rowid,
+                audit.category_name, audit.id, audit.timestamp))
         session.commit()
+        return len(audits)
+
+    def backfill(self):
+        """
+        Rebuild the tables kept for the latest entries of the logs,
+        i.e. the latest completed API usages and the latest audits,
+        from the logs.  Returns the number of rows of each as a dict.
+        """
+
+        result = {
+            'latest_completed_usage': self._backfillLatestCompletedUsage(
+                force=True),
+            'latest_audit': self._backfillLatestAudit(force=True),
+        }
+        self._changed()
+        return result
 
     def getAuditCategories(self, table):
         """
@@ -739,6 +1818,15 @@ class SQLAlchemyBackend(object):
         session.expunge_all()
         return result
 
+    @staticmethod
+    def _queryAuditForTable(session, table, category=None):
+        condition = LatestAudit.table == table
+        if category is not None:
+            condition = condition & (LatestAudit.category_name == category)
+        return session.query(Audit).join(LatestAudit,
+            LatestAudit.audit_id == Audit.id).filter(condition).order_by(
+                LatestAudit.category_name)
+
     def getAuditForTable(self, table, category=None):
         """
         Get audit entries for a table.  Only the latest entries per 
@@ -746,13 +1834,7 @@ class SQLAlchemyBackend(object):
         """
 
         session = self.session()
-        condition = Audit.table == table
-        if category is not None:
-            condition = condition & (Audit.category_name == category)
-        q = session.query(Audit).filter(condition).group_by(
-            Audit.category_name, Audit.rowid).having(
-            func.max(Audit.timestamp)).order_by(Audit.category_name)
-        audits = q.all()
+        audits = self._queryAuditForTable(session, table, category).all()
         session.expunge_all()
         result = {}
         for audit in audits:
@@ -761,33 +1843,53 @@ class SQLAlchemyBackend(object):
             result[audit.rowid].append(audit)
         return result
 
-    def getAuditEntriesRecent(self, count=50):
+    def getAuditEntriesRecent(self, count=50, after=None):
         """
         Get the most recent audit entries.
 
         count
             amount to return, defaults to 50.
+        after
+            the `pageCursor` of the last entry of the previous page.
         """
 
         session = self.session()
-        q = session.query(Audit).order_by(desc(Audit.timestamp)).limit(count)
-        audits = q.all()
+        audits = queryPage(session.query(Audit), Audit, count, after).all()
         session.expunge_all()
         return audits
 
-    def getAuditEntriesFor(self, table, rowid):
+    @staticmethod
+    def _queryAuditEntriesFor(session, table, rowid, count=None,
+            after=None):
+        return queryPage(session.query(Audit).filter(
+            (Audit.table == table) & (Audit.rowid == rowid)), Audit,
+            count, after)
+
+    def getAuditEntriesFor(self, table, rowid, count=None, after=None):
         """
         Get ungrouped audit entries for a table and rowid.  Sorted by 
         timestamp for all entries.
+
+        count
+            amount to return, all if not specified.
+        after
+            the `pageCursor` of the last entry of the previous page.
         """
 
         session = self.session()
-        q = session.query(Audit).filter((Audit.table == table) &
-            (Audit.rowid == rowid)).order_by(desc(Audit.timestamp))
-        audits = q.all()
+        audits = self._queryAuditEntriesFor(session, table, rowid, count,
+            after).all()
         session.expunge_all()
         return audits
 
+    def iterAuditEntriesFor(self, table, rowid, size=100):
+        """
+        Iterate through all the audit entries for a table and rowid,
+        latest first, getting them size at a time.
+        """
+
+        return self._iterPages(self.getAuditEntriesFor, size, table, rowid)
+
     def getAuditEntry(self, table, rowid):
         """
         Get audit entries for a table and rowid.  Sorted by timestamp
@@ -827,6 +1929,67 @@ class SQLAlchemyBackend(object):
         session.commit()
 
 
+def createSchema(engine):
+    """
+    Create the tables of a new database, recorded as being at the
+    current schema version as they have the changes of every migration.
+    """
+
+    Base.metadata.create_all(engine)
+    migration.stamp(engine, Base.metadata, migration.SCHEMA_VERSION,
+        'Created')
+
+
+def migrateSchema(engine):
+    """
+    Bring the schema of the database up to date, creating it if new.
+    Return the (version, description) of the migrations applied.
+    """
+
+    if not Inspector.from_engine(engine).get_table_names():
+        createSchema(engine)
+        return []
+    # the tables added since the database was created, as the later
+    # migrations may change them.
+    Base.metadata.create_all(engine)
+    return migration.migrate(engine, Base.metadata)
+
+
+def hotQueries(session):
+    """
+    Return the (name, query) of the queries run the most often, for
+    checking their query plans.
+    """
+
+    backend = SQLAlchemyBackend
+    return [
+        ('tower by itemID and moonID', session.query(Tower).filter(
+            (Tower.itemID == 0) & (Tower.moonID == 0))),
+        ('latest fuels of a tower', queryLatestFuels(session, 1)),
+        ('fuel log', backend._queryFuelLog(session, 1)),
+        ('tower log', backend._queryTowerLog(session, 1)),
+        ('api tower ids', backend._queryApiTowerIds(session)),
+        ('latest audits of a table',
+            backend._queryAuditForTable(session, 'tower')),
+        ('audits of a row',
+            backend._queryAuditEntriesFor(session, 'tower', 1)),
+        ('page of a fuel log', backend._queryFuelLog(session, 1, 50,
+            '1325376000.1')),
+        ('page of a tower log', backend._queryTowerLog(session, 1, 50,
+            '1325376000.1')),
+    ]
+
+
+def explainHotQueries(engine):
+    """
+    Return the (name, query plan rows) of the `hotQueries`.
+    """
+
+    session = sessionmaker(bind=engine)()
+    return [(name, migration.explain(engine, query))
+        for name, query in hotQueries(session)]
+
+
 @zope.interface.implementer(ISQLAPIKeyManager)
 class SQLAPIKeyManager(object):
 
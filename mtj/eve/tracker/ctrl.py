@@ -99,7 +99,10 @@ class Options(object):
         },
         'mtj.eve.tracker.runner.FlaskRunner': {
             'json_prefix': None,
-            'admin_key': None
+            'admin_key': None,
+            'import_scheduler': True,
+            'response_cache_max_age': 60,
+            'executor_workers': 4,
         },
     }
 
@@ -153,6 +156,9 @@ class Options(object):
         'mtj.eve.tracker.runner.FlaskRunner': {
             'json_prefix': basestring,
             'admin_key': basestring,
+            'import_scheduler': bool,
+            'response_cache_max_age': int,
+            'executor_workers': int,
         },
     }
 
@@ -395,11 +401,23 @@ class TrackerCmd(cmd.Cmd):
         self.run(options.config)
 
     def do_import(self, arg):
+        """
+        import from the API, optionally notify the instance at the url
+        provided of the update.  That instance will only reload the
+        towers that were changed unless --full is specified before the
+        url.
+        """
+
         # local foreground options.
         # XXX this needs DRYing...
         options = self.options.__class__()
         options.update(self.options.config)
 
+        full = False
+        if arg.startswith('--full'):
+            full = True
+            arg = arg[len('--full'):].strip()
+
         if arg:
             print('Notice: `%s` will be notified of update.' % arg)
 
@@ -415,8 +433,65 @@ class TrackerCmd(cmd.Cmd):
 
         if arg:
             p = options.config['mtj.eve.tracker.runner.FlaskRunner']
-            print(requests.post(arg, data='{"key": "%(admin_key)s"}' % p
-                ).content)
+            data = {'key': p['admin_key'], 'incremental': not full}
+            print(requests.post(arg, data=json.dumps(data)).content)
+
+    def do_backfill(self, arg):
+        """
+        rebuild the tables of the latest API usages and audits from
+        their logs, for databases created before these were kept.
+        """
+
+        # local foreground options.
+        options = self.options.__class__()
+        options.update(self.options.config)
+
+        runner = self.runner_factory()
+        runner.configure(config=options.config)
+        runner.initialize()
+
+        import zope.component
+        from mtj.eve.tracker import interfaces
+        backend = zope.component.getUtility(interfaces.ITrackerBackend)
+        for table, count in sorted(backend.backfill().items()):
+            print('%s: %d rows' % (table, count))
+
+    def do_migrate(self, arg):
+        """
+        apply the schema migrations missing from the database, then
+        print the query plans of the frequent queries.  With --check
+        only the schema version and the query plans are printed, and the
+        database is left as is.
+        """
+
+        # the backend refuses to start with an outdated schema, so the
+        # database is opened directly.
+        from sqlalchemy import create_engine
+        from mtj.eve.tracker.backend import migration
+        from mtj.eve.tracker.backend import sql
+
+        spec = self.options.config['implementations']['ITrackerBackend']
+        src = spec['kwargs'].get('src', spec['args'] and spec['args'][0])
+        if not src:
+            print('No database is configured for the backend.')
+            return
+        engine = create_engine(src)
+
+        if not arg.startswith('--check'):
+            for version, description in sql.migrateSchema(engine):
+                print('Migrated to version %d: %s' % (version, description))
+        version = migration.getVersion(engine, sql.Base.metadata)
+        print('Schema version: %d' % version)
+        if version < migration.SCHEMA_VERSION:
+            print('%d migrations to apply.' % len([m for m in
+                migration.MIGRATIONS if m[0] > version]))
+            return
+
+        for name, plan in sql.explainHotQueries(engine):
+            print('')
+            print('%s:' % name)
+            for row in plan:
+                print('    ' + ' '.join(str(c) for c in row))
 
     def do_debug(self, arg):
         """
@@ -520,12 +595,21 @@ def get_argparsers():
     sp_fg = sp.add_parser(r'fg', help='Run %(prog)s in foreground')
     sp_import = sp.add_parser(r'import', help='Imports API data')
     sp_debug = sp.add_parser(r'debug', help='Open a debug python shell')
+    sp_backfill = sp.add_parser(r'backfill',
+        help='Rebuild the tables of the latest API usages and audits')
+    sp_migrate = sp.add_parser(r'migrate',
+        help='Update the database schema and show the query plans')
     sp_console = sp.add_parser(r'console', help='Console mode (default)')
 
     sp_import.add_argument('--update', '-u', dest='cmdarg', required=False,
         help='After API update, send a reload request to a running instance. '
              'optionally specify the target.',
         default='', nargs='?')
+    sp_import.add_argument('--full', dest='full', action='store_true',
+        help='Request a full reload rather than only the changed towers.')
+
+    sp_migrate.add_argument('--check', dest='check', action='store_true',
+        help='Only show the schema version and the query plans.')
 
     return parser, sp
 
@@ -560,6 +644,10 @@ def main(args=None, options=None, app=None, runner_factory=None,
             p.update(c.options.config['mtj.eve.tracker.runner.FlaskRunner'])
             p.update(c.options.config['flask'])
             cmdarg = 'http://%(host)s:%(port)s%(json_prefix)s/reload' % p
+        if getattr(parsed_args, 'full', False):
+            cmdarg = '--full ' + cmdarg
+        if getattr(parsed_args, 'check', False):
+            cmdarg = '--check'
         return c.onecmd(parsed_args.command + ' ' + cmdarg)
     else:  # interactive mode
         try:
@@ -8,6 +8,8 @@ as optional and provides an object for use.
 from __future__ import absolute_import
 
 import itertools
+import sqlite3
+import threading
 from time import time
 from xml.etree import ElementTree
 
@@ -84,16 +86,36 @@ class EvelinkSqliteCache(SqliteCache):
 
     max_error_cache_duration = 3540  # an hour less one minute
 
+    def __init__(self, path):
+        super(EvelinkSqliteCache, self).__init__(path)
+        # The tower manager fetches from multiple threads, so replace
+        # the connection with one that can be shared between them, with
+        # access serialized by the lock.
+        self._lock = threading.RLock()
+        connection = self.connection
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path == ':memory:':
+            # a new database, so the tables need to be created again.
+            for sql, in connection.execute('SELECT sql FROM sqlite_master '
+                    'WHERE type = "table" AND sql IS NOT NULL'):
+                self.connection.execute(sql)
+        connection.close()
+
+    def get(self, key):
+        with self._lock:
+            return super(EvelinkSqliteCache, self).get(key)
+
     def put(self, key, value, duration):
         try:
             tree = ElementTree.fromstring(value)
         except ElementTree.ParseError:
             # Let this continue without issues.
-            return super(EvelinkSqliteCache, self).put(key, value, duration)
+            tree = None
 
-        if tree.find('error') is not None:
+        if tree is not None and tree.find('error') is not None:
             duration = min(duration, self.max_error_cache_duration)
-        return super(EvelinkSqliteCache, self).put(key, value, duration)
+        with self._lock:
+            return super(EvelinkSqliteCache, self).put(key, value, duration)
 
 
 @zope.interface.implementer(IAPIHelper)
@@ -0,0 +1,229 @@
+"""
+Tower change events.
+
+Events are kept in a bounded log so clients that reconnect can resume
+from the last event they have received, through the id of that event.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from mtj.eve.tracker.pos import SECONDS_PER_HOUR, STATE_ONLINE
+
+logger = logging.getLogger('mtj.eve.tracker.events')
+
+Event = namedtuple('Event', ['id', 'kind', 'tower_id', 'timestamp', 'data'])
+
+
+def towerBoundary(tower, timestamp):
+    """
+    Return the earliest time after timestamp where the state of the
+    tower changes on its own, i.e. a resource pulse, going offline or
+    the end of reinforcement.  None if there is no such time.
+    """
+
+    offline = tower.getOfflineTimestamp()
+    candidates = [offline, tower.stateTimestamp]
+    if offline and offline > timestamp:
+        # the resources are consumed on the next pulse.
+        candidates.append(timestamp + 1 + (
+            (tower.resourcePulse or 0) - timestamp - 1) % SECONDS_PER_HOUR)
+    candidates = [ts for ts in candidates if ts and ts > timestamp]
+    return candidates and min(candidates) or None
+
+
+class EventLog(object):
+    """
+    The log of the latest events, which notifies the subscribers of new
+    events as they are published.
+
+    The event ids are prefixed by the time the log was created, so the
+    ids handed out by a previous process are not mistaken for current
+    ones.
+    """
+
+    def __init__(self, size=1000, clock=time.time):
+        self.clock = clock
+        self.epoch = int(clock())
+        self._seq = 0
+        self._events = deque(maxlen=size)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, kind, tower_id, **data):
+        with self._lock:
+            self._seq += 1
+            event = Event('%d-%d' % (self.epoch, self._seq), kind, tower_id,
+                int(self.clock()), data)
+            self._events.append((self._seq, event))
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception:
+                logger.exception('Event subscriber failed')
+        return event
+
+    def _parseId(self, event_id):
+        try:
+            epoch, seq = event_id.split('-')
+            epoch, seq = int(epoch), int(seq)
+        except (AttributeError, ValueError):
+            return None
+        if epoch != self.epoch:
+            return None
+        return seq
+
+    def since(self, event_id=None):
+        """
+        Return the events after the one with event_id, or None if they
+        are no longer available (or the id is not from this log), in
+        which case the client has to reload.  All available events are
+        returned if event_id is None.
+        """
+
+        seq = 0
+        if event_id is not None:
+            seq = self._parseId(event_id)
+            if seq is None:
+                return None
+
+        with self._lock:
+            if seq > self._seq:
+                return None
+            if self._events and seq < self._events[0][0] - 1:
+                # some of the events were dropped.
+                return None
+            return [event for s, event in self._events if s > seq]
+
+    def subscribe(self, subscriber):
+        """
+        Call subscriber with every event published from now on, in the
+        thread that publishes it.
+        """
+
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+
+class BoundaryWatcher(object):
+    """
+    Publishes the events that are not caused by writes, but happen as
+    time passes: the resource pulses and the state changes of the
+    towers of the backend, such as going offline or coming out of
+    reinforcement.
+
+    The next boundary of every tower (see `towerBoundary`) is kept in a
+    heap, so a check only looks at the towers that are due.  As writes
+    may move the boundaries, the heap is rebuilt once the data version
+    of the backend changes.
+    """
+
+    # the kinds of the events published for the writes to the backend.
+    writes = ('update', 'added', 'reload')
+
+    def __init__(self, backend, events):
+        self.backend = backend
+        self.events = events
+        self._states = {}
+        self._last = None
+        self._heap = []
+        self._version = None
+
+    def written(self, event):
+        """
+        Take in the changes of state made by the write of the event, as
+        of the last check, so they are not published again as `check`
+        only publishes the changes caused by the passing of time.
+        """
+
+        if event.kind not in self.writes or self._last is None:
+            return
+
+        towers = self.backend.getFleet().towers
+        if event.tower_id is None:
+            self._states = {k: v.getState(self._last)
+                for k, v in towers.iteritems()}
+            return
+
+        tower = towers.get(event.tower_id)
+        if tower is None:
+            self._states.pop(event.tower_id, None)
+        else:
+            self._states[tower.id] = tower.getState(self._last)
+
+    def _rebuild(self):
+        version = self.backend.getDataVersion()
+        if version == self._version:
+            return
+        self._version = version
+        towers = self.backend.getFleet().towers
+        heap = []
+        for tower_id, tower in towers.iteritems():
+            if tower_id not in self._states:
+                self._states[tower_id] = tower.getState(self._last)
+            boundary = towerBoundary(tower, self._last)
+            if boundary is not None:
+                heap.append((boundary, tower_id))
+        heapq.heapify(heap)
+        self._heap = heap
+        for tower_id in set(self._states) - set(towers):
+            del self._states[tower_id]
+
+    def nextBoundary(self):
+        """
+        Return the earliest boundary of the towers after the last check,
+        or None if there is none or nothing was checked yet.
+        """
+
+        if self._last is None:
+            return None
+        self._rebuild()
+        return self._heap and self._heap[0][0] or None
+
+    def check(self, timestamp):
+        """
+        Publish the events up to timestamp since the last check.
+        """
+
+        if self._last is None:
+            self._last = timestamp
+            self._rebuild()
+            return
+
+        self._rebuild()
+        towers = self.backend.getFleet().towers
+        due = set()
+        while self._heap and self._heap[0][0] <= timestamp:
+            due.add(heapq.heappop(self._heap)[1])
+
+        last = self._last
+        for tower_id in sorted(due):
+            tower = towers.get(tower_id)
+            if tower is None:
+                continue
+            state = tower.getState(timestamp)
+            previous = self._states.get(tower_id)
+            self._states[tower_id] = state
+            if previous is not None and previous != state:
+                self.events.publish('state', tower_id, state=state,
+                    previous=previous)
+            elif state == STATE_ONLINE:
+                pulse = timestamp - (timestamp - (tower.resourcePulse or 0)
+                    ) % SECONDS_PER_HOUR
+                if last < pulse <= timestamp:
+                    self.events.publish('pulse', tower_id,
+                        timeRemaining=tower.getTimeRemaining(timestamp))
+            boundary = towerBoundary(tower, timestamp)
+            if boundary is not None:
+                heapq.heappush(self._heap, (boundary, tower_id))
+        self._last = timestamp
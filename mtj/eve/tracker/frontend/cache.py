@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+
+import gzip
+import hashlib
+import threading
+import time
+from io import BytesIO
+
+from mtj.eve.tracker.events import towerBoundary
+
+
+def nextBoundary(towers, timestamp):
+    """
+    Return the earliest time after timestamp where the state of any of
+    the towers changes on its own (see `towerBoundary`).  None if there
+    is no such time.
+    """
+
+    boundaries = [b for b in (towerBoundary(tower, timestamp)
+        for tower in towers) if b is not None]
+    return boundaries and min(boundaries) or None
+
+
+class CachedResponse(object):
+    """
+    A rendered response with its strong ETag, the sha1 of the body,
+    along with the gzip compressed body once requested.  The gzip
+    compressed body is a different representation, so it has its own
+    ETag (see `getEtag`).
+    """
+
+    compresslevel = 6
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self._gzipped = None
+
+    def getEtag(self, gzipped=False):
+        if gzipped:
+            return self.etag + '-gzip'
+        return self.etag
+
+    def gzipped(self):
+        if self._gzipped is None:
+            # a race only results in compressing twice.
+            buf = BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb',
+                    compresslevel=self.compresslevel, mtime=0) as fp:
+                fp.write(self.body)
+            self._gzipped = buf.getvalue()
+        return self._gzipped
+
+
+class ResponseCache(object):
+    """
+    Cache for the rendered responses of the JSON frontend.
+
+    A response is reused until the data version of the backend changes,
+    or until the next boundary (see `nextBoundary`) of the towers,
+    whichever is first.  As responses include the time they were
+    rendered at, max_age limits how long any response is kept.
+    """
+
+    def __init__(self, max_age=60, clock=time.time):
+        self.max_age = max_age
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuild_time = 0.0
+        self.last_rebuild_time = 0.0
+
+    def get(self, key, backend, build):
+        """
+        Return the response for key, calling build with the current
+        timestamp to render it if there is no valid cached response.
+        """
+
+        return self.getResponse(key, backend, build).body
+
+    def getResponse(self, key, backend, build):
+        """
+        As `get`, but return the `CachedResponse`.
+        """
+
+        timestamp = int(self.clock())
+        version = backend.getDataVersion()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and timestamp < entry[1]:
+                self.hits += 1
+                return entry[2]
+
+        start = time.time()
+        result = CachedResponse(build(timestamp))
+        elapsed = time.time() - start
+
+        expires = timestamp + self.max_age
+        boundary = nextBoundary(backend.getFleet().towers.values(),
+            timestamp)
+        if boundary is not None:
+            expires = min(expires, boundary)
+
+        with self._lock:
+            self.misses += 1
+            self.rebuild_time += elapsed
+            self.last_rebuild_time = elapsed
+            self._entries[key] = (version, expires, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': total and float(self.hits) / total or 0.0,
+                'rebuild_time': self.rebuild_time,
+                'last_rebuild_time': self.last_rebuild_time,
+            }
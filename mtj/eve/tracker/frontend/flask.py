@@ -7,60 +7,146 @@ from flask import Blueprint, Flask, make_response, current_app, request
 
 from mtj.eve.tracker.interfaces import ITrackerBackend, ITowerManager
 from mtj.eve.tracker.frontend.json import Json
+from mtj.eve.tracker.frontend.cache import CachedResponse
 
 
 json_frontend = Blueprint('json_frontend', 'mtj.eve.tracker.frontend.flask')
 
-@json_frontend.route('/overview')
-def overview():
+# the most entries returned in a page of a log.
+MAX_PAGE_SIZE = 500
+
+def cached_json(key, method, *a):
+    """
+    Render the Json method with the arguments into a `CachedResponse`,
+    through the response cache if one is configured.
+    """
+
     backend = zope.component.getUtility(ITrackerBackend)
     manager = zope.component.getUtility(ITowerManager)
-    jst = Json(backend, manager)
-    result = jst.overview()
-    response = make_response(result)
-    response.headers['Content-type'] = 'application/json'
+
+    def build(timestamp):
+        jst = Json(backend, manager)
+        jst.set_timestamp(timestamp)
+        return getattr(jst, method)(*a)
+
+    cache = current_app.config.get('MTJPOSTRACKER_RESPONSE_CACHE')
+    if cache is None:
+        return CachedResponse(build(None))
+    return cache.getResponse(key, backend, build)
+
+def json_response(cached):
+    """
+    Make the response for the `CachedResponse`, which is not modified
+    if the request has its ETag, and gzipped if accepted.
+    """
+
+    gzipped = bool(request.accept_encodings['gzip'])
+    etag = cached.getEtag(gzipped)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    elif gzipped:
+        response = make_response(cached.gzipped())
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-type'] = 'application/json'
+    else:
+        response = make_response(cached.body)
+        response.headers['Content-type'] = 'application/json'
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
     return response
 
-@json_frontend.route('/tower')
-def towers():
+def json_page(method, a, count=50):
+    """
+    Respond with the page of the Json method with the arguments, with
+    the count and the cursor of the page it follows (the `next` of that
+    page) from the `count` and `after` arguments of the request.
+    """
+
+    count = request.args.get('count', count, type=int)
+    if count is not None:
+        count = min(max(count, 1), MAX_PAGE_SIZE)
+    after = request.args.get('after')
+
     backend = zope.component.getUtility(ITrackerBackend)
     manager = zope.component.getUtility(ITowerManager)
     jst = Json(backend, manager)
-    result = jst.towers()
-    response = make_response(result)
+    try:
+        result, http_code = getattr(jst, method)(*(a + (count, after))), None
+    except ValueError as e:
+        result, http_code = json.dumps({'status': 'error', 'result':
+            str(e),
+        }), 400
+    response = make_response(result, http_code)
     response.headers['Content-type'] = 'application/json'
     return response
 
+@json_frontend.route('/overview')
+def overview():
+    return json_response(cached_json(('overview',), 'overview'))
+
+@json_frontend.route('/tower')
+def towers():
+    return json_response(cached_json(('towers',), 'towers'))
+
 @json_frontend.route('/tower/<int:tower_id>')
 def tower(tower_id):
-    backend = zope.component.getUtility(ITrackerBackend)
-    manager = zope.component.getUtility(ITowerManager)
-    jst = Json(backend, manager)
-    result = jst.tower(tower_id)
-    response = make_response(result)
+    return json_response(cached_json(('tower', tower_id), 'tower',
+        tower_id))
+
+@json_frontend.route('/tower/<int:tower_id>/tower_log')
+def tower_log(tower_id):
+    return json_page('tower_log', (tower_id,))
+
+@json_frontend.route('/tower/<int:tower_id>/fuel_log')
+def fuel_log(tower_id):
+    return json_page('fuel_log', (tower_id,))
+
+@json_frontend.route('/cache_stats')
+def cache_stats():
+    cache = current_app.config.get('MTJPOSTRACKER_RESPONSE_CACHE')
+    if cache is None:
+        data, http_code = {'status': 'error', 'result':
+            'response cache not enabled',
+        }, 404
+    else:
+        data, http_code = {'status': 'ok', 'result': cache.stats()}, None
+    response = make_response(json.dumps(data), http_code)
     response.headers['Content-type'] = 'application/json'
     return response
 
 @json_frontend.route('/audits_recent/', defaults={'count': 50})
 @json_frontend.route('/audits_recent/<int:count>')
 def audits_recent(count):
-    backend = zope.component.getUtility(ITrackerBackend)
-    manager = zope.component.getUtility(ITowerManager)
-    jst = Json(backend, manager)
-    result = jst.audits_recent(count)
-    response = make_response(result)
-    response.headers['Content-type'] = 'application/json'
-    return response
+    return json_page('audits_recent', (), count)
 
 @json_frontend.route('/audit/<table>/<int:rowid>')
 def audit_tbl_rowid(table, rowid):
-    backend = zope.component.getUtility(ITrackerBackend)
-    manager = zope.component.getUtility(ITowerManager)
-    jst = Json(backend, manager)
-    result = jst.audits(table, rowid)
-    response = make_response(result)
-    response.headers['Content-type'] = 'application/json'
-    return response
+    # all the entries unless a count is requested.
+    return json_page('audits', (table, rowid), None)
+
+def check_admin_key(action):
+    """
+    Return the error and the http code if the request doesn't have the
+    admin key, otherwise the data sent with the request and None.
+    """
+
+    admin_key = current_app.config.get('MTJPOSTRACKER_ADMIN_KEY')
+    if not admin_key:
+        return {'status': 'error', 'result':
+            '%s not enabled; no admin key defined' % action,
+        }, 403
+    try:
+        # consider using request.json?
+        data = json.loads(request.data)
+        key = data.get('key')
+    except:
+        data = key = None
+
+    if not (key and key == admin_key):
+        return {'status': 'error', 'result':
+            'invalid key',
+        }, 403
+    return data, None
 
 @json_frontend.route('/reload', methods=['POST'])
 def reload_db():
@@ -69,24 +155,12 @@ def reload_db():
     """
 
     def process():
-        admin_key = current_app.config.get('MTJPOSTRACKER_ADMIN_KEY')
-        if not admin_key:
-            return {'status': 'error', 'result':
-                'reload not enabled; no admin key defined',
-            }, 403
-        try:
-            # consider using request.json?
-            data = json.loads(request.data)
-            key = data.get('key')
-        except:
-            key = None
-
-        if not (key and key == admin_key):
-            return {'status': 'error', 'result':
-                'invalid key',
-            }, 403
+        data, http_code = check_admin_key('reload')
+        if http_code:
+            return data, http_code
+        incremental = bool(data.get('incremental'))
         manager = zope.component.getUtility(ITowerManager)
-        results = manager.refresh()
+        results = manager.refresh(incremental=incremental)
         return {'status': 'ok', 'result':
             '%d towers reloaded.' % results,
         }, None
@@ -96,3 +170,34 @@ def reload_db():
     response = make_response(result, http_code)
     response.headers['Content-type'] = 'application/json'
     return response
+
+@json_frontend.route('/import', methods=['GET', 'POST'])
+def import_status():
+    """
+    The status of the import scheduler, or trigger an import if posted
+    with the right keys.
+    """
+
+    def process():
+        scheduler = current_app.config.get('MTJPOSTRACKER_SCHEDULER')
+        if scheduler is None:
+            return {'status': 'error', 'result':
+                'import scheduler not enabled',
+            }, 404
+        if request.method == 'GET':
+            return {'status': 'ok', 'result': scheduler.status()}, None
+
+        data, http_code = check_admin_key('import')
+        if http_code:
+            return data, http_code
+        if not scheduler.trigger():
+            return {'status': 'error', 'result':
+                'import already running',
+            }, 409
+        return {'status': 'ok', 'result': 'import triggered.'}, None
+
+    data, http_code = process()
+    result = json.dumps(data)
+    response = make_response(result, http_code)
+    response.headers['Content-type'] = 'application/json'
+    return response
@@ -60,6 +60,7 @@ class LogiCommand(Command):
 
         self.cache = {}
         self.cache_time = 0
+        self.cache_etag = None
 
         self.last_error_time = 0
 
@@ -70,10 +71,17 @@ class LogiCommand(Command):
         if last_cache < self.last_error_time:
             raise TrackerError('Timeout still active from last error')
 
+        headers = {
+            'Authorization': 'Backdoor %s' % self.backdoor,
+        }
+        if self.cache_etag:
+            headers['If-None-Match'] = self.cache_etag
+
         try:
-            r = requests.get(self.overview, headers={
-                    'Authorization': 'Backdoor %s' % self.backdoor,
-                }, verify=False)
+            r = requests.get(self.overview, headers=headers, verify=False)
+            if r.status_code == 304:
+                self.cache_time = time()
+                return self.cache
             data = r.json()
         except ConnectionError:
             raise TrackerError('Error connecting to tracker.')
@@ -88,6 +96,7 @@ class LogiCommand(Command):
             raise TrackerResponseError(data['error'])
         self.cache_time = time()
         self.cache = data
+        self.cache_etag = r.headers.get('ETag')
 
         return data
 
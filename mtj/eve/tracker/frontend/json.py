@@ -8,9 +8,10 @@ from evelink import constants
 import json
 
 from mtj.f3u1.units import Time
-from mtj.evedb.structure import ControlTower
 from mtj.eve.tracker.interfaces import ITrackerBackend
 from mtj.eve.tracker.backend.model import api_usage_states
+from mtj.eve.tracker.backend.model import pageCursor
+from mtj.eve.tracker.pos import tower_profiles
 
 # for case insensitive matching of '[ignore] in audit label.
 is_ignored = re.compile('\\[ignore\\]', re.IGNORECASE).search
@@ -18,6 +19,10 @@ is_ignored = re.compile('\\[ignore\\]', re.IGNORECASE).search
 def format_ts(ts):
     return ts and strftime('%Y-%m-%d %H:%M', gmtime(ts)) or 'N/A'
 
+def next_cursor(page, count):
+    # a full page may be followed by more.
+    return page and len(page) == count and pageCursor(page[-1]) or None
+
 
 class Json(object):
     """
@@ -39,13 +44,7 @@ class Json(object):
 
     @property
     def fuel_names(self):
-        if not hasattr(self, '_fuel_names'):
-            ct = ControlTower()
-            tower_resources = ct.getControlTowerResources()
-            self._fuel_names = {
-                v['resourceTypeID']: v['typeName'] for v in tower_resources
-            }
-        return self._fuel_names
+        return tower_profiles.getResourceNames()
 
     def overview(self, low_fuel=432000):
         # overview should be a brief # listing of various things, rather
@@ -124,25 +123,26 @@ class Json(object):
             return ''
 
         all_towers = {}
-        # FIXME using private _towers.
-        for v in self._backend._towers.values():
+        projection = self._backend.getFleetProjection()
+        for v, offlineAt, state, timeRemaining in projection.project(
+                timestamp):
             tower = {
                 'id': v.id,
                 'celestialName': v.celestialName,
                 'regionName': v.regionName,
                 'typeID': v.typeID,
                 'typeName': v.typeName,
-                'offlineAt': v.getOfflineTimestamp(),
-                'offlineAtFormatted': format_ts(v.getOfflineTimestamp()),
-                'state': v.getState(timestamp),
-                'stateName': constants.Corp.pos_states[v.getState(timestamp)],
+                'offlineAt': offlineAt,
+                'offlineAtFormatted': format_ts(offlineAt),
+                'state': state,
+                'stateName': constants.Corp.pos_states[state],
                 'stateTimestamp': v.stateTimestamp,
                 'stateTimestampFormatted': format_ts(v.stateTimestamp),
                 'stateTimestampDeltaFormatted':
                     str(timedelta(seconds=(v.stateTimestamp - timestamp))),
-                'timeRemaining': v.getTimeRemaining(timestamp),
+                'timeRemaining': timeRemaining,
                 'timeRemainingFormatted':
-                    str(timedelta(seconds=v.getTimeRemaining(timestamp))),
+                    str(timedelta(seconds=timeRemaining)),
                 'auditLabel': getLabel(v.id),
             }
             tower.update(self.api_ts(v.id))
@@ -167,8 +167,8 @@ class Json(object):
             ] for category_name, audits in all_audits.iteritems()
         }
 
-    def audits(self, obj, rowid):
-        audits = self._backend.getAuditEntriesFor(obj, rowid)
+    def audits(self, obj, rowid, count=None, after=None):
+        audits = self._backend.getAuditEntriesFor(obj, rowid, count, after)
         result = {
             'audits': [{
                 'category_name': v.category_name,
@@ -176,12 +176,13 @@ class Json(object):
                 'user': v.user,
                 'timestamp': v.timestamp,
                 'timestampFormatted': format_ts(v.timestamp),
-            } for v in audits]
+            } for v in audits],
+            'next': next_cursor(audits, count),
         }
         return json.dumps(result)
 
-    def audits_recent(self, count=50):
-        audits = self._backend.getAuditEntriesRecent(count)
+    def audits_recent(self, count=50, after=None):
+        audits = self._backend.getAuditEntriesRecent(count, after)
         result = {
             'audits': [{
                 'table': v.table,
@@ -191,25 +192,13 @@ class Json(object):
                 'user': v.user,
                 'timestamp': v.timestamp,
                 'timestampFormatted': format_ts(v.timestamp),
-            } for v in audits]
+            } for v in audits],
+            'next': next_cursor(audits, count),
         }
         return json.dumps(result)
 
-    def tower(self, tower_id=None):
-        if tower_id is None:
-            return self.towers()
-
-        backend = self._backend
-        timestamp = self.current_timestamp
-
-        tower = backend.getTower(tower_id, None)
-        if tower is None:
-            return json.dumps({
-                'error': 'Tower not found'
-            })
-
-        tower_log = backend.getTowerLog(tower_id, 10)
-        tower_log_json = [{
+    def _tower_log(self, tower_log):
+        return [{
             'id': v.id,
             'state': v.state,
             'stateName': constants.Corp.pos_states[v.state],
@@ -219,8 +208,16 @@ class Json(object):
             'stateTimestampFormatted': format_ts(v.stateTimestamp),
         } for v in tower_log]
 
-        fuel_log = backend.getFuelLog(tower_id, 10)
-        fuel_log_json = [{
+    def tower_log(self, tower_id, count=50, after=None):
+        tower_log = self._backend.getTowerLog(tower_id, count, after)
+        result = {
+            'tower_log': self._tower_log(tower_log),
+            'next': next_cursor(tower_log, count),
+        }
+        return json.dumps(result)
+
+    def _fuel_log(self, fuel_log):
+        return [{
             'id': v.id,
             'fuelId': v.fuelTypeID,
             'fuelName': self.fuel_names.get(v.fuelTypeID, ''),
@@ -230,6 +227,30 @@ class Json(object):
             'timestampFormatted': format_ts(v.timestamp),
         } for v in fuel_log]
 
+    def fuel_log(self, tower_id, count=50, after=None):
+        fuel_log = self._backend.getFuelLog(tower_id, count, after)
+        result = {
+            'fuel_log': self._fuel_log(fuel_log),
+            'next': next_cursor(fuel_log, count),
+        }
+        return json.dumps(result)
+
+    def tower(self, tower_id=None):
+        if tower_id is None:
+            return self.towers()
+
+        backend = self._backend
+        timestamp = self.current_timestamp
+
+        tower = backend.getFleet().towers.get(tower_id)
+        if tower is None:
+            return json.dumps({
+                'error': 'Tower not found'
+            })
+
+        tower_log_json = self._tower_log(backend.getTowerLog(tower_id, 10))
+        fuel_log_json = self._fuel_log(backend.getFuelLog(tower_id, 10))
+
         tower_json = {
             'id': tower.id,
             'celestialName': tower.celestialName,
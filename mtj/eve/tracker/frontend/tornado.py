@@ -0,0 +1,411 @@
+from __future__ import absolute_import
+
+import itertools
+import json
+import logging
+import re
+import sys
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import zope.component
+from zope.component.hooks import getSite, setSite
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import RequestHandler, asynchronous
+
+from mtj.eve.tracker.interfaces import ITrackerBackend, ITowerManager
+from mtj.eve.tracker.frontend.cache import CachedResponse
+from mtj.eve.tracker.frontend.json import Json
+
+logger = logging.getLogger('mtj.eve.tracker.frontend.tornado')
+
+
+class Executor(object):
+    """
+    Runs calls in a bounded pool of threads, away from the IOLoop, with
+    the results passed back to a callback in the IOLoop.
+
+    With no workers the calls are made right away in the IOLoop, for
+    backends that can't be used from other threads.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._pool = workers and ThreadPool(workers) or None
+
+    def submit(self, f, callback, *a):
+        """
+        Call f with the arguments, then callback with its result and
+        the exception info (None if there is no error).
+        """
+
+        if self._pool is None:
+            try:
+                result = f(*a)
+            except Exception:
+                callback(None, sys.exc_info())
+            else:
+                callback(result, None)
+            return
+
+        io_loop = IOLoop.current()
+        # the utilities are looked up from the site, which is local to
+        # the thread.
+        site = getSite()
+
+        def run():
+            setSite(site)
+            try:
+                result = f(*a)
+            except Exception:
+                io_loop.add_callback(callback, None, sys.exc_info())
+            else:
+                io_loop.add_callback(callback, result, None)
+
+        self._pool.apply_async(run)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+
+class Jobs(object):
+    """
+    Background jobs run through the `Executor`, by id, so their status
+    can be queried.  Only the latest jobs are kept.
+
+    Only to be used from the IOLoop.
+    """
+
+    def __init__(self, executor, size=100):
+        self.executor = executor
+        self.size = size
+        self._ids = itertools.count(1)
+        self._jobs = OrderedDict()
+
+    def submit(self, name, f, *a):
+        job_id = str(next(self._ids))
+        job = self._jobs[job_id] = {
+            'id': job_id,
+            'name': name,
+            'state': 'running',
+            'start': int(time.time()),
+            'end': None,
+            'result': None,
+        }
+        while len(self._jobs) > self.size:
+            self._jobs.popitem(last=False)
+
+        def done(result, exc_info):
+            job['end'] = int(time.time())
+            if exc_info:
+                logger.error('Job %s (%s) failed', job_id, name,
+                    exc_info=exc_info)
+                job['state'] = 'error'
+                job['result'] = str(exc_info[1])
+            else:
+                job['state'] = 'done'
+                job['result'] = result
+
+        self.executor.submit(f, done, *a)
+        return job_id
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+
+class JsonHandler(RequestHandler):
+    """
+    Base handler for the JSON endpoints, which renders the responses in
+    the executor.
+    """
+
+    def initialize(self, executor, cache=None, jobs=None, admin_key=None):
+        self.executor = executor
+        self.cache = cache
+        self.jobs = jobs
+        self.admin_key = admin_key
+
+    def renderJson(self, key, method, *a):
+        """
+        Render the Json method with the arguments in the executor,
+        through the response cache if one is configured.
+        """
+
+        cache = self.cache
+
+        def render():
+            backend = zope.component.getUtility(ITrackerBackend)
+            manager = zope.component.getUtility(ITowerManager)
+
+            def build(timestamp):
+                jst = Json(backend, manager)
+                jst.set_timestamp(timestamp)
+                return getattr(jst, method)(*a)
+
+            if cache is None:
+                return CachedResponse(build(None))
+            return cache.getResponse(key, backend, build)
+
+        self.executor.submit(render, self.respond)
+
+    def respond(self, cached, exc_info=None):
+        """
+        Finish with the `CachedResponse`, which is not modified if the
+        request has its ETag, and gzipped if accepted.
+        """
+
+        if exc_info:
+            logger.error('Failed to render response', exc_info=exc_info)
+            self.send_error(500)
+            return
+
+        gzipped = 'gzip' in self.request.headers.get('Accept-Encoding', '')
+        self.set_header('Etag', '"%s"' % cached.getEtag(gzipped))
+        self.set_header('Vary', 'Accept-Encoding')
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
+
+        self.set_header('Content-Type', 'application/json')
+        if gzipped:
+            self.set_header('Content-Encoding', 'gzip')
+            self.finish(cached.gzipped())
+        else:
+            self.finish(cached.body)
+
+    def respondData(self, data, status=200):
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(data))
+
+    def checkAdminKey(self, action):
+        """
+        Return the data sent with the request if it has the admin key,
+        otherwise finish with the error and return None.
+        """
+
+        if not self.admin_key:
+            self.respondData({'status': 'error', 'result':
+                '%s not enabled; no admin key defined' % action,
+            }, 403)
+            return None
+        try:
+            data = json.loads(self.request.body)
+            key = data.get('key')
+        except Exception:
+            data = key = None
+
+        if not (key and key == self.admin_key):
+            self.respondData({'status': 'error', 'result':
+                'invalid key',
+            }, 403)
+            return None
+        return data
+
+
+class OverviewHandler(JsonHandler):
+
+    @asynchronous
+    def get(self):
+        self.renderJson(('overview',), 'overview')
+
+
+class TowersHandler(JsonHandler):
+
+    @asynchronous
+    def get(self):
+        self.renderJson(('towers',), 'towers')
+
+
+class TowerHandler(JsonHandler):
+
+    @asynchronous
+    def get(self, tower_id):
+        tower_id = int(tower_id)
+        self.renderJson(('tower', tower_id), 'tower', tower_id)
+
+
+class ReloadHandler(JsonHandler):
+    """
+    Start a reload from the database in the background, returning the
+    id of the job.
+    """
+
+    def post(self):
+        data = self.checkAdminKey('reload')
+        if data is None:
+            return
+        incremental = bool(data.get('incremental'))
+        manager = zope.component.getUtility(ITowerManager)
+        job_id = self.jobs.submit('reload', manager.refresh, incremental)
+        self.respondData({'status': 'ok', 'result': 'reload started.',
+            'job': job_id}, 202)
+
+
+class JobHandler(JsonHandler):
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            self.respondData({'status': 'error', 'result': 'no such job'},
+                404)
+            return
+        self.respondData({'status': 'ok', 'result': job})
+
+
+def jsonHandlers(prefix, executor, cache=None, admin_key=None):
+    """
+    Return the handlers for the JSON endpoints under prefix, to be
+    served in place of the ones of the flask app.
+    """
+
+    prefix = re.escape(prefix.rstrip('/'))
+    kwargs = {
+        'executor': executor,
+        'cache': cache,
+        'jobs': Jobs(executor),
+        'admin_key': admin_key,
+    }
+    return [
+        (prefix + '/overview', OverviewHandler, kwargs),
+        (prefix + '/tower', TowersHandler, kwargs),
+        (prefix + '/tower/([0-9]+)', TowerHandler, kwargs),
+        (prefix + '/reload', ReloadHandler, kwargs),
+        (prefix + '/job/([0-9]+)', JobHandler, kwargs),
+    ]
+
+
+def format_event(event):
+    """
+    Format the event as a server-sent event.
+    """
+
+    data = dict(event.data)
+    data['tower_id'] = event.tower_id
+    data['timestamp'] = event.timestamp
+    return 'id: %s\nevent: %s\ndata: %s\n\n' % (
+        event.id, event.kind, json.dumps(data))
+
+
+class EventStreamHandler(RequestHandler):
+    """
+    Streams the events of an `EventLog` as server-sent events.
+
+    A client resumes from the id of the last event it received through
+    the Last-Event-ID header (as sent by EventSource) or the
+    last_event_id argument.  If the events since then are not
+    available, a reset event is sent first, to have the client reload
+    its data.
+    """
+
+    # seconds between the comments sent to keep the connection open.
+    keepalive = 30
+
+    def initialize(self, events):
+        self.events = events
+        self._last = None
+        self._keepalive = None
+
+    @asynchronous
+    def get(self):
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+
+        last_id = self.request.headers.get('Last-Event-ID',
+            self.get_argument('last_event_id', None))
+
+        # subscribe first so nothing is missed, duplicates are dropped
+        # by the sequence.
+        self.io_loop = IOLoop.current()
+        self.events.subscribe(self._onEvent)
+
+        missed = self.events.since(last_id)
+        if missed is None:
+            self.write('event: reset\ndata: {}\n\n')
+            missed = self.events.since()
+        for event in missed:
+            self._send(event)
+        self.flush()
+
+        self._keepalive = PeriodicCallback(self._ping, self.keepalive * 1000)
+        self._keepalive.start()
+
+    def _onEvent(self, event):
+        # may be called from any thread.
+        self.io_loop.add_callback(self._sendAndFlush, event)
+
+    def _send(self, event):
+        seq = int(event.id.split('-')[1])
+        if self._last is not None and seq <= self._last:
+            return
+        self._last = seq
+        self.write(format_event(event))
+
+    def _sendAndFlush(self, event):
+        if self.request.connection.stream.closed():
+            return
+        self._send(event)
+        self.flush()
+
+    def _ping(self):
+        if self.request.connection.stream.closed():
+            return
+        self.write(':\n\n')
+        self.flush()
+
+    def on_connection_close(self):
+        self.events.unsubscribe(self._onEvent)
+        if self._keepalive is not None:
+            self._keepalive.stop()
+
+
+def watchBoundaries(watcher, io_loop=None, max_interval=300, clock=time.time):
+    """
+    Run the `BoundaryWatcher` in the io_loop at the next boundary of the
+    towers, or after max_interval seconds for new towers.  The writes
+    to the backend are passed to the watcher, and the next boundary is
+    found again after them as they may have moved it.
+    """
+
+    if io_loop is None:
+        io_loop = IOLoop.current()
+    # the handle of the next check, and whether it is to be rescheduled.
+    state = {'timeout': None, 'reschedule': False}
+
+    def schedule(now):
+        next_check = now + max_interval
+        boundary = watcher.nextBoundary()
+        if boundary is not None:
+            next_check = min(next_check, boundary)
+        if state['timeout'] is not None:
+            io_loop.remove_timeout(state['timeout'])
+        state['timeout'] = io_loop.add_timeout(next_check, check)
+
+    def check():
+        now = int(clock())
+        watcher.check(now)
+        schedule(now)
+
+    def reschedule():
+        state['reschedule'] = False
+        schedule(int(clock()))
+
+    def written(event):
+        watcher.written(event)
+        if not state['reschedule']:
+            # once for all the writes of an import.
+            state['reschedule'] = True
+            io_loop.add_callback(reschedule)
+
+    def onEvent(event):
+        # may be called from any thread.
+        if event.kind in watcher.writes:
+            io_loop.add_callback(written, event)
+
+    watcher.events.subscribe(onEvent)
+    io_loop.add_callback(check)
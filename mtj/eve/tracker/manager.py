@@ -1,13 +1,20 @@
 from __future__ import absolute_import
 
+import hashlib
+import json
+import sys
 import time
 import logging
+import threading
+import Queue
+from multiprocessing.pool import ThreadPool
 
 from xml.etree import ElementTree
 from evelink.api import APIError
 
 import zope.component
 import zope.interface
+from zope.component.hooks import getSite, setSite
 
 from mtj.eve.tracker.interfaces import ITrackerBackend, ITowerManager
 from mtj.eve.tracker.interfaces import IAPIKeyManager
@@ -34,22 +41,162 @@ class APIKeyManager(object):
             self.api_keys.iteritems()]
 
 
+def _call(f, *a, **kw):
+    return f(*a, **kw)
+
+
+def detailsDigest(api_time, details, sov):
+    """
+    Return the digest of the starbase details returned at api_time for
+    a tower, with sov being the sovereignty status of the tower, as the
+    fuel usage depends on it.
+    """
+
+    raw = json.dumps([api_time, details, sov], sort_keys=True, default=repr)
+    return hashlib.sha1(raw).hexdigest()
+
+
+class RateLimiter(object):
+    """
+    Spaces out calls to `wait` so that they happen at most rate times
+    per second, across all threads.
+    """
+
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.interval = 1.0 / rate
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+
 @zope.interface.implementer(ITowerManager)
 class BaseTowerManager(object):
     """
     A class that gathers the loose bits of functions.
+
+    fetch_workers
+        The number of starbase detail requests made concurrently.
+    fetch_rate
+        The maximum number of starbase detail requests per second for
+        any API key.  No limit if None.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, fetch_workers=4, fetch_rate=None):
+        self.fetch_workers = fetch_workers
+        self.fetch_rate = fetch_rate
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+        # the cachedUntil of the last starbase list of every API key.
+        self.cachedUntil = {}
+
+    def _getRateLimiter(self, api_key):
+        if not self.fetch_rate:
+            return None
+        with self._limiters_lock:
+            if api_key not in self._limiters:
+                self._limiters[api_key] = RateLimiter(self.fetch_rate)
+            return self._limiters[api_key]
+
+    def fetchStarbaseDetails(self, corp, itemIDs):
+        """
+        Fetch the starbase details for all itemIDs, using up to
+        `fetch_workers` threads.
 
-    def importWithCorp(self, corp):
+        Returns a list of (itemID, ts, result, error) in the same order
+        as itemIDs, where ts is the time right before the request, and
+        error is the `APIError` or `ElementTree.ParseError` raised in
+        place of the result.
+        """
+
+        limiter = self._getRateLimiter(corp.api.api_key[0])
+        # the utilities (such as the evelink cache) are looked up from
+        # the site, which is local to the thread.
+        site = getSite()
+
+        def fetch(itemID):
+            setSite(site)
+            if limiter is not None:
+                limiter.wait()
+            ts = time.time()
+            try:
+                return itemID, ts, corp.starbase_details(itemID), None
+            except (APIError, ElementTree.ParseError) as e:
+                return itemID, ts, None, e
+
+        workers = min(self.fetch_workers, len(itemIDs))
+        if workers <= 1:
+            return [fetch(itemID) for itemID in itemIDs]
+
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(fetch, itemIDs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def fetchCorp(self, corp, cached=None):
+        """
+        Make all the API requests needed to import the towers of corp,
+        without touching the backend.
+
+        cached
+            The result of `getCachedItems` for corp; the starbases with
+            cached details listed will not be requested.
+
+        Returns the starbases, the results of `fetchStarbaseDetails`
+        for them, with (itemID, None, None, None) in place of the
+        starbases not requested, and cached.
+        """
+
+        cached = cached or {}
+        result = corp.starbases()
+        self.cachedUntil[corp.api.api_key[0]] = result.expires
+        starbases = result.result
+        logger.info('%d starbases returned', len(starbases))
+        itemIDs = [k for k, v in starbases.iteritems()
+            if (k, v.get('moonID')) not in cached]
+        logger.info('%d starbase details still cached',
+            len(starbases) - len(itemIDs))
+        details = {r[0]: r for r in self.fetchStarbaseDetails(corp, itemIDs)}
+        return starbases, [details.get(k, (k, None, None, None))
+            for k in starbases], cached
+
+    def getCachedItems(self, backend, corp):
+        """
+        Return the tower APIs of the starbases of corp with details that
+        are still cached and usable, by (itemID, moonID), to be passed
+        to `fetchCorp`.  The details of a tower that changed its
+        sovereignty status are not usable, as the fuel usage changed.
+        """
+
+        cached = backend.getCachedTowerApis(corp.api.api_key[0],
+            int(time.time()))
+        result = {}
+        for k, tower_api in cached.iteritems():
+            tower = backend.getTower(tower_api.tower_id, None)
+            if tower is not None and tower.sov == tower._sov:
+                result[k] = tower_api
+        return result
+
+    def importWithCorp(self, corp, fetched=None):
         """
         Takes a fully prepared evelink corp API object (cache + keys) to
         instantiate towers.
 
         corp
             - the corp API object.
+        fetched
+            - the results of `fetchCorp` for this corp, if the requests
+              were already made.
         """
 
         backend = zope.component.queryUtility(ITrackerBackend)
@@ -58,13 +205,38 @@ class BaseTowerManager(object):
                            'nothing to do')
             return
 
-        starbases = corp.starbases().result
+        if fetched is None:
+            fetched = self.fetchCorp(corp, self.getCachedItems(backend, corp))
+
+        starbases, details, cached = fetched
         starbases_c = len(starbases)
 
-        logger.info('%d starbases returned', starbases_c)
+        # write all the tower updates in one go.
+        with backend.batch():
+            skipped = self._importStarbases(backend, corp, starbases, details,
+                cached)
+
+        logger.info('(%d/%d) processing complete; %d/%d unchanged or cached '
+            'starbase details skipped', starbases_c, starbases_c, skipped,
+            starbases_c)
 
-        for c, item in enumerate(starbases.iteritems()):
-            k, v = item
+    def _importStarbases(self, backend, corp, starbases, fetched, cached):
+        """
+        Process the starbases and their fetched details, with cached
+        being the tower APIs of the details not requested.  Returns the
+        number of towers skipped as their details were unchanged or
+        still cached.
+        """
+
+        starbases_c = len(starbases)
+        skipped = 0
+        api_key = corp.api.api_key[0]
+        digests = backend.getTowerApiDigests(starbases.keys())
+
+        # only the requests are made concurrently, the results are
+        # processed in order.
+        for c, item in enumerate(zip(starbases.iteritems(), fetched)):
+            (k, v), (_, ts, raw_details, error) = item
             logger.info('(%d/%d) starbases processed.', c, starbases_c)
             logger.info('processing itemID: %s', k)
 
@@ -79,18 +251,31 @@ class BaseTowerManager(object):
 
             logger.info('backend tower id: %s', tower.id)
 
-            # Get time right before the request.
-            try:
-                ts = time.time()
-                raw_details = corp.starbase_details(k)
-            except APIError as e:
-                api_time = e.timestamp
+            if raw_details is None and error is None:
+                # not requested as the previous details are still cached.
+                tower_api = cached.get((k, v.get('moonID')))
+                if tower_api is None or tower_api.tower_id != tower.id:
+                    # the cached details were of another tower; no
+                    # requests are made here, so leave this tower to
+                    # the next import once the cache window has passed.
+                    logger.warning('cached starbase details for %s belong '
+                        'to another tower, skipping', k)
+                    continue
+                logger.info('starbase details still cached, skipping')
+                skipped += 1
+                backend.setTowerApi(tower.id, api_key,
+                    tower_api.currentTime, digest=tower_api.digest,
+                    cachedUntil=tower_api.cachedUntil)
+                continue
+
+            if isinstance(error, APIError):
+                api_time = error.timestamp
                 logger.warning('Fail to retrieve corp/StarbaseDetail for %s; '
                     'corp/StarbaseList may be out of date', k)
-                backend.setTowerApi(tower.id, corp.api.api_key[0], api_time,
+                backend.setTowerApi(tower.id, api_key, api_time,
                     api_error=True)
                 continue
-            except ElementTree.ParseError as e:
+            elif error is not None:
                 logger.warning('Fail to retrieve corp/StarbaseDetail for %s; '
                     'corp/StarbaseList response was invalid XML', k)
                 continue
@@ -99,6 +284,16 @@ class BaseTowerManager(object):
             api_time = raw_details.timestamp
             details = raw_details.result
 
+            digest = detailsDigest(api_time, details, tower.sov)
+            if digests.get(tower.id) == digest:
+                # same response as the one already processed, typically
+                # from the API cache.
+                logger.info('starbase details unchanged, skipping')
+                skipped += 1
+                backend.setTowerApi(tower.id, api_key, api_time,
+                    digest=digest, cachedUntil=raw_details.expires)
+                continue
+
             state_ts = details['state_ts'] or 0
             delta = api_time - state_ts
             state = details['state']
@@ -124,9 +319,10 @@ class BaseTowerManager(object):
             # itemID is not reset when unanchored.  This is why some
             # corporation ensure that every unanchored tower is to be
             # repackaged before being anchored again, if possible.
-            backend.setTowerApi(tower.id, corp.api.api_key[0], api_time)
+            backend.setTowerApi(tower.id, api_key, api_time,
+                digest=digest, cachedUntil=raw_details.expires)
 
-        logger.info('(%d/%d) processing complete', starbases_c, starbases_c)
+        return skipped
 
 
 class TowerManager(BaseTowerManager):
@@ -134,9 +330,60 @@ class TowerManager(BaseTowerManager):
     The main tower manager.
 
     Requires explicit backend, and provides
+
+    import_workers
+        The number of API keys fetched from concurrently by importAll.
+    import_timeout
+        The seconds the requests for an API key may take before the
+        import of that key is abandoned.  No limit if None.
     """
 
-    def importAll(self):
+    def __init__(self, import_workers=4, import_timeout=600, *a, **kw):
+        super(TowerManager, self).__init__(*a, **kw)
+        self.import_workers = import_workers
+        self.import_timeout = import_timeout
+
+    def _startFetch(self, results, idx, corp, cached=None):
+        site = getSite()
+
+        def fetch():
+            setSite(site)
+            results.put(('started', idx, time.time()))
+            try:
+                result = self.fetchCorp(corp, cached)
+            except:
+                results.put(('error', idx, sys.exc_info()))
+            else:
+                results.put(('fetched', idx, result))
+
+        # daemon, as a hanging request must not keep the process alive.
+        thread = threading.Thread(target=fetch, name='import-%d' % idx)
+        thread.daemon = True
+        thread.start()
+
+    def importAll(self, apply=None, progress=None):
+        """
+        Import the towers for all API keys.
+
+        The requests for the keys are made concurrently, while the
+        results are written to the backend in this thread as they come
+        in.  A key that times out or fails is recorded as an error in
+        its API usage.  The thread of a key that timed out is left to
+        finish on its own, but it still counts towards the
+        `import_workers` until it does.
+
+        apply
+            Called with a function and its arguments for every call
+            that writes to the backend, to have them done elsewhere.
+            Defaults to calling the function directly.
+        progress
+            Called with the number of keys done and the total number of
+            keys as each key completes.
+        """
+
+        if apply is None:
+            apply = _call
+
         keyman = zope.component.queryUtility(IAPIKeyManager)
         backend = zope.component.queryUtility(ITrackerBackend)
         if not backend:
@@ -148,23 +395,89 @@ class TowerManager(BaseTowerManager):
             return
 
         corps = keyman.getAllWith(evelink.Corp)
-        for corp in corps:
-            error = 0
-            m_usage = backend.beginApiUsage(corp.api.api_key[0])
+        # the API usage of every key, begun as it is dispatched.
+        usages = {}
+
+        results = Queue.Queue()
+        queued = list(enumerate(corps))
+        pending = set()
+        started = {}
+        # the keys that timed out, with their threads still running.
+        abandoned = set()
+
+        def finish(idx, error):
+            if idx not in abandoned:
+                pending.discard(idx)
+            started.pop(idx, None)
+            apply(backend.endApiUsage, usages[idx], error)
+            if progress is not None:
+                progress(len(corps) - len(queued) -
+                    len(pending - abandoned), len(corps))
+
+        while queued or pending - abandoned:
+            while queued and len(pending) < max(self.import_workers, 1):
+                idx, corp = queued.pop(0)
+                pending.add(idx)
+                usages[idx] = apply(backend.beginApiUsage,
+                    corp.api.api_key[0])
+                # looked up here as the backend may not be usable from
+                # the fetching thread.
+                cached = apply(self.getCachedItems, backend, corp)
+                self._startFetch(results, idx, corp, cached)
+
+            timeout = None
+            if self.import_timeout is not None and started:
+                timeout = max(min(started.values()) + self.import_timeout -
+                    time.time(), 0)
+
             try:
-                self.importWithCorp(corp)
-            except:
-                # well crap.
-                logger.exception('Import failed with uncaught exception')
+                kind, idx, value = results.get(timeout=timeout)
+            except Queue.Empty:
+                now = time.time()
+                for idx, ts in started.items():
+                    if ts + self.import_timeout <= now:
+                        logger.error('Import for API key %s timed out after '
+                            '%s seconds', corps[idx].api.api_key[0],
+                            self.import_timeout)
+                        abandoned.add(idx)
+                        finish(idx, 1)
+                continue
+
+            if idx in abandoned:
+                if kind != 'started':
+                    # the late result of an abandoned key, which frees
+                    # its slot as its thread is done.
+                    abandoned.discard(idx)
+                    pending.discard(idx)
+                continue
+
+            if kind == 'started':
+                started[idx] = value
+                continue
+
+            error = 0
+            if kind == 'error':
+                logger.error('Import failed with uncaught exception',
+                    exc_info=value)
                 error = 1
-            backend.endApiUsage(m_usage, error)
+            else:
+                try:
+                    apply(self.importWithCorp, corps[idx], value)
+                except:
+                    # well crap.
+                    logger.exception('Import failed with uncaught exception')
+                    error = 1
+            finish(idx, error)
 
         # update the api key usage.
-        backend.cacheApiTowerIds()
+        apply(backend.cacheApiTowerIds)
 
-    def refresh(self):
+    def refresh(self, incremental=False):
         """
         Refresh all data from the db.
+
+        incremental
+            Only refresh the towers changed since the last refresh.
         """
 
         backend = zope.component.queryUtility(ITrackerBackend)
@@ -172,4 +485,6 @@ class TowerManager(BaseTowerManager):
             logger.warning('No backend is present')
             return
 
+        if incremental:
+            return backend.reinstantiateChanged()
         return backend.reinstantiate()
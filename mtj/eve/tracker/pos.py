@@ -26,19 +26,210 @@ STATE_ONLINING = 2
 STATE_REINFORCED = 3
 STATE_ONLINE = 4
 
+SOV_FUEL_FACTOR = 0.75
+FUEL_PURPOSE_NORMAL = 1
+
 pos_info = ControlTower()
 eve_map = Map()
 item_info = Group()
 
 
+class TowerTypeProfile(object):
+    """
+    The fuel requirements of a tower type under a specific combination
+    of sovereignty status, faction and security band.
+
+    Attributes:
+
+    resources
+        All the resources the tower type can make use of, keyed by the
+        resourceTypeID, as provided by evedb.
+    fuels
+        The resourceTypeIDs of the resources actually required.
+    deltas
+        The effective per cycle consumption of every resource, with the
+        sovereignty discount applied.
+    cycleVolume
+        The volume of the normal fuels consumed per cycle.
+    idealFuelRatio
+        The amount of the normal fuels that fills the fuel bay.
+    strontiumCycles
+        The amount of reinforcement cycles the strontium bay holds.
+    """
+
+    def __init__(self, typeID, sov, factionID, securityBand, typeInfo,
+            security):
+        self.typeID = typeID
+        self.sov = sov
+        self.factionID = factionID
+        self.securityBand = securityBand
+
+        self.resources = {v['resourceTypeID']: v
+            for v in typeInfo['resources']}
+
+        self.deltas = {}
+        for k, v in self.resources.iteritems():
+            delta = v['quantity']
+            if sov:
+                delta = int(round(delta * SOV_FUEL_FACTOR))
+            self.deltas[k] = delta
+
+        fuels = []
+        for fuel in typeInfo['resources']:
+            if fuel['factionID'] in (factionID, None):
+                if fuel['factionID'] and security < fuel['minSecurityLevel']:
+                    # Lowsec don't need charters.
+                    continue
+                fuels.append(fuel['resourceTypeID'])
+        self.fuels = tuple(fuels)
+
+        normal = [k for k in self.fuels
+            if self.resources[k]['purpose'] == FUEL_PURPOSE_NORMAL]
+        self.cycleVolume = sum(
+            self.resources[k]['volume'] * self.deltas[k] for k in normal)
+
+        self.idealFuelRatio = {}
+        if self.cycleVolume:
+            ideal_cycles = int(typeInfo['capacity'] / self.cycleVolume)
+            self.idealFuelRatio = {k: self.deltas[k] * ideal_cycles
+                for k in normal}
+
+        self.strontiumCycles = 0
+        stront = self.resources.get(STRONTIUM_ITEMID)
+        if STRONTIUM_ITEMID in self.fuels and self.deltas[STRONTIUM_ITEMID]:
+            self.strontiumCycles = int(typeInfo['strontCapacity'] /
+                (self.deltas[STRONTIUM_ITEMID] * stront['volume']))
+
+
+class TowerTypeProfiles(object):
+    """
+    Process-wide table of `TowerTypeProfile`.
+
+    Profiles are built from evedb the first time a combination of
+    typeID, sovereignty status, faction and security band is requested,
+    and reused after that.  Call `clear` if evedb is changed.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._types = {}
+        self._profiles = {}
+        self._resourceNames = None
+
+    def getTypeInfo(self, typeID):
+        """
+        Return the static information of a tower type.
+        """
+
+        result = self._types.get(typeID)
+        if result is not None:
+            return result
+
+        tower = pos_info.getControlTower(typeID) or {}
+        stront = pos_info.getControlTowerStrontCapacity(typeID) or {}
+        resources = pos_info.getControlTowerResource(typeID) or []
+        result = {
+            'typeName': tower.get('typeName'),
+            'capacity': tower.get('capacity', 0),
+            'strontCapacity': stront.get('capacitySecondary', 0),
+            'resources': resources,
+            # only faction specific resources depend on security.
+            'thresholds': sorted(set(v['minSecurityLevel']
+                for v in resources if v['factionID'])),
+        }
+        self._types[typeID] = result
+        return result
+
+    def getProfile(self, typeID, sov, factionID, security):
+        """
+        Return the profile for a tower of typeID anchored in a system of
+        the given security level, where the faction is the one holding
+        the system and sov denotes whether the owner of the tower holds
+        sovereignty there.
+        """
+
+        typeInfo = self.getTypeInfo(typeID)
+        # The security band is the number of charter thresholds that
+        # the security level meets, as that's the only thing it affects.
+        band = len([t for t in typeInfo['thresholds'] if security >= t])
+        key = (typeID, bool(sov), factionID, band)
+        result = self._profiles.get(key)
+        if result is None:
+            result = TowerTypeProfile(typeID, bool(sov), factionID, band,
+                typeInfo, security)
+            self._profiles[key] = result
+        return result
+
+    def getResourceNames(self):
+        """
+        Return the names of all tower resources keyed by their typeID.
+        """
+
+        if self._resourceNames is None:
+            self._resourceNames = {v['resourceTypeID']: v['typeName']
+                for v in pos_info.getControlTowerResources()}
+        return self._resourceNames
+
+
+tower_profiles = TowerTypeProfiles()
+
+
+class DerivedCache(object):
+    """
+    Cache for the values a tower derives from its fuel buffers.
+
+    The owner is responsible for clearing this whenever the buffers or
+    the values these derivations depend on are changed.  Hits and
+    misses are counted so the effectiveness can be checked.
+    """
+
+    __slots__ = ('values', 'hits', 'misses')
+
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory):
+        """
+        Return the cached value for key, calling factory to produce it
+        if it's not already cached.
+        """
+
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        result = self.values[key] = factory()
+        return result
+
+    def clear(self):
+        self.values.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
 class Tower(object):
     """
     A Player Owned Structure (POS).
+
+    A plain object, so the fuel math reads its attributes directly; the
+    backends copy the values to and from their storage on load and on
+    write.
     """
     # TODO verify the argument ordering of some methods in this class
     # that contain timestamp.  Value tends to be fuel value and they all
     # precede it, but other optional arguments have to follow after.
 
+    __slots__ = ('id', 'itemID', 'typeID', 'locationID', 'moonID', 'state',
+        'stateTimestamp', 'onlineTimestamp', 'standingOwnerID', '_derived',
+        'resourcePulse', 'typeName', 'allianceID', 'celestialName',
+        'solarSystemName', 'regionName', 'capacity', 'strontCapacity',
+        'security', '_sov', 'fuels', 'silos')
+
     _missing = '<missing name>'
 
     def __init__(self, itemID, typeID, locationID, moonID, state,
@@ -66,6 +257,10 @@ class Tower(object):
         self._initDerived()
 
     def _initDerived(self):
+        # derived values from the fuels, must be present before any of
+        # the setters below are called.
+        self._derived = DerivedCache()
+
         # this can be None...
         self.resourcePulse = 0
         self.typeName = None
@@ -75,6 +270,7 @@ class Tower(object):
         self.regionName = None
         self.capacity = None
         self.strontCapacity = None
+        self.security = 0
 
         # variable derived values
         self.allianceID = None
@@ -85,6 +281,57 @@ class Tower(object):
         self.fuels = {}  # fuel
         self.silos = {}  # silos
 
+    # the values set by `_initDerived` that are kept in a snapshot.
+    _snapshotAttributes = ('typeName', 'allianceID', 'celestialName',
+        'solarSystemName', 'regionName', 'capacity', 'strontCapacity',
+        'security', 'resourcePulse', '_sov')
+
+    # the values given to __init__, along with the id from the backend.
+    _stateAttributes = ('id', 'itemID', 'typeID', 'locationID', 'moonID',
+        'state', 'stateTimestamp', 'onlineTimestamp', 'standingOwnerID')
+
+    def freeze(self):
+        """
+        Return an immutable copy of this tower as it is now.
+        """
+
+        return FrozenTower(self)
+
+    def getSnapshotState(self):
+        """
+        Return the derived values and the fuel buffers as plain tuples,
+        to be restored later with `restoreSnapshotState`.
+        """
+
+        derived = tuple(getattr(self, k) for k in self._snapshotAttributes)
+        fuels = tuple((k, f and (f.delta, f.timestamp, f.expiry, f.purpose,
+                f.value, f.resourceTypeName, f.unitVolume))
+            for k, f in self.fuels.iteritems())
+        return derived, fuels
+
+    def restoreSnapshotState(self, derived, fuels):
+        """
+        Restore the state returned by `getSnapshotState` in place of
+        `_initDerived`, without looking up evedb or the API helper.
+        """
+
+        self._derived = DerivedCache()
+        for k, v in zip(self._snapshotAttributes, derived):
+            setattr(self, k, v)
+
+        self.fuels = {}
+        self.silos = {}
+        for k, f in fuels:
+            if f is None:
+                self.fuels[k] = None
+                continue
+            (delta, timestamp, expiry, purpose, value, resourceTypeName,
+                unitVolume) = f
+            self.fuels[k] = TowerResourceBuffer(tower=self, delta=delta,
+                timestamp=timestamp, expiry=expiry, purpose=purpose,
+                value=value, resourceTypeName=resourceTypeName,
+                unitVolume=unitVolume)
+
     def _setDerivedValues(self):
         # TODO error checking and other validation somewhere
         # It's done using self to avoid logging while also updating
@@ -92,15 +339,15 @@ class Tower(object):
         self.setStateTimestamp(self.stateTimestamp)
         moon = eve_map.getCelestial(self.moonID) or {}
         solar_system = eve_map.getSolarSystem(self.locationID) or {}
-        pos = pos_info.getControlTower(self.typeID) or {}
-        stront = pos_info.getControlTowerStrontCapacity(self.typeID) or {}
+        type_info = tower_profiles.getTypeInfo(self.typeID)
         self.celestialName = moon.get('itemName', self._missing)
         self.solarSystemName = solar_system.get('solarSystemName',
             self._missing)
         self.regionName = solar_system.get('regionName', self._missing)
-        self.typeName = pos.get('typeName', self._missing)
-        self.capacity = pos.get('capacity', 0)
-        self.strontCapacity = stront.get('capacitySecondary', 0)
+        self.security = solar_system.get('security', 0)
+        self.typeName = type_info['typeName'] or self._missing
+        self.capacity = type_info['capacity']
+        self.strontCapacity = type_info['strontCapacity']
 
         # Not calling the update method defined below as this is part of
         # initialization.
@@ -132,6 +379,7 @@ class Tower(object):
         return self._setStateTimestamp(stateTimestamp)
 
     def _setStateTimestamp(self, stateTimestamp):
+        self._invalidateDerived()
         if stateTimestamp is None:
             # This can happen when API says so when querying for a long
             # offline pos.  Just assume this to be 0.
@@ -152,6 +400,20 @@ class Tower(object):
         else:
             return evelink_helper.corporations.get(self.standingOwnerID)
 
+    def _invalidateDerived(self):
+        """
+        Drop the cached values derived from the fuel buffers.
+        """
+
+        self._derived.clear()
+
+    def getDerivedCacheStats(self):
+        """
+        Return the hit and miss counts of the derived value cache.
+        """
+
+        return self._derived.stats()
+
     def querySovStatus(self):
         evelink_helper = zope.component.getUtility(IAPIHelper)
         evelink_helper.refresh()
@@ -197,26 +459,33 @@ class Tower(object):
         kargs['fuelTypeID'] = bufferKey
         res_buffer = TowerResourceBuffer(**kargs)
         bufferGroup[bufferKey] = res_buffer
+        self._invalidateDerived()
         return kargs
 
-    def initResources(self):
+    def getProfile(self):
+        """
+        Return the `TowerTypeProfile` applicable to this tower in its
+        current location and sovereignty status.
+        """
+
         evelink_helper = zope.component.getUtility(IAPIHelper)
-        all_fuels = pos_info.getControlTowerResource(self.typeID)
         sov_info = evelink_helper.sov.get(self.locationID, {})
 
         # Determine fuel type from systemID + factionID
         faction_id = sov_info.get('faction_id', None)
-        security = eve_map.getSolarSystem(self.locationID).get('security', 0)
+        return tower_profiles.getProfile(self.typeID, self.sov, faction_id,
+            self.security)
 
-        for fuel in all_fuels:
-            if fuel['factionID'] in (faction_id, None):
-                if fuel['factionID'] and security < fuel['minSecurityLevel']:
-                    # Lowsec don't need charters.
-                    continue
+    def initResources(self, profile=None):
+        if profile is None:
+            profile = self.getProfile()
 
-                self.fuels[fuel['resourceTypeID']] = None
+        for fuel_id in profile.fuels:
+            self.fuels[fuel_id] = None
 
-    def verifyResources(self, values, timestamp, all_fuels=None):
+        self._invalidateDerived()
+
+    def verifyResources(self, values, timestamp, profile=None):
         """
         Verify resources with the given values
 
@@ -225,18 +494,19 @@ class Tower(object):
             API.
         timestamp
             The timestamp of the values.
+        profile
+            Optional `TowerTypeProfile` to verify against, defaults to
+            the one currently applicable to this tower.
 
         returns a list of fuel_id that mismatch from the input value.
         """
 
         mismatches = []
-        if not self.fuels:
-            self.initResources()
+        if profile is None:
+            profile = self.getProfile()
 
-        # XXX this should be a property already initialized?
-        if not all_fuels:
-            all_fuels = {v['resourceTypeID']: v for v in
-                pos_info.getControlTowerResource(self.typeID)}
+        if not self.fuels:
+            self.initResources(profile)
 
         for fuel_id, fuel_buffer in self.fuels.iteritems():
             if fuel_buffer is None:
@@ -253,10 +523,7 @@ class Tower(object):
             if verifier != calculated.value:
                 mismatches.append(fuel_id)
 
-            delta = all_fuels.get(fuel_id)['quantity']
-            if self.sov:
-                delta = int(round(delta * 0.75))
-            if fuel_buffer.delta != delta:
+            if fuel_buffer.delta != profile.deltas[fuel_id]:
                 mismatches.append(fuel_id)
 
         return mismatches
@@ -298,10 +565,8 @@ class Tower(object):
 
             state_ts_result = self.setStateTimestamp(stateTimestamp)
 
-        # dict comprehension
-        # XXX isn't this relatively static?
-        all_fuels = {v['resourceTypeID']: v for v in
-            pos_info.getControlTowerResource(self.typeID)}
+        profile = self.getProfile()
+        all_fuels = profile.resources
 
         if not omit_missing:
             # mismatches should be all the resources
@@ -311,7 +576,7 @@ class Tower(object):
 
         # flag the need to update all the fuels.
         updateAll = not self.fuels
-        mismatches = self.verifyResources(values, timestamp, all_fuels)
+        mismatches = self.verifyResources(values, timestamp, profile)
 
         update_values = {}
         if updateAll:
@@ -337,10 +602,7 @@ class Tower(object):
                 continue
 
             fuel = all_fuels.get(resourceTypeID)
-
-            delta = fuel['quantity']
-            if self.sov:
-                delta = int(round(delta * 0.75))
+            delta = profile.deltas[resourceTypeID]
 
             timestamp = self.resourcePulseTimestamp(timestamp)
 
@@ -365,6 +627,7 @@ class Tower(object):
         This will trigger an updateResource if the sov status changes
         """
 
+        self._invalidateDerived()
         if standingOwnerID:
             self.standingOwnerID = standingOwnerID
         self.allianceID = self.queryAllianceID()
@@ -421,8 +684,7 @@ class Tower(object):
 
         result = {}
         for key, fuel in self.fuels.iteritems():
-            result[key] = (fuel and fuel.getCurrent(timestamp=timestamp).value
-                or 0)
+            result[key] = fuel and fuel.getCurrentValue(timestamp) or 0
         return result
 
     def getIdealFuelRatio(self):
@@ -430,24 +692,17 @@ class Tower(object):
         Get the ideal fuel ratio
         """
 
-        # add all normal fuel volumes
-        fuels = [f for k, f in self.fuels.iteritems() if f.isNormalFuel()]
+        # copied as callers are free to modify the result.
+        return dict(self._derived.get('idealFuelRatio',
+            self._getIdealFuelRatio))
 
-        cycle_volume = 0
-        for fuel in fuels:
-            cycle_volume += fuel.unitVolume * fuel.delta
-
-        ideal_cycles = int(self.capacity / cycle_volume)
-
-        # dict comprehension
-        return {k: f.delta * ideal_cycles for k, f in self.fuels.iteritems()
-            if f.isNormalFuel()}
+    def _getIdealFuelRatio(self):
+        return self.getProfile().idealFuelRatio
 
     def getTargetStrontiumCycles(self, target=None):
-        fuel = self.fuels[STRONTIUM_ITEMID]
         if target is not None:
             return target
-        return int(self.strontCapacity / (fuel.delta * fuel.unitVolume))
+        return self.getProfile().strontiumCycles
 
     def getTargetStrontiumAmount(self, target=None):
         """
@@ -487,6 +742,10 @@ class Tower(object):
         if self.state not in [STATE_ONLINING, STATE_REINFORCED, STATE_ONLINE]:
             return None
 
+        return self._derived.get('offlineTimestamp',
+            self._getOfflineTimestamp)
+
+    def _getOfflineTimestamp(self):
         offlineTimestamps = []
         for key, fuel in self.fuels.iteritems():
             if fuel is None or not fuel.isNormalFuel():
@@ -543,6 +802,10 @@ class Tower(object):
         return corp_const.pos_states[self.getState()]
 
     def getReinforcementLength(self):
+        return self._derived.get('reinforcementLength',
+            self._getReinforcementLength)
+
+    def _getReinforcementLength(self):
         fuel = self.fuels.get(STRONTIUM_ITEMID)
         if not fuel:
             return 0
@@ -555,6 +818,8 @@ class Tower(object):
         if state is None:
             return
 
+        self._invalidateDerived()
+
         if timestamp is None:
             timestamp = int(time.time())
 
@@ -775,6 +1040,56 @@ class Tower(object):
             for key, silo in self.silos.iteritems()}
 
 
+class FrozenTower(Tower):
+    """
+    An immutable copy of a tower, for readers that must not see the
+    tower changing while they use it.  Setting any attribute raises a
+    TypeError; none of the methods that change the tower may be used.
+
+    Only the values of the tower are copied, so the fuel buffers of the
+    copy are its own.
+    """
+
+    __slots__ = ('_frozen',)
+
+    def __init__(self, tower):
+        self._frozen = False
+        for k in self._stateAttributes:
+            setattr(self, k, getattr(tower, k, None))
+        self.restoreSnapshotState(*tower.getSnapshotState())
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise TypeError('%s is immutable' % self.__class__.__name__)
+        super(FrozenTower, self).__setattr__(name, value)
+
+
+class ResourceType(object):
+    """
+    The description of a type of resource held by the buffers, shared
+    by all the buffers of that type.  Use `ResourceType.get` for the
+    instances.
+    """
+
+    __slots__ = ('name', 'unitVolume', 'purpose')
+
+    _instances = {}
+
+    def __init__(self, name, unitVolume, purpose=None):
+        self.name = name
+        self.unitVolume = unitVolume
+        self.purpose = purpose
+
+    @classmethod
+    def get(cls, name, unitVolume, purpose=None):
+        key = (name, unitVolume, purpose)
+        result = cls._instances.get(key)
+        if result is None:
+            result = cls._instances.setdefault(key, cls(*key))
+        return result
+
+
 class TowerResourceBuffer(TimedBuffer):
     """
     The base tower bay.
@@ -782,12 +1097,14 @@ class TowerResourceBuffer(TimedBuffer):
 
     def __init__(self, tower=None, delta=None, timestamp=None, expiry=None,
             purpose=None, value=0, resourceTypeName=None, unitVolume=None,
-            freeze=None, *a, **kw):
+            freeze=None, resourceType=None, *a, **kw):
+
+        if resourceType is None:
+            resourceType = ResourceType.get(resourceTypeName, unitVolume,
+                purpose)
 
         self.tower = tower
-        self.purpose = purpose
-        self.resourceTypeName = resourceTypeName
-        self.unitVolume = unitVolume
+        self.resourceType = resourceType
 
         if (self.tower is not None and
                 self.tower.state not in [STATE_REINFORCED, STATE_ONLINE]):
@@ -824,6 +1141,18 @@ class TowerResourceBuffer(TimedBuffer):
             empty=0,
         )
 
+    @property
+    def purpose(self):
+        return self.resourceType.purpose
+
+    @property
+    def resourceTypeName(self):
+        return self.resourceType.name
+
+    @property
+    def unitVolume(self):
+        return self.resourceType.unitVolume
+
     def isConsumingFuel(self, timestamp=None):
         # if this is orphaned, assume consuming.
         return self.tower is None or self.tower.getState(timestamp) in [
@@ -842,11 +1171,33 @@ class TowerResourceBuffer(TimedBuffer):
     def getCurrent(self, *a, **kw):
         return super(TowerResourceBuffer, self).getCurrent(
             tower=self.tower,
-            purpose=self.purpose,
-            resourceTypeName=self.resourceTypeName,
-            unitVolume=self.unitVolume,
+            resourceType=self.resourceType,
             *a, **kw)
 
+    def getCurrentValue(self, timestamp):
+        """
+        Return the value `getCurrent` would have at timestamp, without
+        creating the new buffer.
+        """
+
+        if self.freeze:
+            return self.value
+        if self.freeze_FuelCheck(self.timestamp):
+            # the tower no longer consumes this, but the buffer was made
+            # before; leave that to the buffer itself.
+            return self.getCurrent(timestamp=timestamp).value
+        if timestamp is not None:
+            if timestamp <= self.expiry:
+                return self.value
+            # a full delta is consumed at the start of every period
+            # after the expiry.
+            consumed = ((timestamp - self.expiry - 1) // self.period + 1
+                ) * self.delta
+            if consumed <= self.value:
+                return self.value - consumed
+        # the buffer runs out, leave that to the buffer itself.
+        return self.getCurrent(timestamp=timestamp).value
+
 
 class TowerSiloBuffer(TimedBuffer):
     """
@@ -861,11 +1212,13 @@ class TowerSiloBuffer(TimedBuffer):
             volume=None, products=None, reactants=None, online=True,
             # capture these here because they will be overriden.
             delta_min=None, delta_factor=None, period=None,
-            *a, **kw):
+            resourceType=None, *a, **kw):
+
+        if resourceType is None:
+            resourceType = ResourceType.get(typeName, unitVolume)
 
         self.tower = tower
-        self.typeName = typeName
-        self.unitVolume = unitVolume
+        self.resourceType = resourceType
         # If this is to be consumed.
         self.products = products
         # reactants is list of silo ids belonging to tower that will be
@@ -887,6 +1240,14 @@ class TowerSiloBuffer(TimedBuffer):
             *a, **kw
         )
 
+    @property
+    def typeName(self):
+        return self.resourceType.name
+
+    @property
+    def unitVolume(self):
+        return self.resourceType.unitVolume
+
     def isOnline(self, timestamp=None):
         # if this is an orphan, assume online anyway, otherwise base on
         # tower's state.
@@ -968,8 +1329,7 @@ class TowerSiloBuffer(TimedBuffer):
     def getCurrent(self, *a, **kw):
         return super(TowerSiloBuffer, self).getCurrent(
             tower=self.tower,
-            typeName=self.typeName,
-            unitVolume=self.unitVolume,
+            resourceType=self.resourceType,
             products=self.products,
             reactants=self.reactants,
             online=self.online,
@@ -0,0 +1,202 @@
+"""
+Fleet-wide projection of tower fuel levels.
+
+The per tower methods on `pos.Tower` walk through every fuel buffer for
+every call, which adds up when the whole fleet is listed.  This module
+lays out the normal fuel buffers of a collection of towers into columns
+so the offline timestamps, states and remaining time of all of them can
+be derived in one batched call.
+
+NumPy is used when available, otherwise the same calculation is done
+using plain lists.
+"""
+
+from __future__ import absolute_import
+
+import time
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from mtj.eve.tracker.pos import STATE_ANCHORED
+from mtj.eve.tracker.pos import STATE_ONLINING
+from mtj.eve.tracker.pos import STATE_REINFORCED
+from mtj.eve.tracker.pos import STATE_ONLINE
+
+# States where fuel is being tracked for consumption, as per
+# `Tower.getOfflineTimestamp`
+ACTIVE_STATES = (STATE_ONLINING, STATE_REINFORCED, STATE_ONLINE)
+# States that will become online once stateTimestamp is reached, as per
+# `Tower.getState`
+TRANSIENT_STATES = (STATE_ONLINING, STATE_REINFORCED)
+
+# Sentinels standing in for None, as None sorts before every integer.
+_MIN_TS = -(2 ** 62)
+_MAX_TS = 2 ** 62
+
+
+class FleetProjection(object):
+    """
+    Columnar projection of the fuel buffers of a collection of towers.
+
+    The offline timestamp of a tower is the earliest moment where any
+    one of its normal fuels can no longer supply a full cycle, which for
+    a depleting `TowerResourceBuffer` works out to be::
+
+        value // delta * period + expiry
+
+    The resource pulse of the tower is already folded into the expiry of
+    its buffers by `Tower.resourcePulseTimestamp`, and so does the
+    sovereignty discount into the delta by `Tower.updateResources`, so
+    the results here agree with the per tower methods.
+
+    The values are captured at construction, so a new projection should
+    be made once the towers are updated.
+    """
+
+    def __init__(self, towers):
+        self.towers = list(towers)
+
+        states = []
+        state_ts = []
+        pulses = []
+        owners = []
+        values = []
+        deltas = []
+        periods = []
+        expiries = []
+
+        for idx, tower in enumerate(self.towers):
+            states.append(tower.state)
+            state_ts.append(_MIN_TS if tower.stateTimestamp is None
+                else tower.stateTimestamp)
+            pulses.append(tower.resourcePulse)
+            for fuel in tower.fuels.itervalues():
+                if fuel is None or not fuel.isNormalFuel():
+                    continue
+                owners.append(idx)
+                values.append(fuel.value)
+                deltas.append(fuel.delta)
+                periods.append(fuel.period)
+                expiries.append(fuel.expiry)
+
+        if HAS_NUMPY:
+            self._initArrays(states, state_ts, pulses, owners, values,
+                deltas, periods, expiries)
+        else:
+            self._initLists(states, state_ts, pulses, owners, values,
+                deltas, periods, expiries)
+
+    def _initArrays(self, states, state_ts, pulses, owners, values, deltas,
+            periods, expiries):
+        count = len(self.towers)
+        self.states = numpy.array(states, dtype=numpy.int64)
+        self.stateTimestamps = numpy.array(state_ts, dtype=numpy.int64)
+        self.resourcePulses = numpy.array(pulses, dtype=numpy.int64)
+
+        owners = numpy.array(owners, dtype=numpy.int64)
+        values = numpy.array(values, dtype=numpy.int64)
+        deltas = numpy.array(deltas, dtype=numpy.int64)
+        periods = numpy.array(periods, dtype=numpy.int64)
+        expiries = numpy.array(expiries, dtype=numpy.int64)
+
+        exhausted = values // deltas * periods + expiries
+        offline = numpy.full(count, _MAX_TS, dtype=numpy.int64)
+        numpy.minimum.at(offline, owners, exhausted)
+        # towers without any normal fuels have an undefined offline
+        # timestamp, which is -1 in `Tower.getOfflineTimestamp`.
+        has_fuel = numpy.bincount(owners, minlength=count) > 0
+        offline[~has_fuel] = -1
+
+        self.active = numpy.in1d(self.states, ACTIVE_STATES)
+        self.transient = numpy.in1d(self.states, TRANSIENT_STATES)
+        self.offline = offline
+
+    def _initLists(self, states, state_ts, pulses, owners, values, deltas,
+            periods, expiries):
+        self.states = states
+        self.stateTimestamps = state_ts
+        self.resourcePulses = pulses
+
+        offline = [None] * len(self.towers)
+        for idx, value, delta, period, expiry in zip(
+                owners, values, deltas, periods, expiries):
+            exhausted = value // delta * period + expiry
+            if offline[idx] is None or exhausted < offline[idx]:
+                offline[idx] = exhausted
+
+        self.active = [s in ACTIVE_STATES for s in states]
+        self.transient = [s in TRANSIENT_STATES for s in states]
+        self.offline = [-1 if o is None else o for o in offline]
+
+    def _timestamp(self, timestamp):
+        if timestamp is None:
+            timestamp = int(time.time())
+        return timestamp
+
+    def getOfflineTimestamps(self):
+        """
+        Return the offline timestamps of all towers, in the order the
+        towers were provided.
+        """
+
+        if HAS_NUMPY:
+            offline = self.offline.tolist()
+            active = self.active.tolist()
+        else:
+            offline = self.offline
+            active = self.active
+
+        return [o if a else None for o, a in zip(offline, active)]
+
+    def getStates(self, timestamp=None):
+        """
+        Return the states of all towers at timestamp.
+        """
+
+        timestamp = self._timestamp(timestamp)
+
+        if HAS_NUMPY:
+            anchored = ~self.active | (timestamp > self.offline)
+            onlined = self.transient & (timestamp >= self.stateTimestamps)
+            return numpy.where(anchored, STATE_ANCHORED,
+                numpy.where(onlined, STATE_ONLINE, self.states)).tolist()
+
+        results = []
+        for state, state_ts, active, transient, offline in zip(
+                self.states, self.stateTimestamps, self.active,
+                self.transient, self.offline):
+            if not active or timestamp > offline:
+                results.append(STATE_ANCHORED)
+            elif transient and timestamp >= state_ts:
+                results.append(STATE_ONLINE)
+            else:
+                results.append(state)
+        return results
+
+    def getTimeRemaining(self, timestamp=None):
+        """
+        Return the time remaining in seconds for all towers at timestamp.
+        """
+
+        timestamp = self._timestamp(timestamp)
+
+        if HAS_NUMPY:
+            return numpy.where(self.active & (self.offline != 0),
+                numpy.maximum(self.offline - timestamp, 0), 0).tolist()
+
+        return [max(offline - timestamp, 0) if active and offline else 0
+            for offline, active in zip(self.offline, self.active)]
+
+    def project(self, timestamp=None):
+        """
+        Return a list of (tower, offlineAt, state, timeRemaining) for
+        all the towers at timestamp.
+        """
+
+        timestamp = self._timestamp(timestamp)
+        return zip(self.towers, self.getOfflineTimestamps(),
+            self.getStates(timestamp), self.getTimeRemaining(timestamp))
@@ -6,6 +6,7 @@ This probably could be placed in a separate egg.
 
 import logging
 import importlib
+import re
 
 import zope.component
 from zope.component.hooks import setSite, setHooks, getSite
@@ -14,9 +15,11 @@ from mtj.evedb.core import init_db, Db
 
 from mtj.eve.tracker import evelink
 from mtj.eve.tracker import interfaces
+from mtj.eve.tracker import pos
 from mtj.eve.tracker.backend.site import BaseSite
 from mtj.eve.tracker.backend.sql import SQLAlchemyBackend, SQLAPIKeyManager
 from mtj.eve.tracker.manager import TowerManager, APIKeyManager
+from mtj.eve.tracker.scheduler import ImportScheduler, LoopCaller
 
 logger = logging.getLogger('mtj.eve.tracker.runner')
 
@@ -71,6 +74,8 @@ class BaseRunner(object):
         if evedb_url:
             try:
                 init_db(evedb_url)
+                # the tower type profiles are derived from evedb.
+                pos.tower_profiles.clear()
             except:
                 logger.exception('Fail to initialize evedb with the provided '
                                  'data.evedb_url [%s].', evedb_url)
@@ -143,8 +148,10 @@ class BaseRunner(object):
             raise TypeError('No backend is registered.  Site not registered?')
 
         logger.info('%s starting up', self.__class__.__name__)
-        logger.info('Instantiating towers from database.')
-        backend.reinstantiate()
+        logger.info('Restoring towers from snapshot.')
+        if backend.restore() is None:
+            logger.info('Instantiating towers from database.')
+            backend.reinstantiate()
 
     def run(self):
         raise NotImplementedError
@@ -171,6 +178,15 @@ class FlaskRunner(BaseRunner):
 
         app.config['MTJPOSTRACKER_ADMIN_KEY'] = self.config[
             'mtj.eve.tracker.runner.FlaskRunner'].get('admin_key')
+        app.config['MTJPOSTRACKER_SCHEDULER'] = None
+
+        max_age = self.config['mtj.eve.tracker.runner.FlaskRunner'].get(
+            'response_cache_max_age')
+        app.config['MTJPOSTRACKER_RESPONSE_CACHE'] = None
+        if max_age:
+            from mtj.eve.tracker.frontend.cache import ResponseCache
+            app.config['MTJPOSTRACKER_RESPONSE_CACHE'] = ResponseCache(
+                max_age=max_age)
 
     def run(self, app=None):
         """
@@ -183,23 +199,105 @@ class FlaskRunner(BaseRunner):
 
         self.prepare(app)
 
+        # only the server writes the snapshot, as it truncates the
+        # journal other processes (e.g. `ctrl import`) may append to.
+        backend = zope.component.getUtility(interfaces.ITrackerBackend)
+        backend.saveSnapshot()
+
         host = self.config['flask']['host']
         port = self.config['flask']['port']
         # must be casted into a string.
         app.config['SECRET_KEY'] = str(self.config['flask']['secret'])
 
+        use_scheduler = self.config['mtj.eve.tracker.runner.FlaskRunner'].get(
+            'import_scheduler', True)
+
         try:
             from tornado.wsgi import WSGIContainer
             from tornado.httpserver import HTTPServer
             from tornado.ioloop import IOLoop
-            app.config['TORNADO'] = True
-            http_server = HTTPServer(WSGIContainer(app))
-            http_server.listen(port)
-            logger.info('tornado.httpserver listening on port %s', port)
-            try:
-                logger.info('Starting tornado.ioloop.')
-                IOLoop.instance().start()
-            except KeyboardInterrupt:
-                return
         except ImportError:
-            app.run(host=host, port=port)
+            # without the IOLoop to hand the writes to, the scheduled
+            # imports write from the scheduler thread.
+            scheduler = self._startScheduler(app, use_scheduler)
+            try:
+                app.run(host=host, port=port)
+            finally:
+                if scheduler:
+                    scheduler.stop()
+            return
+
+        app.config['TORNADO'] = True
+        http_server = HTTPServer(self._tornadoApplication(app,
+            WSGIContainer(app)))
+        http_server.listen(port)
+        logger.info('tornado.httpserver listening on port %s', port)
+        # the backend writes are done in the IOLoop, the thread which
+        # serves the requests.  Stopping the scheduler once the IOLoop
+        # is done abandons the writes still waiting for it.
+        scheduler = self._startScheduler(app, use_scheduler,
+            apply=LoopCaller(IOLoop.instance()))
+        try:
+            logger.info('Starting tornado.ioloop.')
+            IOLoop.instance().start()
+        except KeyboardInterrupt:
+            return
+        finally:
+            if scheduler:
+                scheduler.stop()
+            executor = getattr(self, 'executor', None)
+            if executor is not None:
+                executor.close()
+
+    def _executorWorkers(self, backend):
+        workers = self.config['mtj.eve.tracker.runner.FlaskRunner'].get(
+            'executor_workers', 4)
+        url = getattr(getattr(backend, '_conn', None), 'url', None)
+        if workers and url is not None and url.drivername == 'sqlite' and (
+                url.database in (None, '', ':memory:')):
+            # every thread would get its own empty in-memory database.
+            logger.info('In-memory database used; requests will not be '
+                        'handled in separate threads.')
+            return 0
+        return workers
+
+    def _tornadoApplication(self, app, container):
+        """
+        Serve the JSON endpoints and the event stream of the backend
+        from tornado, with the flask app handling everything else.
+        """
+
+        from tornado.web import Application, FallbackHandler
+
+        handlers = []
+        prefix = app.config.get('MTJPOSTRACKER_JSON_PREFIX')
+        backend = zope.component.queryUtility(interfaces.ITrackerBackend)
+        events = getattr(backend, 'events', None)
+        if prefix:
+            from mtj.eve.tracker.frontend.tornado import Executor
+            from mtj.eve.tracker.frontend.tornado import jsonHandlers
+            self.executor = Executor(self._executorWorkers(backend))
+            handlers.extend(jsonHandlers(prefix, self.executor,
+                cache=app.config.get('MTJPOSTRACKER_RESPONSE_CACHE'),
+                admin_key=app.config.get('MTJPOSTRACKER_ADMIN_KEY'),
+            ))
+        if prefix and events is not None:
+            from mtj.eve.tracker.events import BoundaryWatcher
+            from mtj.eve.tracker.frontend.tornado import EventStreamHandler
+            from mtj.eve.tracker.frontend.tornado import watchBoundaries
+            handlers.append((re.escape(prefix.rstrip('/')) + '/events',
+                EventStreamHandler, {'events': events}))
+            watchBoundaries(BoundaryWatcher(backend, events))
+            logger.info('Serving tower events at %s/events', prefix)
+
+        handlers.append((r'.*', FallbackHandler, {'fallback': container}))
+        return Application(handlers)
+
+    def _startScheduler(self, app, enabled, apply=None):
+        if not enabled:
+            return None
+        scheduler = ImportScheduler(apply=apply)
+        app.config['MTJPOSTRACKER_SCHEDULER'] = scheduler
+        logger.info('Starting the import scheduler.')
+        scheduler.start()
+        return scheduler
@@ -0,0 +1,242 @@
+"""
+In-process scheduling of API imports.
+
+The import runs in a background thread, with the writes to the backend
+optionally handed over to another thread (such as the one running the
+Tornado IOLoop that serves the requests) through the `apply` argument of
+`TowerManager.importAll`.
+"""
+
+import logging
+import sys
+import threading
+import time
+
+import zope.component
+from zope.component.hooks import getSite, setSite
+
+from mtj.eve.tracker.interfaces import ISettingsManager, ITowerManager
+
+logger = logging.getLogger('mtj.eve.tracker.scheduler')
+
+DEFAULT_UPDATE_TIMER = 3610
+
+
+class LoopStopped(Exception):
+    """
+    Raised for the calls abandoned by a stopped `LoopCaller`.
+    """
+
+
+class LoopCaller(object):
+    """
+    Calls functions in the thread running io_loop and waits for the
+    results, for use as the `apply` of `TowerManager.importAll`.
+    Exceptions are raised in the calling thread.
+
+    Once stopped, which is to be done when io_loop is no longer running
+    the callbacks, the calls waiting (or made later) are abandoned with
+    `LoopStopped` raised.
+    """
+
+    # seconds between the checks for being stopped while waiting.
+    interval = 0.5
+
+    def __init__(self, io_loop):
+        self.io_loop = io_loop
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def __call__(self, f, *a, **kw):
+        done = threading.Event()
+        result = []
+
+        def call():
+            try:
+                result.append((True, f(*a, **kw)))
+            except:
+                result.append((False, sys.exc_info()))
+            finally:
+                done.set()
+
+        if self.stopped:
+            raise LoopStopped()
+        self.io_loop.add_callback(call)
+        while not done.wait(self.interval):
+            if self.stopped:
+                raise LoopStopped()
+        success, value = result[0]
+        if not success:
+            raise value[0], value[1], value[2]
+        return value
+
+
+def callInLoop(io_loop, f, *a, **kw):
+    """
+    Call f in the thread running io_loop and wait for the result.
+    Exceptions are raised in the calling thread.
+    """
+
+    return LoopCaller(io_loop)(f, *a, **kw)
+
+
+class ImportScheduler(object):
+    """
+    Runs `ITowerManager.importAll` in a background thread whenever the
+    API has new data, as denoted by the cachedUntil of the starbase
+    lists, or every update_timer seconds from the `ISettingsManager`,
+    whichever is sooner.  An import can also be triggered on demand.
+
+    apply
+        Passed to `importAll`.  If it has a stop method, such as a
+        `LoopCaller`, that is called when the scheduler is stopped so
+        an import waiting on it is abandoned.
+    """
+
+    # seconds to wait after cachedUntil before requesting again.
+    margin = 30
+    # minimum seconds between the scheduled imports.
+    min_interval = 60
+
+    def __init__(self, apply=None, clock=time.time):
+        self.apply = apply
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._triggered = False
+
+        self.state = 'idle'
+        self.lastStart = None
+        self.lastEnd = None
+        self.lastResult = None
+        self.nextRun = None
+        self.progress = (0, 0)
+
+    def getUpdateTimer(self):
+        settings = zope.component.queryUtility(ISettingsManager)
+        return getattr(settings, 'update_timer', None) or DEFAULT_UPDATE_TIMER
+
+    def getNextRun(self, now):
+        """
+        Return the time for the next import after one completed at now.
+        The cachedUntil already past, as left by a key that keeps
+        failing, are ignored.
+        """
+
+        result = now + self.getUpdateTimer()
+        manager = zope.component.queryUtility(ITowerManager)
+        cached_until = [v for v in getattr(manager, 'cachedUntil', {}
+            ).values() if v and v > now]
+        if cached_until:
+            result = min(result, min(cached_until) + self.margin)
+        return max(result, now + self.min_interval)
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'last_start': self.lastStart,
+                'last_end': self.lastEnd,
+                'last_result': self.lastResult,
+                'next_run': self.nextRun,
+                'progress': {
+                    'done': self.progress[0],
+                    'total': self.progress[1],
+                },
+            }
+
+    def _progress(self, done, total):
+        with self._lock:
+            self.progress = (done, total)
+
+    def runImport(self):
+        """
+        Run the import in the current thread.
+        """
+
+        with self._lock:
+            self.state = 'running'
+            self.lastStart = self.clock()
+            self.progress = (0, 0)
+
+        result = 'error'
+        try:
+            manager = zope.component.getUtility(ITowerManager)
+            manager.importAll(apply=self.apply, progress=self._progress)
+            result = 'ok'
+        except Exception:
+            logger.exception('Scheduled import failed')
+        finally:
+            now = self.clock()
+            next_run = self.getNextRun(now)
+            with self._lock:
+                self.state = 'idle'
+                self.lastEnd = now
+                self.lastResult = result
+                self.nextRun = next_run
+            logger.info('Import finished (%s), next import at %s', result,
+                next_run)
+
+    def trigger(self):
+        """
+        Request an import right away.  Returns False if one is already
+        running.
+        """
+
+        with self._lock:
+            if self.state == 'running':
+                return False
+            self._triggered = True
+        self._wake.set()
+        return True
+
+    def _run(self, site):
+        setSite(site)
+        while True:
+            with self._lock:
+                next_run = self.nextRun
+            timeout = None
+            if next_run is not None:
+                timeout = max(next_run - self.clock(), 0)
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+            with self._lock:
+                if self._stopped:
+                    return
+                triggered = self._triggered
+                self._triggered = False
+
+            if triggered or (self.nextRun is not None and
+                    self.nextRun <= self.clock()):
+                self.runImport()
+
+    def start(self, delay=0):
+        """
+        Start the scheduler thread, with the first import after delay
+        seconds.
+        """
+
+        if self._thread is not None:
+            return
+        self.nextRun = self.clock() + delay
+        self._thread = threading.Thread(target=self._run, args=(getSite(),),
+            name='import-scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        stop = getattr(self.apply, 'stop', None)
+        if stop is not None:
+            stop()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
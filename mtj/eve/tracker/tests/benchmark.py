@@ -0,0 +1,291 @@
+"""
+Benchmarks for the tracker backend.
+
+Not part of the test suite.  Run with::
+
+    $ python -m mtj.eve.tracker.tests.benchmark
+
+The towers are synthetic copies of the ones used by the tests, so the
+test evedb and the dummy API helper are used.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from time import time
+
+import zope.component
+from sqlalchemy import func
+from sqlalchemy.ext.declarative import declarative_base
+
+from mtj.eve.tracker import pos
+from mtj.eve.tracker.interfaces import ITrackerBackend
+from mtj.eve.tracker.backend import sql
+from mtj.eve.tracker.backend.sql import SQLAlchemyBackend
+from mtj.eve.tracker.tests.base import setUp, tearDown
+
+SIZES = (100, 1000, 10000)
+RESTORE_SIZES = (1000, 5000)
+MATH_SIZES = (10000,)
+# rows of the synthetic log tables.
+LATEST_SIZES = (10000, 100000)
+
+# (typeID, locationID, moonID, fuels as (fuelTypeID, delta, value))
+TEMPLATES = [
+    (12235, 30004608, 40291202, ((4247, 30, 12345), (16275, 300, 7200))),
+    (20066, 30004268, 40270415,
+        ((4246, 10, 360), (16275, 100, 2200), (24592, 1, 34))),
+]
+
+# runs of every timed case, of which the quickest is reported.
+REPEAT = 3
+
+# older fuel rows per fuel type, as a tracker that has been running for
+# a while will have a history.
+HISTORY = 3
+
+
+class MappedTower(declarative_base(), pos.Tower):
+    """
+    The tower mapped to the tower table, as the live towers were before
+    they became plain objects, with every attribute going through the
+    instrumentation of SQLAlchemy.
+    """
+
+    __table__ = sql.Tower.__table__
+
+
+def populate(backend, count, history=HISTORY):
+    """
+    Insert count towers along with their fuel histories directly into
+    the database of the backend.
+    """
+
+    towers = []
+    fuels = []
+    for i in xrange(count):
+        typeID, locationID, moonID, resources = TEMPLATES[
+            i % len(TEMPLATES)]
+        tower_id = i + 1
+        towers.append((tower_id, 1000000 + tower_id, typeID, locationID,
+            moonID, 4, 1325376000, 1306886400, 498125261))
+        for h in xrange(history, -1, -1):
+            for fuelTypeID, delta, value in resources:
+                fuels.append((tower_id, fuelTypeID, delta,
+                    1325376000 - h * 3600, value + h * delta))
+
+    backend._conn.execute('insert into tower values '
+        '(?, ?, ?, ?, ?, ?, ?, ?, ?)', towers)
+    backend._conn.execute('insert into fuel (tower_id, fuelTypeID, delta, '
+        'timestamp, value) values (?, ?, ?, ?, ?)', fuels)
+
+
+def timeit(f, *a, **kw):
+    start = time()
+    f(*a, **kw)
+    return time() - start
+
+
+def _baselineFuels(session, tower_id):
+    # the query for the latest fuels of a tower before they were loaded
+    # in bulk, which relies on SQLite returning the bare columns of the
+    # row with the max id.
+    return session.query(sql.Fuel).filter(
+        sql.Fuel.tower_id == tower_id).group_by(
+            sql.Fuel.fuelTypeID).having(func.max(sql.Fuel.id)).all()
+
+
+def loadTowers(backend, bulk):
+    """
+    Load the towers with their fuels as `SQLAlchemyBackend.reinstantiate`
+    does, with the fuels either queried per tower as before the bulk
+    loading, or in bulk.
+    """
+
+    session = backend.session()
+    towers = [sql.towerFromValues(row)
+        for row in session.query(*sql.Tower.__table__.c)]
+    if bulk:
+        fuels = {}
+        for fuel in sql.queryLatestFuels(session).all():
+            fuels.setdefault(fuel.tower_id, []).append(fuel)
+    for tower in towers:
+        tower._initDerived()
+        if bulk:
+            sql.reloadResources(tower, session, fuels.get(tower.id, []))
+        else:
+            sql.reloadResources(tower, session,
+                _baselineFuels(session, tower.id))
+    session.expunge_all()
+    return len(towers)
+
+
+def bench_reinstantiate(sizes=SIZES, repeat=REPEAT):
+    """
+    Time the loading of the towers with the fuels queried per tower
+    before the bulk loading against the bulk loading.  The two are run
+    in turns, with the quickest of the runs of each reported, so that
+    neither gets the database warmed up by the other.
+    """
+
+    results = []
+    for size in sizes:
+        setUp(None)
+        try:
+            backend = zope.component.getUtility(ITrackerBackend)
+            populate(backend, size)
+            # warm up, then time the two in turns, swapping their order.
+            loadTowers(backend, True)
+            times = {False: [], True: []}
+            for i in xrange(repeat):
+                for bulk in (i % 2 and (True, False) or (False, True)):
+                    times[bulk].append(timeit(loadTowers, backend, bulk))
+        finally:
+            tearDown(None)
+        results.append((size, min(times[False]), min(times[True])))
+    return results
+
+
+def bench_restore(sizes=RESTORE_SIZES):
+    """
+    Time the startup of a backend using `SQLAlchemyBackend.restore` from
+    a snapshot against `SQLAlchemyBackend.reinstantiate`.
+    """
+
+    results = []
+    for size in sizes:
+        tmpdir = tempfile.mkdtemp()
+        src = 'sqlite:///' + os.path.join(tmpdir, 'tracker.db')
+        path = os.path.join(tmpdir, 'snapshot')
+        setUp(None, backend=SQLAlchemyBackend(src, snapshot_path=path))
+        try:
+            backend = zope.component.getUtility(ITrackerBackend)
+            populate(backend, size)
+            full = timeit(backend.reinstantiate)
+            backend.saveSnapshot()
+            restored = SQLAlchemyBackend(src, snapshot_path=path)
+            restore = timeit(restored.restore)
+        finally:
+            tearDown(None)
+            shutil.rmtree(tmpdir)
+        results.append((size, full, restore))
+    return results
+
+
+def _towerMath(towers, timestamp):
+    for tower in towers:
+        # the derived values are cached, so they are cleared to have
+        # the offline timestamp computed again.
+        tower._derived.clear()
+        tower.getOfflineTimestamp()
+        tower.getResources(timestamp)
+
+
+def loadMappedTowers(backend):
+    session = backend.session()
+    towers = session.query(MappedTower).all()
+    fuels = {}
+    for fuel in sql.queryLatestFuels(session).all():
+        fuels.setdefault(fuel.tower_id, []).append(fuel)
+    for tower in towers:
+        tower._initDerived()
+        sql.reloadResources(tower, session, fuels.get(tower.id, []))
+    session.expunge_all()
+    return towers
+
+
+def bench_tower_math(sizes=MATH_SIZES, timestamp=1325379600):
+    """
+    Time `Tower.getOfflineTimestamp` and `Tower.getResources` on the
+    towers mapped to the tower table against the plain towers of the
+    backend.
+    """
+
+    results = []
+    for size in sizes:
+        setUp(None)
+        try:
+            backend = zope.component.getUtility(ITrackerBackend)
+            populate(backend, size)
+            backend.reinstantiate()
+            mapped = timeit(_towerMath, loadMappedTowers(backend), timestamp)
+            plain = timeit(_towerMath, backend._towers.values(), timestamp)
+        finally:
+            tearDown(None)
+        results.append((size, mapped, plain))
+    return results
+
+
+def populateLogs(backend, count):
+    """
+    Insert count rows into the fuel and the audit tables, for 1000
+    towers.
+    """
+
+    backend._conn.execute('insert into fuel (tower_id, fuelTypeID, delta, '
+        'timestamp, value) values (?, ?, ?, ?, ?)',
+        [(i % 1000, 4246 + i % 3, 10, 1325376000 + i, i)
+            for i in xrange(count)])
+    backend._conn.execute('insert into audit (`table`, rowid, reason, user, '
+        'category_name, timestamp) values (?, ?, ?, ?, ?, ?)',
+        [('tower', i % 1000, 'note', 'user', i % 2 and 'label' or 'notice',
+            1325376000 + i % 5000) for i in xrange(count)])
+
+
+def bench_latest(sizes=LATEST_SIZES):
+    """
+    Time the strategies of `sql.queryLatest` that SQLite supports on
+    the latest fuels and audits, for in-memory and file databases.
+    """
+
+    results = []
+    for size in sizes:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for src in ('sqlite://',
+                    'sqlite:///' + os.path.join(tmpdir, 'tracker.db')):
+                backend = SQLAlchemyBackend(src)
+                populateLogs(backend, size)
+                session = backend.session()
+                row = [size]
+                for strategy in ('correlated', 'window'):
+                    if (strategy == 'window' and sql.latestStrategy(
+                            backend._conn.dialect) != 'window'):
+                        row.append(float('nan'))
+                        continue
+                    row.append(timeit(lambda: (
+                        sql.queryLatestFuels(session,
+                            strategy=strategy).all(),
+                        sql.queryLatest(session, sql.Audit,
+                            ('table', 'rowid', 'category_name'),
+                            'timestamp', strategy=strategy).all(),
+                    )))
+                results.append(row)
+        finally:
+            shutil.rmtree(tmpdir)
+    return results
+
+
+def report(title, header, results, out=sys.stdout):
+    out.write('%s\n' % title)
+    out.write(''.join('%14s' % h for h in header) + '\n')
+    for row in results:
+        out.write('%14d' % row[0] + ''.join('%14.3f' % v for v in row[1:]) +
+            '\n')
+    out.write('\n')
+
+
+def main():
+    report('reinstantiate (seconds)', ('towers', 'baseline', 'bulk'),
+        bench_reinstantiate())
+    report('startup (seconds)', ('towers', 'reinstantiate', 'restore'),
+        bench_restore())
+    report('tower math (seconds)', ('towers', 'mapped', 'plain'),
+        bench_tower_math())
+    report('latest rows, memory then file (seconds)',
+        ('rows', 'correlated', 'window'), bench_latest())
+
+
+if __name__ == '__main__':
+    main()
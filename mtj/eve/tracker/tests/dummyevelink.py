@@ -3,6 +3,7 @@ from __future__ import absolute_import
 import time
 import json
 import itertools
+import threading
 from collections import OrderedDict
 import zope.interface
 from evelink.api import APIError
@@ -18,6 +19,37 @@ def mkresult(result):
     )
 
 
+class InFlight(object):
+    """
+    Counts the calls in flight, and the most that were at once.
+
+    If expect is set, a call waits (up to timeout seconds) for that many
+    calls to be in flight, so calls made concurrently are sure to
+    overlap.
+    """
+
+    def __init__(self, expect=None, timeout=5):
+        self.expect = expect
+        self.timeout = timeout
+        self.current = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            self._cond.notify_all()
+            end = time.time() + self.timeout
+            while (self.expect and self.current < self.expect and
+                    time.time() < end):
+                self._cond.wait(end - time.time())
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self.current -= 1
+
+
 class DummyCorp(object):
     """
     Dummy Corp data provider.
@@ -25,6 +57,10 @@ class DummyCorp(object):
 
     starbases_index = 0
     starbase_details_index = 0
+    # an `InFlight` to count the starbase details requests with.
+    in_flight = None
+    # a threading.Event to wait for before returning starbase details.
+    block = None
 
     def __init__(self, api=None):
         self.api = api
@@ -44,6 +80,14 @@ class DummyCorp(object):
             dummy_starbase_details[self.starbase_details_index].items()))
 
     def starbase_details(self, itemID):
+        if self.in_flight is not None:
+            with self.in_flight:
+                return self._starbase_details(itemID)
+        return self._starbase_details(itemID)
+
+    def _starbase_details(self, itemID):
+        if self.block is not None:
+            self.block.wait()
         all_results = self._dummy_starbase_details()
         results = all_results.get(itemID, {})
         if results.get('results'):
@@ -1,5 +1,6 @@
 from unittest import TestCase, TestSuite, makeSuite
 
+import threading
 import time
 import zope.component
 from zope.component.hooks import getSiteManager
@@ -134,6 +135,16 @@ class EvelinkSqliteCacheTestCase(TestCase):
 
         self.assertFalse(cache_until > time.time() + duration)
 
+    def test_0002_threads(self):
+        cache = EvelinkSqliteCache(':memory:')
+        cache.put('dummy', 'test_value', 100)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            cache.get('dummy')))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, ['test_value'])
+
 
 def test_suite():
     suite = TestSuite()
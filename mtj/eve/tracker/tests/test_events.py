@@ -0,0 +1,165 @@
+from unittest import TestCase, TestSuite, makeSuite
+
+import zope.component
+
+from mtj.eve.tracker.interfaces import ITrackerBackend
+from mtj.eve.tracker.pos import Tower
+from mtj.eve.tracker.events import EventLog, BoundaryWatcher
+
+from .base import setUp, tearDown
+
+
+class EventLogTestCase(TestCase):
+
+    def setUp(self):
+        self.events = EventLog(size=3, clock=lambda: 1325376000)
+
+    def test_0000_since(self):
+        self.assertEqual(self.events.since(), [])
+        first = self.events.publish('update', 1, state=4)
+        self.assertEqual(first.id, '1325376000-1')
+        self.assertEqual(first.data, {'state': 4})
+        second = self.events.publish('update', 2)
+        self.assertEqual(self.events.since(), [first, second])
+        self.assertEqual(self.events.since(first.id), [second])
+        self.assertEqual(self.events.since(second.id), [])
+
+    def test_0001_since_unavailable(self):
+        first = self.events.publish('update', 1)
+        for i in range(4):
+            last = self.events.publish('update', 1)
+        # the event after the first was dropped from the log.
+        self.assertEqual(self.events.since(first.id), None)
+        self.assertEqual(len(self.events.since('1325376000-2')), 3)
+        self.assertEqual(self.events.since(last.id), [])
+        # from some other log, or invalid.
+        self.assertEqual(self.events.since('1325300000-4'), None)
+        self.assertEqual(self.events.since('1325376000-6'), None)
+        self.assertEqual(self.events.since('garbage'), None)
+
+    def test_0002_subscribe(self):
+        received = []
+
+        def fail(event):
+            raise ValueError('failed')
+
+        self.events.subscribe(fail)
+        self.events.subscribe(received.append)
+        event = self.events.publish('update', 1)
+        self.events.unsubscribe(received.append)
+        self.events.publish('update', 1)
+        self.assertEqual(received, [event])
+
+
+class BackendEventsTestCase(TestCase):
+
+    def setUp(self):
+        setUp(self)
+        self.backend = zope.component.getUtility(ITrackerBackend)
+        self.tower = self.backend.addTower(1000001, 12235, 30004608, 40291202,
+            4, 1325376000, 1306886400, 498125261)
+        self.tower.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+
+    def tearDown(self):
+        tearDown(self)
+
+    def test_0000_writes(self):
+        events = self.backend.events.since()
+        self.assertEqual((events[0].kind, events[0].tower_id), ('added', 1))
+        # one for each fuel written.
+        self.assertTrue(len(events) > 2)
+        for event in events[1:]:
+            self.assertEqual((event.kind, event.tower_id), ('update', 1))
+            self.assertEqual(event.data['changes'], ['fuel'])
+
+        with self.backend.batch():
+            self.tower.setStateTimestamp(1325379601)
+            self.tower.updateResources({4247: 12000, 16275: 7200},
+                1325379601)
+        event = self.backend.events.since(events[-1].id)
+        self.assertEqual(len(event), 1)
+        self.assertEqual(event[0].data['changes'], ['fuel', 'tower'])
+        self.assertEqual(event[0].data['stateTimestamp'], 1325379601)
+
+        self.backend.reinstantiate()
+        self.assertEqual(self.backend.events.since(event[0].id)[0].kind,
+            'reload')
+
+    def test_0100_boundaries(self):
+        events = self.backend.events
+        watcher = BoundaryWatcher(self.backend, events)
+        last = events.since()[-1].id
+
+        self.assertEqual(watcher.nextBoundary(), None)
+        watcher.check(1325376000)
+        self.assertEqual(events.since(last), [])
+        self.assertEqual(watcher.nextBoundary(), 1325379600)
+        watcher.check(1325378000)
+        self.assertEqual(events.since(last), [])
+
+        watcher.check(1325379600)
+        pulses = events.since(last)
+        self.assertEqual([(e.kind, e.tower_id) for e in pulses],
+            [('pulse', 1)])
+        last = pulses[-1].id
+        self.assertEqual(watcher.nextBoundary(), 1325383200)
+
+        offline = self.tower.getOfflineTimestamp()
+        watcher.check(offline + 1)
+        changes = events.since(last)
+        self.assertEqual([(e.kind, e.data) for e in changes],
+            [('state', {'state': 1, 'previous': 4})])
+
+    def test_0101_boundaries_writes(self):
+        events = self.backend.events
+        watcher = BoundaryWatcher(self.backend, events)
+        events.subscribe(watcher.written)
+        watcher.check(1325376000)
+        last = events.since()[-1].id
+
+        # reinforced by a write, which is only published as an update.
+        self.tower.setState(3, stateTimestamp=1325390000,
+            timestamp=1325376600)
+        watcher.check(1325377000)
+        changes = events.since(last)
+        self.assertTrue(changes)
+        self.assertEqual(set(e.kind for e in changes), set(['update']))
+        last = changes[-1].id
+
+        # out of reinforcement as time passes.
+        self.assertEqual(watcher.nextBoundary(), 1325379600)
+        watcher.check(1325390000)
+        changes = events.since(last)
+        self.assertEqual([(e.kind, e.data) for e in changes],
+            [('state', {'state': 4, 'previous': 3})])
+
+    def test_0102_boundaries_due(self):
+        events = self.backend.events
+        watcher = BoundaryWatcher(self.backend, events)
+        watcher.check(1325376000)
+        last = events.since()[-1].id
+
+        checked = []
+        getState = Tower.__dict__['getState']
+
+        def tracked(tower, timestamp):
+            checked.append(tower.id)
+            return getState(tower, timestamp)
+
+        # only the towers at their boundary are looked at.
+        Tower.getState = tracked
+        try:
+            watcher.check(1325379599)
+            self.assertEqual(checked, [])
+            watcher.check(1325379600)
+            self.assertEqual(set(checked), set([1]))
+        finally:
+            Tower.getState = getState
+        self.assertEqual([e.kind for e in events.since(last)], ['pulse'])
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(EventLogTestCase))
+    suite.addTest(makeSuite(BackendEventsTestCase))
+    return suite
@@ -1,7 +1,10 @@
 from unittest import TestCase, TestSuite, makeSuite
 
+import gzip
+import hashlib
 import time
 from contextlib import contextmanager
+from io import BytesIO
 from json import loads
 import zope.component
 from zope.component.hooks import getSiteManager
@@ -12,17 +15,27 @@ from zope.component.hooks import getSiteManager
 from mtj.eve.tracker.backend import sql
 from mtj.eve.tracker.interfaces import ITrackerBackend
 from mtj.eve.tracker.interfaces import IAPIKeyManager
+from mtj.eve.tracker.interfaces import ITowerManager
 
 # Cannot use the BaseTowerManager as it does not cache API time usage.
 from mtj.eve.tracker.manager import TowerManager
 
 import mtj.eve.tracker.frontend.json
 from mtj.eve.tracker.frontend.json import Json
+from mtj.eve.tracker.frontend.cache import CachedResponse
+from mtj.eve.tracker.frontend.cache import ResponseCache, nextBoundary
 
 from mtj.evedb.tests.base import init_test_db
 from .base import setUp, tearDown
 from .dummyevelink import DummyKeyManager
 
+try:
+    from flask import Flask
+    from mtj.eve.tracker.frontend.flask import json_frontend
+    HAS_FLASK = True
+except ImportError:
+    HAS_FLASK = False
+
 
 @contextmanager
 def at_time(mod, ts):
@@ -98,3 +111,198 @@ class JsonTestCase(TestCase):
             u'end_ts_formatted': u'2013-03-09 02:06',
             u'start_ts_formatted': u'2013-03-09 02:06',
         }])
+
+    def test_fuel_log_pages(self):
+        for i in range(5):
+            self.backend._conn.execute('insert into fuel values '
+                '(%d, 1, 4247, 10, %d, %d)' % (i + 1, 1325376000 + i,
+                    1000 - i))
+
+        page = loads(self.frontend.fuel_log(1, 3))
+        self.assertEqual([v['id'] for v in page['fuel_log']], [5, 4, 3])
+        self.assertEqual(page['fuel_log'][0]['fuelName'],
+            self.frontend.fuel_names[4247])
+        self.assertEqual(page['next'], u'1325376002.3')
+
+        page = loads(self.frontend.fuel_log(1, 3, page['next']))
+        self.assertEqual([v['id'] for v in page['fuel_log']], [2, 1])
+        self.assertEqual(page['next'], None)
+
+        page = loads(self.frontend.tower_log(1))
+        self.assertEqual(page, {u'tower_log': [], u'next': None})
+
+
+class ResponseCacheTestCase(TestCase):
+    """
+    The response cache for the JSON frontend.
+    """
+
+    def setUp(self):
+        setUp(self)
+        self.backend = zope.component.getUtility(ITrackerBackend)
+        self.manager = TowerManager()
+
+        sm = getSiteManager()
+        self.dk = DummyKeyManager()
+        sm.registerUtility(self.dk, IAPIKeyManager)
+        with at_time(sql, 1362794809):
+            self.manager.importAll()
+
+    def tearDown(self):
+        tearDown(self)
+
+    def test_next_boundary(self):
+        towers = self.backend.getFleet().towers.values()
+        # the next resource pulse.
+        self.assertEqual(nextBoundary(towers, 1364175409), 1364179009)
+        self.assertEqual(nextBoundary(towers, 1364175410), 1364179009)
+        # offline, nothing will change.
+        self.assertEqual(nextBoundary(towers, 1364603809), None)
+
+    def test_cache(self):
+        now = [1364175409]
+        calls = []
+
+        def build(timestamp):
+            calls.append(timestamp)
+            return str(timestamp)
+
+        cache = ResponseCache(max_age=7200, clock=lambda: now[0])
+        self.assertEqual(cache.get('key', self.backend, build), '1364175409')
+        now[0] += 60
+        self.assertEqual(cache.get('key', self.backend, build), '1364175409')
+        self.assertEqual(len(calls), 1)
+
+        # the tower has pulsed.
+        now[0] = 1364179009
+        self.assertEqual(cache.get('key', self.backend, build), '1364179009')
+        self.assertEqual(len(calls), 2)
+
+        # the data has changed.
+        now[0] += 60
+        self.backend.addAudit(('tower', 1), 'A tower', 'user', 'label')
+        self.assertEqual(cache.get('key', self.backend, build), '1364179069')
+        self.assertEqual(cache.get('key', self.backend, build), '1364179069')
+        self.assertEqual(len(calls), 3)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['hit_rate'], 0.4)
+
+    def test_max_age(self):
+        now = [1364175409]
+        cache = ResponseCache(max_age=10, clock=lambda: now[0])
+        cache.get('key', self.backend, str)
+        now[0] += 10
+        self.assertEqual(cache.get('key', self.backend, str), '1364175419')
+
+    def test_etag_gzip(self):
+        now = [1364175409]
+        cache = ResponseCache(clock=lambda: now[0])
+        first = cache.getResponse('key', self.backend, str)
+        self.assertEqual(first.etag, hashlib.sha1('1364175409').hexdigest())
+        self.assertEqual(first.getEtag(True), first.etag + '-gzip')
+        self.assertTrue(cache.getResponse('key', self.backend, str) is first)
+
+        body = first.gzipped()
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(body)).read(),
+            '1364175409')
+        # compressed once.
+        self.assertTrue(first.gzipped() is body)
+
+        # rendered again, but the same body is not modified.
+        self.backend.addAudit(('tower', 1), 'A tower', 'user', 'label')
+        second = cache.getResponse('key', self.backend, str)
+        self.assertFalse(second is first)
+        self.assertEqual(second.etag, first.etag)
+
+        now[0] += 60
+        third = cache.getResponse('key', self.backend, str)
+        self.assertNotEqual(third.etag, first.etag)
+
+        uncached = CachedResponse('{}')
+        self.assertEqual(uncached.etag, CachedResponse('{}').etag)
+        self.assertNotEqual(uncached.etag, CachedResponse('[]').etag)
+
+
+class FlaskJsonTestCase(TestCase):
+    """
+    The conditional and compressed responses of the flask frontend.
+    """
+
+    def setUp(self):
+        setUp(self)
+        self.backend = zope.component.getUtility(ITrackerBackend)
+        self.manager = TowerManager()
+
+        sm = getSiteManager()
+        sm.registerUtility(DummyKeyManager(), IAPIKeyManager)
+        sm.registerUtility(self.manager, ITowerManager)
+        with at_time(sql, 1362794809):
+            self.manager.importAll()
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(json_frontend, url_prefix='/json')
+        self.app.config['MTJPOSTRACKER_RESPONSE_CACHE'] = None
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        tearDown(self)
+
+    def test_not_modified(self):
+        with at_time(mtj.eve.tracker.frontend.json, 1364175409):
+            response = self.client.get('/json/overview')
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+
+            response = self.client.get('/json/overview',
+                headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, '')
+            self.assertEqual(response.headers['ETag'], etag)
+
+            # the gzip compressed body is another representation.
+            response = self.client.get('/json/overview',
+                headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+        # rendered at another time, so the body differs.
+        with at_time(mtj.eve.tracker.frontend.json, 1364175469):
+            response = self.client.get('/json/overview',
+                headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_not_modified_cached(self):
+        self.app.config['MTJPOSTRACKER_RESPONSE_CACHE'] = ResponseCache()
+        response = self.client.get('/json/tower/1')
+        etag = response.headers['ETag']
+        response = self.client.get('/json/tower/1',
+            headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip(self):
+        plain = self.client.get('/json/towers')
+        self.assertEqual(plain.headers.get('Content-Encoding'), None)
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+
+        response = self.client.get('/json/towers',
+            headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-type'], 'application/json')
+        body = gzip.GzipFile(fileobj=BytesIO(response.data)).read()
+        self.assertEqual(loads(body)['towers'], loads(plain.data)['towers'])
+
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(JsonTestCase))
+    suite.addTest(makeSuite(ResponseCacheTestCase))
+    if HAS_FLASK:
+        suite.addTest(makeSuite(FlaskJsonTestCase))
+    return suite
@@ -1,3 +1,5 @@
+import threading
+import time
 from unittest import TestCase, TestSuite, makeSuite
 
 import zope.component
@@ -9,9 +11,11 @@ from mtj.eve.tracker.interfaces import IAPIKeyManager
 from mtj.eve.tracker.pos import Tower
 from mtj.eve.tracker.manager import APIKeyManager, BaseTowerManager
 from mtj.eve.tracker.manager import TowerManager
+from mtj.eve.tracker.manager import RateLimiter
 
 from .base import setUp, tearDown
 from .dummyevelink import DummyCorp
+from .dummyevelink import InFlight
 from .dummyevelink import DummyKeyManager
 
 
@@ -150,6 +154,42 @@ class BaseManagerTestCase(TestCase):
         self.assertEqual(tower_apis[0].currentTime, 1362865863)
         self.assertEqual(tower_apis[1].currentTime, 1362865863)
 
+    def test_0200_concurrent_fetch(self):
+        corp = DummyCorp()
+        corp.starbases_index = 2
+        corp.starbase_details_index = 2
+        corp.in_flight = InFlight()
+
+        itemIDs = list(corp.starbases().result.keys())
+        serial = BaseTowerManager(fetch_workers=1)
+        expected = serial.fetchStarbaseDetails(corp, itemIDs)
+        self.assertEqual(corp.in_flight.peak, 1)
+
+        # the requests wait for each other, so only get both in flight
+        # if they are made concurrently.
+        corp.in_flight = InFlight(expect=2)
+        results = self.manager.fetchStarbaseDetails(corp, itemIDs)
+        self.assertEqual(corp.in_flight.peak, 2)
+        corp.in_flight = None
+
+        # same results in the same order.
+        self.assertEqual([r[0] for r in results], itemIDs)
+        self.assertEqual([r[2].result for r in results],
+            [r[2].result for r in expected])
+
+        self.manager.importWithCorp(corp)
+        self.assertEqual(len(self.backend.getTowerIds()), 2)
+        self.assertEqual(self.backend.getTower(1).itemID, itemIDs[0])
+        self.assertEqual(self.backend.getTower(2).itemID, itemIDs[1])
+
+    def test_0201_concurrent_fetch_errors(self):
+        corp = DummyCorp()
+        corp.starbases_index = 1
+        results = self.manager.fetchStarbaseDetails(corp, [507862, 507863])
+        self.assertEqual(results[0][3], None)
+        self.assertEqual(results[1][2], None)
+        self.assertEqual(results[1][3].code, 114)
+
     def test_1000_time_keeping_fuel_details(self):
         corp = DummyCorp()
         self.manager.importWithCorp(corp)
@@ -200,6 +240,71 @@ class BaseManagerTestCase(TestCase):
         self.backend.reinstantiate()
         self.assertEqual(self.backend.getTower(1).stateTimestamp, 1362829009)
 
+    def test_1010_unchanged_details_skipped(self):
+        corp = DummyCorp()
+        self.manager.importWithCorp(corp)
+        tower = self.backend.getTower(1)
+        digests = self.backend.getTowerApiDigests()
+        self.assertEqual(len(digests[1]), 40)
+        # restricted to the towers of the starbases.
+        self.assertEqual(self.backend.getTowerApiDigests([tower.itemID]),
+            digests)
+        self.assertEqual(self.backend.getTowerApiDigests([1]), {})
+
+        def fail(*a, **kw):
+            self.fail('unchanged details should not be processed')
+
+        setState, Tower.setState = Tower.setState, fail
+        try:
+            self.manager.importWithCorp(corp)
+        finally:
+            Tower.setState = setState
+
+        self.assertEqual(self.backend.getTowerApiDigests(), digests)
+        tower_apis = self.backend.getTowerApis()
+        self.assertEqual(len(tower_apis), 1)
+        self.assertEqual(tower_apis[0].currentTime, 1362792986)
+        self.assertEqual(tower.fuels[4312].value, 4027)
+
+        # new details are processed.
+        corp.starbase_details_index = 1
+        self.manager.importWithCorp(corp)
+        self.assertNotEqual(self.backend.getTowerApiDigests()[1], digests[1])
+        self.assertEqual(self.backend.getTowerApis()[0].currentTime,
+            1362829863)
+
+    def test_1020_cached_details_not_requested(self):
+        corp = DummyCorp()
+        calls = []
+        starbase_details = corp.starbase_details
+        expires = int(time.time()) + 3600
+
+        def cached_details(itemID):
+            calls.append(itemID)
+            return starbase_details(itemID)._replace(expires=expires)
+
+        corp.starbase_details = cached_details
+        self.manager.importWithCorp(corp)
+        self.assertEqual(calls, [507862])
+        tower = self.backend.getTower(1)
+
+        self.manager.importWithCorp(corp)
+        self.assertEqual(calls, [507862])
+        tower_apis = self.backend.getTowerApis()
+        self.assertEqual(len(tower_apis), 1)
+        self.assertEqual(tower_apis[0].currentTime, 1362792986)
+        self.assertEqual(tower_apis[0].cachedUntil, expires)
+
+        self.assertEqual(self.manager.getCachedItems(self.backend, corp).keys(),
+            [(507862, 40291202)])
+
+        # the details are needed again for the sov change.
+        self.helper.sov_index = 1
+        self.assertEqual(self.manager.getCachedItems(self.backend, corp), {})
+        self.manager.importWithCorp(corp)
+        self.assertEqual(calls, [507862, 507862])
+        self.assertEqual(tower.fuels[4312].delta, 10)
+
     def test_1100_sov_change(self):
         corp = DummyCorp()
         self.manager.importWithCorp(corp)
@@ -262,6 +367,37 @@ class BaseManagerTestCase(TestCase):
     # not decrement as expected.
 
 
+class RateLimiterTestCase(TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.slept.append(duration)
+
+    def test_0000_rate(self):
+        limiter = RateLimiter(4, clock=self.clock, sleep=self.sleep)
+        for i in range(3):
+            limiter.wait()
+        self.assertEqual(self.slept, [0.25, 0.5])
+
+        # the slots already passed are not made up for.
+        self.now = 1010.0
+        limiter.wait()
+        self.assertEqual(self.slept, [0.25, 0.5])
+
+    def test_0001_manager(self):
+        manager = BaseTowerManager(fetch_rate=2)
+        limiter = manager._getRateLimiter(1)
+        self.assertTrue(limiter is manager._getRateLimiter(1))
+        self.assertFalse(limiter is manager._getRateLimiter(2))
+        self.assertEqual(BaseTowerManager()._getRateLimiter(1), None)
+
+
 class DefaultManagerTestCase(TestCase):
     """
     Unit tests for the base tower manager
@@ -292,10 +428,92 @@ class DefaultManagerTestCase(TestCase):
         # 0 on third element denoting success
         self.assertEqual(usage[1][2], 0)
 
+    def test_import_all_timeout(self):
+        slow = DummyCorp()
+        slow.api = type('DummyAPI', (object,), {'api_key': (2, 'vcode')})()
+        slow.block = threading.Event()
+        slow.starbases_index = 2
+        slow.starbase_details_index = 2
+        self.dk.getAllWith = lambda cls: [slow, self.dk.dummy]
+        self.manager.import_timeout = 0.2
+
+        try:
+            # returns while the slow key is still hung.
+            self.manager.importAll()
+            self.assertFalse(slow.block.is_set())
+        finally:
+            slow.block.set()
+
+        tower_apis = self.backend.getTowerApis()
+        self.assertEqual(len(tower_apis), 1)
+        self.assertEqual(tower_apis[0].api_key, 1)
+
+        usage = self.backend.currentApiUsage()
+        self.assertEqual(sorted(usage.keys()), [1, 2])
+        self.assertEqual(usage[1][2], 0)
+        # the slow key is recorded as failed.
+        self.assertEqual(usage[2][2], 1)
+        self.assertNotEqual(usage[2][1], None)
+
+    def test_import_all_timeout_slot(self):
+        in_flight = InFlight()
+        slow = DummyCorp()
+        slow.api = type('DummyAPI', (object,), {'api_key': (2, 'vcode')})()
+        # a single starbase, so its one request is in flight.
+        slow.block = threading.Event()
+        slow.in_flight = self.dk.dummy.in_flight = in_flight
+        self.dk.getAllWith = lambda cls: [slow, self.dk.dummy]
+        self.manager.import_workers = 1
+        self.manager.import_timeout = 0.2
+
+        done = []
+
+        def progress(count, total):
+            done.append(count)
+            # let the slow key finish once it has timed out.
+            slow.block.set()
+
+        calls = []
+
+        def apply(f, *a):
+            calls.append(f.__name__)
+            return f(*a)
+
+        self.manager.importAll(apply=apply, progress=progress)
+        # the other key only started once the thread of the slow key
+        # was done.
+        self.assertEqual(in_flight.peak, 1)
+        self.assertEqual(done, [1, 2])
+        # and its API usage only began then.
+        self.assertEqual([c for c in calls if c.endswith('ApiUsage')],
+            ['beginApiUsage', 'endApiUsage', 'beginApiUsage', 'endApiUsage'])
+
+        usage = self.backend.currentApiUsage()
+        self.assertEqual(usage[1][2], 0)
+        self.assertEqual(usage[2][2], 1)
+        # the late result of the slow key is not imported.
+        tower_apis = self.backend.getTowerApis()
+        self.assertEqual([t.api_key for t in tower_apis], [1])
+
+    def test_import_all_error(self):
+        def fail():
+            raise ValueError('bad key')
+
+        broken = DummyCorp()
+        broken.api = type('DummyAPI', (object,), {'api_key': (2, 'vcode')})()
+        broken.starbases = fail
+        self.dk.getAllWith = lambda cls: [broken, self.dk.dummy]
+        self.manager.importAll()
+
+        usage = self.backend.currentApiUsage()
+        self.assertEqual(usage[1][2], 0)
+        self.assertEqual(usage[2][2], 1)
+
 
 def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(APIKeyManagerTestCase))
     suite.addTest(makeSuite(BaseManagerTestCase))
+    suite.addTest(makeSuite(RateLimiterTestCase))
     suite.addTest(makeSuite(DefaultManagerTestCase))
     return suite
@@ -2,6 +2,7 @@ from time import time
 from unittest import TestCase, TestSuite, makeSuite
 
 from mtj.eve.tracker.pos import Tower, TowerResourceBuffer, TowerSiloBuffer
+from mtj.eve.tracker.pos import tower_profiles
 from mtj.eve.tracker.tests.base import installTestSite, registerHelper
 from mtj.eve.tracker.tests.base import tearDown
 
@@ -213,6 +214,120 @@ class TowerTestCase(TestCase):
         fuels = tower.getResources(21802)
         self.assertEqual(fuels[4247], 27840)
 
+    def test_1110_current_value_states(self):
+        timestamps = (0, 1, 3600, 20000, 20001, 36000, 36001, 72000)
+
+        def assertCurrentValues(tower):
+            for fuel in tower.fuels.itervalues():
+                if fuel is None:
+                    continue
+                for timestamp in timestamps:
+                    self.assertEqual(fuel.getCurrentValue(timestamp),
+                        fuel.getCurrent(timestamp=timestamp).value)
+
+        for state in (STATE_ONLINE, STATE_REINFORCE, STATE_ANCHORED):
+            tower = Tower(1000001, 12235, 30004608, 40291202, state,
+                20000, 0, 0)
+            tower.updateResources({4247: 400, 16275: 400}, 0)
+            assertCurrentValues(tower)
+
+        # reinforced after the fuels were updated.
+        tower = Tower(1000001, 12235, 30004608, 40291202, STATE_ONLINE,
+            0, 0, 0)
+        tower.updateResources({4247: 400, 16275: 400}, 0)
+        tower.setState(STATE_REINFORCE, stateTimestamp=20000, timestamp=3600)
+        assertCurrentValues(tower)
+
+        # marked offline without the fuels being made again.
+        tower = Tower(1000001, 12235, 30004608, 40291202, STATE_ONLINE,
+            0, 0, 0)
+        tower.updateResources({4247: 400, 16275: 400}, 0)
+        tower.state = STATE_ANCHORED
+        assertCurrentValues(tower)
+
+    def test_1200_derived_cache(self):
+        tower = Tower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        self.assertEqual(tower.getOfflineTimestamp(), 1326855600)
+        self.assertEqual(tower.getReinforcementLength(), 86400)
+
+        before = tower.getDerivedCacheStats()
+        self.assertEqual(tower.getOfflineTimestamp(), 1326855600)
+        self.assertEqual(tower.getReinforcementLength(), 86400)
+        after = tower.getDerivedCacheStats()
+        self.assertEqual(after['hits'], before['hits'] + 2)
+        self.assertEqual(after['misses'], before['misses'])
+
+        # new buffers invalidate the cached values.
+        tower.updateResources({4247: 24690, 16275: 3600}, 1325376000)
+        self.assertEqual(tower.getOfflineTimestamp(), 1328338800)
+        self.assertEqual(tower.getReinforcementLength(), 43200)
+
+    def test_1201_derived_cache_ratio_copy(self):
+        tower = Tower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        ratio = tower.getIdealFuelRatio()
+        ratio[4247] = 0
+        self.assertEqual(tower.getIdealFuelRatio(), {4247: 27990})
+
+
+class TowerTypeProfilesTestCase(TestCase):
+
+    def setUp(self):
+        installTestSite()
+        registerHelper()
+        tower_profiles.clear()
+
+    def tearDown(self):
+        tower_profiles.clear()
+        tearDown(self)
+
+    def test_0000_profile(self):
+        tower = Tower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        profile = tower.getProfile()
+        self.assertTrue(profile.sov)
+        self.assertEqual(sorted(profile.fuels), [4247, 16275])
+        self.assertEqual(profile.deltas[4247], 30)
+        self.assertEqual(profile.deltas[16275], 300)
+        self.assertEqual(profile.idealFuelRatio, {4247: 27990})
+        self.assertEqual(profile.strontiumCycles, 55)
+
+        tower.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        self.assertEqual(tower.getIdealFuelRatio(), profile.idealFuelRatio)
+        self.assertEqual(tower.getTargetStrontiumCycles(),
+            profile.strontiumCycles)
+
+    def test_0001_profile_shared(self):
+        tower1 = Tower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower2 = Tower(1000002, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        self.assertTrue(tower1.getProfile() is tower2.getProfile())
+
+        # without sovereignty the full amount is consumed.
+        profile = tower_profiles.getProfile(12235, False, None,
+            tower2.security)
+        self.assertFalse(tower1.getProfile() is profile)
+        self.assertEqual(profile.deltas[4247], 40)
+        self.assertEqual(profile.deltas[16275], 400)
+
+    def test_0002_profile_charters(self):
+        tower = Tower(1000003, 20066, 30004268, 40270415, 4,
+            1325376661, 1306886400, 498125261)
+        profile = tower.getProfile()
+        self.assertTrue(24592 in profile.fuels)
+        tower.initResources()
+        self.assertEqual(sorted(tower.fuels.keys()), sorted(profile.fuels))
+
+    def test_0100_resource_names(self):
+        names = tower_profiles.getResourceNames()
+        self.assertTrue(names is tower_profiles.getResourceNames())
+        self.assertTrue(4247 in names)
+        self.assertTrue(16275 in names)
+
 
 class TowerResourceBufferTestCase(TestCase):
     """
@@ -290,6 +405,28 @@ class TowerResourceBufferTestCase(TestCase):
         self.assertEqual(fuelbay1.value, 27600)
         self.assertEqual(fuelbay2.value, 27600)
 
+    def test_0300_current_value(self):
+        fuelbay = TowerResourceBuffer(self.tower, 40, 0,
+            purpose=FUEL_NORMAL, value=200,
+            resourceTypeName="Amarr Fuel Block", unitVolume=5)
+        for timestamp in (0, 1, 3600, 3601, 14400, 14401, 36000):
+            self.assertEqual(fuelbay.getCurrentValue(timestamp),
+                fuelbay.getCurrent(timestamp).value)
+
+        strontbay = TowerResourceBuffer(self.tower, 400, 0,
+            purpose=FUEL_REINFORCE, value=9600,
+            resourceTypeName="Strontium Clathrates", unitVolume=3)
+        self.assertEqual(strontbay.getCurrentValue(36000), 9600)
+
+        # the type details are shared.
+        fuelbay1 = TowerResourceBuffer(self.tower, 40, 3600,
+            purpose=FUEL_NORMAL, value=100,
+            resourceTypeName="Amarr Fuel Block", unitVolume=5)
+        self.assertTrue(fuelbay1.resourceType is fuelbay.resourceType)
+        self.assertTrue(fuelbay.getCurrent(3600).resourceType is
+            fuelbay.resourceType)
+        self.assertEqual(fuelbay1.unitVolume, 5)
+
 
 class TowerSiloBufferTestCase(TestCase):
     """
@@ -476,6 +613,7 @@ class TowerSiloBufferTestCase(TestCase):
 def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(TowerTestCase))
+    suite.addTest(makeSuite(TowerTypeProfilesTestCase))
     suite.addTest(makeSuite(TowerResourceBufferTestCase))
     suite.addTest(makeSuite(TowerSiloBufferTestCase))
     return suite
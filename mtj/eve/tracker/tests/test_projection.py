@@ -0,0 +1,101 @@
+from unittest import TestCase, TestSuite, makeSuite
+
+from mtj.eve.tracker import projection
+from mtj.eve.tracker.pos import Tower
+from mtj.eve.tracker.projection import FleetProjection
+
+from mtj.evedb.tests.base import init_test_db
+from mtj.eve.tracker.tests.base import installTestSite, registerHelper
+from mtj.eve.tracker.tests.base import tearDown
+
+STATE_ANCHORED = 1
+STATE_REINFORCE = 3
+STATE_ONLINE = 4
+
+
+class FleetProjectionTestCase(TestCase):
+    """
+    The projection must agree with the per tower calculations.
+    """
+
+    def setUp(self):
+        init_test_db()
+        installTestSite()
+        registerHelper()
+        self.has_numpy = projection.HAS_NUMPY
+
+        # sov null, discounted fuel.
+        tower1 = Tower(1, 12235, 30004608, 40291202, STATE_ONLINE,
+            1325376000, 1306886400, 498125261)
+        tower1.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+
+        # highsec with charters and a different resource pulse.
+        tower2 = Tower(2, 20066, 30004268, 40270415, STATE_ONLINE,
+            1325376661, 1306886400, 498125261)
+        tower2.updateResources({4246: 6543, 16275: 3600, 24592: 200},
+            1325376000)
+
+        # reinforced until some time in the future.
+        tower3 = Tower(3, 16214, 30004267, 40270327, STATE_REINFORCE,
+            1325412000, 1306886400, 1018389948)
+        tower3.updateResources({4246: 4000, 16275: 0}, 1325376000)
+
+        # anchored, fuels frozen.
+        tower4 = Tower(4, 12235, 30004608, 40291202, STATE_ANCHORED,
+            1325376000, 1306886400, 498125261)
+        tower4.updateResources({4247: 28000}, 1325376000)
+
+        # online but fuels never initialized.
+        tower5 = Tower(5, 12235, 30004608, 40291202, STATE_ONLINE,
+            1325376000, 1306886400, 498125261)
+
+        for i, tower in enumerate((tower1, tower2, tower3, tower4, tower5)):
+            tower.id = i + 1
+
+        self.towers = [tower1, tower2, tower3, tower4, tower5]
+        self.timestamps = [0, 1325376000, 1325376001, 1325376661,
+            1325376662, 1325412000, 1325412001, 1326096000, 1326096661,
+            1326096662, 1326855600, 1326855601, 1400000000]
+
+    def tearDown(self):
+        projection.HAS_NUMPY = self.has_numpy
+        tearDown(self)
+
+    def assertAgrees(self):
+        fleet = FleetProjection(self.towers)
+        self.assertEqual(fleet.getOfflineTimestamps(),
+            [t.getOfflineTimestamp() for t in self.towers])
+        for ts in self.timestamps:
+            self.assertEqual(fleet.getStates(ts),
+                [t.getState(ts) for t in self.towers])
+            self.assertEqual(fleet.getTimeRemaining(ts),
+                [t.getTimeRemaining(ts) for t in self.towers])
+
+    def test_0000_agrees(self):
+        self.assertAgrees()
+
+    def test_0001_agrees_without_numpy(self):
+        projection.HAS_NUMPY = False
+        self.assertAgrees()
+
+    def test_0100_project(self):
+        fleet = FleetProjection(self.towers)
+        results = fleet.project(1326096000)
+        self.assertEqual(results[0],
+            (self.towers[0], 1326855600, STATE_ONLINE, 759600))
+        self.assertEqual(results[1],
+            (self.towers[1], 1326096661, STATE_ONLINE, 661))
+        self.assertEqual(results[3],
+            (self.towers[3], None, STATE_ANCHORED, 0))
+        self.assertEqual(results[4],
+            (self.towers[4], -1, STATE_ANCHORED, 0))
+
+    def test_0200_empty(self):
+        fleet = FleetProjection([])
+        self.assertEqual(fleet.project(1326096000), [])
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(FleetProjectionTestCase))
+    return suite
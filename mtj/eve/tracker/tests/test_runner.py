@@ -1,8 +1,12 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase, TestSuite, makeSuite
 
 import zope.component
 
 from mtj.eve.tracker import interfaces
+from mtj.eve.tracker.backend.sql import SQLAlchemyBackend
 from mtj.eve.tracker.runner import BaseRunner
 from mtj.eve.tracker.ctrl import Options
 
@@ -70,6 +74,28 @@ class RunnerTestCase(TestCase):
         results = keyman.getAllWith(DummyCorp)
         self.assertEqual(results[2].api.api_key, ('test3', 'testing3_vcode6'))
 
+    def test_2000_initialize_no_snapshot(self):
+        tmpdir = tempfile.mkdtemp()
+        src = 'sqlite:///' + os.path.join(tmpdir, 'tracker.db')
+        path = os.path.join(tmpdir, 'towers.snapshot')
+        self.config.update({'implementations': {'ITrackerBackend': {
+            'class': 'mtj.eve.tracker.backend.sql:SQLAlchemyBackend',
+            'args': [],
+            'kwargs': {'src': src, 'snapshot_path': path},
+        }}})
+        try:
+            runner = BaseRunner()
+            runner.configure(config=self.config.config)
+            runner._preinitialize()
+            # a tower, so there is something to write.
+            SQLAlchemyBackend(src).addTower(1000001, 12235, 30004608,
+                40291202, 4, 1325376000, 1306886400, 498125261)
+            runner.initialize()
+            # left to the server, see `FlaskRunner.run`.
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 def test_suite():
     suite = TestSuite()
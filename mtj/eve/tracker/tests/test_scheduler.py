@@ -0,0 +1,160 @@
+import threading
+from unittest import TestCase, TestSuite, makeSuite
+
+import zope.component
+from zope.component.hooks import getSiteManager
+
+from mtj.eve.tracker.interfaces import ITrackerBackend
+from mtj.eve.tracker.interfaces import IAPIKeyManager, ITowerManager
+from mtj.eve.tracker.interfaces import ISettingsManager
+from mtj.eve.tracker.manager import TowerManager
+from mtj.eve.tracker.settings import DefaultSettingsManager
+from mtj.eve.tracker.scheduler import ImportScheduler, callInLoop
+from mtj.eve.tracker.scheduler import LoopCaller, LoopStopped
+
+from .base import setUp, tearDown
+from .dummyevelink import DummyKeyManager
+
+
+class DummyLoop(object):
+    """
+    Runs the callbacks added in a separate thread, like an IOLoop.
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def add_callback(self, callback):
+        thread = threading.Thread(target=callback)
+        self.threads.append(thread)
+        thread.start()
+
+
+class StoppedLoop(object):
+    """
+    A loop that no longer runs the callbacks added.
+    """
+
+    def add_callback(self, callback):
+        pass
+
+
+class ImportSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        setUp(self)
+        sm = getSiteManager()
+        self.dk = DummyKeyManager()
+        sm.registerUtility(self.dk, IAPIKeyManager)
+        self.manager = TowerManager()
+        sm.registerUtility(self.manager, ITowerManager)
+        sm.registerUtility(DefaultSettingsManager(update_timer=3610),
+            ISettingsManager)
+
+        self.backend = zope.component.getUtility(ITrackerBackend)
+        self.now = 1362792986
+        self.scheduler = ImportScheduler(clock=lambda: self.now)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        tearDown(self)
+
+    def test_0000_run_import(self):
+        progress = []
+        self.scheduler._progress = lambda *a: progress.append(a)
+        self.scheduler.runImport()
+
+        self.assertEqual(progress, [(1, 1)])
+        self.assertEqual(len(self.backend.getTowerApis()), 1)
+        status = self.scheduler.status()
+        self.assertEqual(status['state'], 'idle')
+        self.assertEqual(status['last_result'], 'ok')
+        self.assertEqual(status['last_end'], self.now)
+        # next run follows the cachedUntil of the starbase list.
+        cached_until = self.manager.cachedUntil[1]
+        self.assertTrue(cached_until < self.now + 3610)
+        self.assertEqual(status['next_run'],
+            cached_until + self.scheduler.margin)
+
+    def test_0001_next_run(self):
+        self.manager.cachedUntil[1] = self.now + 10
+        self.assertEqual(self.scheduler.getNextRun(self.now),
+            self.now + self.scheduler.min_interval)
+        self.manager.cachedUntil[1] = self.now + 7200
+        self.assertEqual(self.scheduler.getNextRun(self.now), self.now + 3610)
+        # a key that keeps failing leaves its cachedUntil behind.
+        self.manager.cachedUntil[2] = self.now - 600
+        self.assertEqual(self.scheduler.getNextRun(self.now), self.now + 3610)
+
+    def test_0002_import_error(self):
+        def fail(*a, **kw):
+            raise ValueError('failed')
+
+        self.manager.importAll = fail
+        self.scheduler.runImport()
+        status = self.scheduler.status()
+        self.assertEqual(status['state'], 'idle')
+        self.assertEqual(status['last_result'], 'error')
+        self.assertNotEqual(status['next_run'], None)
+
+    def test_0100_trigger(self):
+        done = threading.Event()
+        calls = []
+
+        def importAll(apply=None, progress=None):
+            calls.append(threading.current_thread())
+            done.set()
+
+        self.manager.importAll = importAll
+        # first run far in the future.
+        self.scheduler.start(delay=3600)
+        self.assertTrue(self.scheduler.trigger())
+        done.wait(5)
+        self.scheduler.stop()
+
+        self.assertEqual(len(calls), 1)
+        self.assertNotEqual(calls[0], threading.current_thread())
+        self.assertEqual(self.scheduler.status()['last_result'], 'ok')
+
+
+class CallInLoopTestCase(TestCase):
+
+    def test_0000_result(self):
+        loop = DummyLoop()
+        result = callInLoop(loop, lambda a, b=0: (
+            threading.current_thread(), a + b), 1, b=2)
+        self.assertEqual(result[1], 3)
+        self.assertEqual(result[0], loop.threads[0])
+
+    def test_0001_error(self):
+        def fail():
+            raise ValueError('failed')
+
+        self.assertRaises(ValueError, callInLoop, DummyLoop(), fail)
+
+    def test_0002_stopped(self):
+        caller = LoopCaller(StoppedLoop())
+        caller.interval = 0.01
+        errors = []
+
+        def call():
+            try:
+                caller(lambda: None)
+            except LoopStopped as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        # stopping the scheduler stops the caller it writes through.
+        ImportScheduler(apply=caller).stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertRaises(LoopStopped, caller, lambda: None)
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(ImportSchedulerTestCase))
+    suite.addTest(makeSuite(CallInLoopTestCase))
+    return suite
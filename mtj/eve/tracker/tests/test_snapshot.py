@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, TestSuite, makeSuite
+
+from mtj.eve.tracker.backend import snapshot
+from mtj.eve.tracker.backend.sql import SQLAlchemyBackend
+
+from .base import setUp, tearDown, registerBackend
+
+
+class SnapshotTestCase(TestCase):
+    """
+    Restoring the SQL backend from snapshot and journal.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = 'sqlite:///' + os.path.join(self.tmpdir, 'tracker.db')
+        self.path = os.path.join(self.tmpdir, 'snapshot')
+        self.backend = SQLAlchemyBackend(self.src, snapshot_path=self.path)
+        setUp(self, backend=self.backend)
+
+        tower1 = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower1.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        tower2 = self.backend.addTower(1000002, 20066, 30004268, 40270415, 4,
+            1325376000, 1306942573, 498125261)
+        tower2.updateResources({4246: 360, 16275: 2200, 24592: 34},
+            1325376000)
+        self.backend.reinstantiate()
+
+    def tearDown(self):
+        tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def restored(self):
+        backend = SQLAlchemyBackend(self.src, snapshot_path=self.path)
+        return backend, backend.restore()
+
+    def assertSameTowers(self, backend):
+        self.assertEqual(sorted(backend.getTowerIds()),
+            sorted(self.backend.getTowerIds()))
+        for tower_id in self.backend.getTowerIds():
+            expected = self.backend.getTower(tower_id)
+            tower = backend.getTower(tower_id)
+            for attr in ('itemID', 'state', 'stateTimestamp', 'resourcePulse',
+                    'typeName', 'celestialName', 'allianceID', 'capacity'):
+                self.assertEqual(getattr(tower, attr), getattr(expected, attr))
+            for ts in (1325376000, 1325379601, 1326096000):
+                self.assertEqual(tower.getResources(ts),
+                    expected.getResources(ts))
+                self.assertEqual(tower.getOfflineTimestamp(),
+                    expected.getOfflineTimestamp())
+
+    def test_0000_no_snapshot(self):
+        backend, result = self.restored()
+        self.assertEqual(result, None)
+        self.assertFalse(SQLAlchemyBackend().saveSnapshot())
+
+    def test_0001_snapshot(self):
+        self.assertTrue(self.backend.saveSnapshot())
+        backend, result = self.restored()
+        self.assertEqual(result, 2)
+        self.assertSameTowers(backend)
+
+    def test_0002_version_mismatch(self):
+        self.backend.saveSnapshot()
+        version = snapshot.SNAPSHOT_VERSION
+        snapshot.SNAPSHOT_VERSION = -1
+        try:
+            backend, result = self.restored()
+        finally:
+            snapshot.SNAPSHOT_VERSION = version
+        self.assertEqual(result, None)
+
+    def test_0100_journal(self):
+        self.backend.saveSnapshot()
+        tower = self.backend.getTower(1)
+        tower.setStateTimestamp(1325379601)
+        tower.updateResources({4247: 12000, 16275: 7200}, 1325379601)
+
+        backend, result = self.restored()
+        self.assertEqual(result, 2)
+        self.assertSameTowers(backend)
+        self.assertEqual(backend.getTower(1).stateTimestamp, 1325379601)
+
+        # the restored tower writes to the database as normal.
+        registerBackend(backend)
+        backend.getTower(1).setStateTimestamp(1325383202)
+        self.backend.reinstantiate()
+        self.assertEqual(self.backend.getTower(1).stateTimestamp, 1325383202)
+
+    def test_0101_journal_truncated(self):
+        self.backend.saveSnapshot()
+        tower = self.backend.getTower(2)
+        tower.updateResources({4246: 300, 16275: 2200, 24592: 34},
+            1325379600)
+        with open(self.path + '.journal', 'ab') as fp:
+            fp.write(b'\x80\x02(U')
+
+        backend, result = self.restored()
+        self.assertEqual(result, 2)
+        self.assertSameTowers(backend)
+
+    def test_0102_journal_state(self):
+        self.backend.saveSnapshot()
+        tower = self.backend.getTower(1)
+        # the fuels are no longer consumed once anchored.
+        tower.setState(1, timestamp=1325379601)
+        frozen = tower.getResources(1325379601)
+        self.assertEqual(tower.getResources(1326096000), frozen)
+
+        backend, result = self.restored()
+        self.assertSameTowers(backend)
+        self.assertEqual(backend.getTower(1).state, 1)
+        self.assertEqual(backend.getTower(1).getResources(1326096000), frozen)
+
+        # and the same as the towers reloaded from the database.
+        self.backend.reinstantiate()
+        self.assertSameTowers(backend)
+
+    def test_0200_unjournaled_changes(self):
+        self.backend.saveSnapshot()
+        # another writer without the journal.
+        self.backend._conn.execute('insert into fuel values '
+            '(100, 2, 4246, 10, 1325379600, 1000)')
+        self.backend._conn.execute('insert into change_log values '
+            "(100, 2, 'fuel', 1325379600)")
+        tower3 = self.backend.addTower(1000003, 12235, 30004608, 40291203, 4,
+            1325376000, 1306886400, 498125261)
+        tower3.updateResources({4247: 1000, 16275: 0}, 1325376000)
+
+        backend, result = self.restored()
+        self.assertEqual(result, 3)
+        self.assertEqual(backend.getTower(2).getResources(1325379600)[4246],
+            1000)
+        self.assertEqual(backend.getTower(3).getResources(1325376000)[4247],
+            1000)
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(SnapshotTestCase))
+    return suite
@@ -1,7 +1,15 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase, TestSuite, makeSuite
 
 import zope.component
+from sqlalchemy import create_engine
+from sqlalchemy.engine.reflection import Inspector
+from sqlalchemy.orm import Query
 
+from mtj.eve.tracker import pos
+from mtj.eve.tracker.backend import migration
 from mtj.eve.tracker.backend import sql
 from mtj.eve.tracker.interfaces import ITrackerBackend
 
@@ -81,6 +89,34 @@ class SqlBackendTestCase(TestCase):
         self.assertEqual(len(fuel_log), 1)
         self.assertEqual(fuel_log[0].timestamp, 1325484000)
 
+    def test_0101_fuel_log_pages(self):
+        # ids 1 to 10, with two logs at every timestamp.
+        for i in range(10):
+            self.backend._conn.execute('insert into fuel values '
+                '(%d, 1, 4247, 10, %d, %d)' % (i + 1, 1325376000 + i // 2,
+                    1000 - i))
+        self.backend._conn.execute('insert into fuel values '
+            '(11, 2, 4247, 10, 1325376000, 1000)')
+
+        page = self.backend.getFuelLog(1, 4)
+        self.assertEqual([f.id for f in page], [10, 9, 8, 7])
+        self.assertEqual(sql.pageCursor(page[-1]), '1325376003.7')
+        page = self.backend.getFuelLog(1, 4, '1325376003.7')
+        self.assertEqual([f.id for f in page], [6, 5, 4, 3])
+        page = self.backend.getFuelLog(1, 4, sql.pageCursor(page[-1]))
+        self.assertEqual([f.id for f in page], [2, 1])
+        self.assertEqual(self.backend.getFuelLog(1, None, '1325376000.1'),
+            [])
+
+        self.assertEqual([f.id for f in self.backend.iterFuelLog(1, 3)],
+            range(10, 0, -1))
+        self.assertEqual([f.id for f in self.backend.iterFuelLog(1, 5)],
+            range(10, 0, -1))
+
+        self.assertRaises(ValueError, self.backend.getFuelLog, 1, 4, 'x')
+        self.assertRaises(ValueError, self.backend.getFuelLog, 1, 4, '1')
+        self.assertRaises(ValueError, self.backend.getFuelLog, 1, 4, '.7')
+
     def test_0200_double_add(self):
         tower = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
             1325376000, 1306886400, 498125261)
@@ -93,6 +129,29 @@ class SqlBackendTestCase(TestCase):
         # ignore the new and return the previously added.
         self.assertEqual(tower, dupe)
 
+    def test_0201_tower_index(self):
+        tower1 = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower2 = self.backend.addTower(1000002, 20066, 30004268, 40270415, 4,
+            1325376000, 1306942573, 498125261)
+
+        def fail(*a):
+            raise AssertionError('database queried')
+
+        self.backend._queryTower = fail
+        self.assertTrue(self.backend.addTower(1000002, 20066, 30004268,
+            40270415, 4, 0, 0, 0) is tower2)
+        self.assertEqual(self.backend.findTowerIds('locationID', 30004608),
+            [1])
+        self.assertTrue(2 in self.backend.findTowerIds('regionName',
+            tower2.regionName))
+        self.assertEqual(self.backend.findTowerIds('locationID', 1), [])
+
+        self.backend.reinstantiate()
+        tower1 = self.backend.getTower(1)
+        self.assertTrue(self.backend.addTower(1000001, 12235, 30004608,
+            40291202, 4, 0, 0, 0) is tower1)
+
     def test_0300_tower_update(self):
         tower = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
             1325376000, 1306886400, 498125261)
@@ -140,6 +199,33 @@ class SqlBackendTestCase(TestCase):
         self.assertEqual(len(log), 1)
         self.assertEqual(log[0].stateTimestamp, 1325379602)
 
+    def test_0303_tower_log_pages(self):
+        for id_, state_ts in [(1, 1325376000), (2, None), (3, 1325379601),
+                (4, 1325376000), (5, None), (6, 1325379602)]:
+            self.backend._conn.execute('insert into tower_log (id, tower_id, '
+                'state, stateTimestamp) values (?, 1, 4, ?)', id_, state_ts)
+
+        # the logs without stateTimestamp come last.
+        log = self.backend.getTowerLog(1)
+        self.assertEqual([v.id for v in log], [6, 3, 4, 1, 5, 2])
+
+        page = self.backend.getTowerLog(1, 4)
+        self.assertEqual([v.id for v in page], [6, 3, 4, 1])
+        page = self.backend.getTowerLog(1, 4, sql.pageCursor(page[-1]))
+        self.assertEqual([v.id for v in page], [5, 2])
+        self.assertEqual(sql.pageCursor(page[0]), '.5')
+        page = self.backend.getTowerLog(1, 4, '.5')
+        self.assertEqual([v.id for v in page], [2])
+
+        self.assertEqual([v.id for v in self.backend.iterTowerLog(1, 1)],
+            [6, 3, 4, 1, 5, 2])
+
+    def test_0304_explicit_nulls_last(self):
+        dialect = self.backend._conn.dialect
+        version = dialect.dbapi.sqlite_version_info
+        self.assertEqual(sql.explicitNullsLast(dialect),
+            version >= (3, 30, 0))
+
     def test_2000_reinstantiate(self):
         self.backend._conn.execute('insert into tower values '
             '(1, 1000001, 12235, 30004608, 40291202, 4, 1325376000, '
@@ -212,6 +298,49 @@ class SqlBackendTestCase(TestCase):
             24592: 34,
         })
 
+    def test_2003_reinstantiate_bulk(self):
+        self.backend._conn.execute('insert into tower values '
+            '(1, 1000001, 12235, 30004608, 40291202, 4, 1325376000, '
+            '1306886400, 498125261)')
+        self.backend._conn.execute('insert into tower values '
+            '(2, 1000002, 20066, 30004268, 40270415, 4, 1325376000, '
+            '1306942573, 498125261)')
+        self.backend._conn.execute('insert into tower values '
+            '(3, 1000003, 20066, 30004268, 40270416, 1, 1325376000, '
+            '1306942573, 498125261)')
+
+        self.backend._conn.execute('insert into fuel values '
+            '(1, 1, 16275, 300, 1325366000, 7200)')
+        self.backend._conn.execute('insert into fuel values '
+            '(2, 2, 4246, 10, 1325376000, 360)')
+        self.backend._conn.execute('insert into fuel values '
+            '(3, 1, 4247, 30, 1325366000, 22340)')
+        self.backend._conn.execute('insert into fuel values '
+            '(4, 2, 16275, 100, 1325376000, 2200)')
+        self.backend._conn.execute('insert into fuel values '
+            '(5, 1, 4247, 30, 1325376000, 12345)')
+        self.backend._conn.execute('insert into fuel values '
+            '(6, 2, 4246, 10, 1325376000, 350)')
+
+        session = self.backend.session()
+        self.assertEqual(sorted(f.id for f in sql.queryLatestFuels(session)),
+            [1, 4, 5, 6])
+        self.assertEqual(sorted(f.id for f in
+            sql.queryLatestFuels(session, 2)), [4, 6])
+
+        self.backend.reinstantiate(bulk=False)
+        expected = {k: self.backend.getTower(k).getResources(1325376000)
+            for k in self.backend.getTowerIds()}
+        self.assertEqual(expected, {
+            1: {4247: 12345, 16275: 7200},
+            2: {4246: 350, 16275: 2200, 24592: 0},
+            3: {4246: 0, 16275: 0, 24592: 0},
+        })
+
+        self.backend.reinstantiate()
+        self.assertEqual(expected, {k: self.backend.getTower(k).getResources(
+            1325376000) for k in self.backend.getTowerIds()})
+
     def test_2002_reinstantiate_null_state_ts(self):
         self.backend._conn.execute('insert into tower values '
             '(1, 1000001, 12235, 30004608, 40291202, 1, 1325376661, '
@@ -244,6 +373,120 @@ class SqlBackendTestCase(TestCase):
             16275: 7200,
         })
 
+    def test_2100_change_log(self):
+        tower = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        tower.setStateTimestamp(1325379601)
+        self.backend.setTowerApi(1, 1, 1325376000)
+
+        result = list(self.backend._conn.execute(
+            'select id, tower_id, "table" from change_log'))
+        self.assertEqual(result, [
+            (1, 1, u'tower'),
+            (2, 1, u'fuel'),
+            (3, 1, u'fuel'),
+            (4, 1, u'tower'),
+            (5, 1, u'tower_api'),
+        ])
+
+    def test_2101_reinstantiate_changed(self):
+        tower1 = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower1.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        tower2 = self.backend.addTower(1000002, 20066, 30004268, 40270415, 4,
+            1325376000, 1306942573, 498125261)
+        tower2.updateResources({4246: 360, 16275: 2200, 24592: 34},
+            1325376000)
+
+        # without a full reinstantiation everything is loaded.
+        self.assertEqual(self.backend.reinstantiateChanged(), 2)
+        tower1 = self.backend.getTower(1)
+        tower2 = self.backend.getTower(2)
+        self.assertEqual(self.backend.reinstantiateChanged(), 0)
+
+        # another instance writing to the same database.
+        self.backend._conn.execute('insert into fuel values '
+            '(10, 2, 4246, 10, 1325379600, 1000)')
+        self.backend._conn.execute('insert into change_log values '
+            "(100, 2, 'fuel', 1325379600)")
+
+        self.assertEqual(self.backend.reinstantiateChanged(), 1)
+        self.assertTrue(self.backend.getTower(1) is tower1)
+        self.assertFalse(self.backend.getTower(2) is tower2)
+        self.assertEqual(self.backend.getTower(2).getResources(1325379600), {
+            4246: 1000,
+            16275: 2200,
+            24592: 34,
+        })
+        self.assertEqual(self.backend.reinstantiateChanged(), 0)
+
+        # moved by another instance.
+        self.backend._conn.execute('update tower set locationID = 30004608, '
+            'moonID = 40291203 where id = 2')
+        self.backend._conn.execute('insert into change_log values '
+            "(101, 2, 'tower', 1325379600)")
+
+        self.assertEqual(self.backend.reinstantiateChanged(), 1)
+        self.assertEqual(self.backend.findTowerIds('locationID', 30004268), [])
+        self.assertEqual(self.backend.findTowerIds('locationID', 30004608),
+            [1, 2])
+        self.assertEqual(self.backend._index.get(1000002, 40270415), None)
+        self.assertEqual(self.backend._index.get(1000002, 40291203), 2)
+
+    def test_2200_fleet_snapshot(self):
+        self.assertEqual(self.backend.getFleet().towers, {})
+        tower1 = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        tower1.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+        tower2 = self.backend.addTower(1000002, 20066, 30004268, 40270415, 4,
+            1325376000, 1306942573, 498125261)
+        tower2.updateResources({4246: 360, 16275: 2200, 24592: 34},
+            1325376000)
+
+        fleet = self.backend.getFleet()
+        self.assertEqual(sorted(fleet.towers.keys()), [1, 2])
+        frozen1 = fleet.towers[1]
+        self.assertFalse(frozen1 is tower1)
+        self.assertEqual(frozen1.getResources(1325379600),
+            tower1.getResources(1325379600))
+        self.assertEqual(frozen1.getOfflineTimestamp(),
+            tower1.getOfflineTimestamp())
+        self.assertRaises(TypeError, setattr, frozen1, 'state', 1)
+        # a plain copy, not mapped to the database.
+        self.assertTrue(type(frozen1) is pos.FrozenTower)
+        self.assertFalse(hasattr(frozen1, '_sa_instance_state'))
+        # as are the live towers.
+        self.assertTrue(type(tower1) is pos.Tower)
+        self.assertFalse(hasattr(tower1, '__dict__'))
+
+        # changes make a new version, leaving the old one as it was.
+        with self.backend.batch():
+            tower1.setStateTimestamp(1325379601)
+            tower1.updateResources({4247: 12000, 16275: 7200}, 1325379601)
+            # not published until the batch is written.
+            self.assertTrue(self.backend.getFleet() is fleet)
+
+        current = self.backend.getFleet()
+        self.assertTrue(current.version > fleet.version)
+        self.assertEqual(frozen1.stateTimestamp, 1325376000)
+        self.assertEqual(current.towers[1].stateTimestamp, 1325379601)
+        self.assertEqual(current.towers[1].getResources(1325379601)[4247],
+            12000)
+        # unchanged towers are not copied again.
+        self.assertTrue(current.towers[2] is fleet.towers[2])
+
+        # projected once per version.
+        projection = self.backend.getFleetProjection()
+        self.assertTrue(self.backend.getFleetProjection() is projection)
+        self.assertEqual(sorted(t.id for t in projection.towers), [1, 2])
+        tower2.setStateTimestamp(1325379602)
+        self.assertFalse(self.backend.getFleetProjection() is projection)
+
+        self.backend.reinstantiate()
+        self.assertEqual(sorted(self.backend.getFleet().towers.keys()),
+            [1, 2])
+
     def test_3000_add_audit(self):
         tower = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
             1325376000, 1306886400, 498125261)
@@ -327,6 +570,85 @@ class SqlBackendTestCase(TestCase):
         audits = self.backend.getAuditForTable('tower')
         self.assertEqual(audits[2][0].reason, "DJ :getout:")
 
+    def test_3004_latest_audit_backfill(self):
+        self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        self.backend.addAudit(('tower', '1'), "Newer", 'DJ', 'label',
+            1369479479)
+        # an entry added later but timestamped earlier is not the latest.
+        self.backend.addAudit(('tower', '1'), "Older", 'DJ', 'label',
+            1369479379)
+        self.backend.addAudit(('tower', '1'), "Note", 'DJ', 'notice',
+            1369479379)
+
+        def reasons():
+            audits = self.backend.getAuditForTable('tower')
+            return [a.reason for a in audits[1]]
+
+        self.assertEqual(reasons(), ['Newer', 'Note'])
+
+        self.backend._conn.execute('delete from latest_audit')
+        self.assertEqual(self.backend.getAuditForTable('tower'), {})
+        self.assertEqual(self.backend.backfill()['latest_audit'], 2)
+        self.assertEqual(reasons(), ['Newer', 'Note'])
+
+    def test_3005_audit_entries_pages(self):
+        self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        self.backend.addAudit(('tower', '1'), "First", 'DJ', 'label',
+            1369479379)
+        self.backend.addAudit(('tower', '1'), "Second", 'DJ', 'notice',
+            1369479472)
+        self.backend.addAudit(('tower', '1'), "Also second", 'DJ', 'notice',
+            1369479472)
+        self.backend.addAudit(('tower', '1'), "Third", 'DJ', 'label',
+            1369479482)
+
+        page = self.backend.getAuditEntriesFor('tower', 1, 2)
+        self.assertEqual([a.reason for a in page], ["Third", "Also second"])
+        page = self.backend.getAuditEntriesFor('tower', 1, 2,
+            sql.pageCursor(page[-1]))
+        self.assertEqual([a.reason for a in page], ["Second", "First"])
+        self.assertEqual([a.reason for a in
+            self.backend.iterAuditEntriesFor('tower', 1, 3)],
+            ["Third", "Also second", "Second", "First"])
+
+        page = self.backend.getAuditEntriesRecent(3)
+        self.assertEqual([a.reason for a in page],
+            ["Third", "Also second", "Second"])
+        page = self.backend.getAuditEntriesRecent(3,
+            sql.pageCursor(page[-1]))
+        self.assertEqual([a.reason for a in page], ["First"])
+
+    def test_3006_latest_audit_race(self):
+        self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        # added by another writer after the lookup of the backend.
+        self.backend._conn.execute('insert into latest_audit values '
+            '("tower", 1, "label", 0, 1369479379)')
+        get = Query.get
+        missed = []
+
+        def stale(query, ident):
+            if not missed and query.column_descriptions[0]['type'] is sql.LatestAudit:
+                missed.append(ident)
+                return None
+            return get(query, ident)
+
+        Query.get = stale
+        try:
+            self.backend.addAudit(('tower', '1'), "Newer", 'DJ', 'label',
+                1369479479)
+        finally:
+            Query.get = get
+
+        self.assertEqual(missed, [('tower', 1, 'label')])
+        audits = self.backend.getAuditForTable('tower')
+        self.assertEqual([a.reason for a in audits[1]], ['Newer'])
+        # the audit itself is only added once.
+        self.assertEqual([a.reason for a in
+            self.backend.getAuditEntriesFor('tower', 1)], ['Newer'])
+
     def test_3100_get_audit_categories_default(self):
         categories = self.backend.getAuditCategories('tower')
         names = [c.name for c in categories]
@@ -594,6 +916,32 @@ class SqlBackendTestCase(TestCase):
         # Should be reported as inactive now.
         self.assertEqual(self.backend.getApiTowerIdTimestamp(3, 45678), {})
 
+    def test_4003_latest_completed_usage(self):
+        m = self.backend.beginApiUsage(123456, 10000)
+        self.backend.endApiUsage(m, 0, 10004)
+        n = self.backend.beginApiUsage(123456, 20000)
+        self.backend.endApiUsage(n, 0, 20004)
+        o = self.backend.beginApiUsage(123457, 20000)
+        self.backend.endApiUsage(o, 0, 20002)
+        completed = {
+            123456: (20000, 20004, 0),
+            123457: (20000, 20002, 0),
+        }
+        self.assertEqual(self.backend.completedApiUsage(), completed)
+
+        # rebuilt from the usage log for existing databases.
+        self.backend._conn.execute('delete from latest_completed_usage')
+        self.assertEqual(self.backend.completedApiUsage(), {})
+        self.backend._backfillLatestCompletedUsage()
+        self.assertEqual(self.backend.completedApiUsage(), completed)
+
+        # a usage marked as failed afterwards no longer counts.
+        self.backend.endApiUsage(n, 1, 20005)
+        self.assertEqual(self.backend.completedApiUsage()[123456],
+            (10000, 10004, 0))
+        self.backend.endApiUsage(o, 1, 20005)
+        self.assertFalse(123457 in self.backend.completedApiUsage())
+
     def test_4100_api_add(self):
         self.backend.addApiKey('1234', 'secretvcode')
         self.backend.addApiKey('2468', 'anothervcode')
@@ -603,6 +951,59 @@ class SqlBackendTestCase(TestCase):
         self.assertEqual(keys[0].vcode, 'secretvcode')
         self.assertEqual(keys[1].key, '2468')
 
+    def test_4200_batch(self):
+        def count(table):
+            return list(self.backend._conn.execute(
+                'select count(*) from %s' % table))[0][0]
+
+        tower = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        self.backend.setTowerApi(1, 123456, 10000, 10000, api_error=True)
+
+        with self.backend.batch():
+            tower.updateResources({4247: 12345, 16275: 7200}, 1325376000)
+            tower.setStateTimestamp(1325379601)
+            with self.backend.batch():
+                tower.setStateTimestamp(1325379602)
+                self.backend.setTowerApi(1, 123456, 20000, 20000,
+                    api_error=True)
+            # nothing is written until the outermost batch is done.
+            self.assertEqual(count('fuel'), 0)
+            self.assertEqual(count('tower_log'), 0)
+            self.backend.setTowerApi(1, 123456, 20001, 20001,
+                api_error=True)
+
+        self.assertEqual(count('fuel'), 2)
+        self.assertEqual(count('change_log'), 8)
+        # every update is logged as it was when it happened.
+        log = self.backend.getTowerLog(1)
+        self.assertEqual([i.stateTimestamp for i in log],
+            [1325379602, 1325379601])
+        self.assertEqual(self.backend.getTowerApis()[0].api_error_count, 3)
+        self.assertEqual(self.backend.getTowerApis()[0].currentTime, 20001)
+
+        self.backend.reinstantiate()
+        tower = self.backend.getTower(1)
+        self.assertEqual(tower.stateTimestamp, 1325379602)
+        self.assertEqual(tower.getResources(1325376000), {
+            4247: 12345,
+            16275: 7200,
+        })
+
+    def test_4201_batch_error(self):
+        tower = self.backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+
+        def fail():
+            with self.backend.batch():
+                tower.setStateTimestamp(1325379601)
+                raise ValueError()
+
+        # writes made before the failure are kept.
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(len(self.backend.getTowerLog(1)), 1)
+        self.assertEqual(self.backend._pendingWrites(), None)
+
     def test_4101_api_del(self):
         self.backend.addApiKey('1234', 'secretvcode')
         self.backend.addApiKey('2468', 'anothervcode')
@@ -616,7 +1017,192 @@ class SqlBackendTestCase(TestCase):
         self.assertEqual(keys[0].key, '2468')
         self.assertEqual(keys[0].vcode, 'anothervcode')
 
+
+class QueryLatestTestCase(TestCase):
+    """
+    The strategies of `sql.queryLatest` give the same results, on both
+    in-memory and file databases.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def backends(self):
+        yield sql.SQLAlchemyBackend()
+        yield sql.SQLAlchemyBackend('sqlite:///' +
+            os.path.join(self.tmpdir, 'tracker.db'))
+
+    def strategies(self, backend):
+        result = ['correlated']
+        if sql.latestStrategy(backend._conn.dialect) == 'window':
+            result.append('window')
+        return result
+
+    def populate(self, backend):
+        fuels = []
+        usages = []
+        audits = []
+        for i in range(60):
+            fuels.append((i + 1, i % 4, 4247 + i % 3, 40, 1000 + i, i))
+            # with ties in start_ts for every key.
+            usages.append((i + 1, i % 5, i % 3 - 1, 1000 * (i % 7),
+                1000 * (i % 7) + 10))
+            audits.append((i + 1, 'tower', i % 3, 'note', 'user',
+                'label' if i % 2 else 'notice', 100 * (i % 11)))
+        backend._conn.execute('insert into fuel values '
+            '(?, ?, ?, ?, ?, ?)', fuels)
+        backend._conn.execute('insert into api_usage_log values '
+            '(?, ?, ?, ?, ?)', usages)
+        backend._conn.execute('insert into audit values '
+            '(?, ?, ?, ?, ?, ?, ?)', audits)
+
+    def results(self, backend, strategy):
+        session = backend.session()
+        fuels = sorted(f.id for f in sql.queryLatestFuels(session,
+            tower_ids=[0, 1, 2], strategy=strategy))
+        latest = sorted(u.id for u in sql.queryLatest(session,
+            sql.ApiUsageLog, ('api_key',), 'start_ts',
+            filters=sql.ApiUsageLog.state == 0, strategy=strategy))
+        earliest = sorted(u.id for u in sql.queryLatest(session,
+            sql.ApiUsageLog, ('api_key',), 'start_ts', earliest=True,
+            strategy=strategy))
+        audits = sorted(a.id for a in sql.queryLatest(session, sql.Audit,
+            ('table', 'rowid', 'category_name'), 'timestamp',
+            strategy=strategy))
+        return fuels, latest, earliest, audits
+
+    def test_0000_strategies(self):
+        expected = None
+        for backend in self.backends():
+            self.populate(backend)
+            for strategy in self.strategies(backend):
+                results = self.results(backend, strategy)
+                if expected is None:
+                    expected = results
+                self.assertEqual(results, expected, strategy)
+
+        fuels, latest, earliest, audits = expected
+        # the latest of every fuel type of towers 0, 1 and 2.
+        self.assertEqual(fuels, [49, 50, 51, 53, 54, 55, 57, 58, 59])
+        self.assertEqual(latest, [14, 35, 47, 53, 56])
+        # the least id between the rows with the least start_ts.
+        self.assertEqual(earliest, [1, 8, 15, 22, 29])
+        self.assertEqual(audits, [11, 22, 33, 44, 54, 55])
+
+
+class MigrationTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = 'sqlite:///' + os.path.join(self.tmpdir, 'tracker.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_0000_new(self):
+        backend = sql.SQLAlchemyBackend(self.src)
+        self.assertEqual(backend.getSchemaVersion(),
+            migration.SCHEMA_VERSION)
+        self.assertEqual(sql.migrateSchema(backend._conn), [])
+
+    def test_0001_new_migrate(self):
+        engine = create_engine(self.src)
+        self.assertEqual(migration.getVersion(engine, sql.Base.metadata), 0)
+        self.assertEqual(sql.migrateSchema(engine), [])
+        self.assertEqual(migration.getVersion(engine, sql.Base.metadata),
+            migration.SCHEMA_VERSION)
+
+    def test_0100_migrate(self):
+        # a database from before the migrations.
+        engine = create_engine(self.src)
+        engine.execute('create table tower_api (tower_id integer primary '
+            'key, api_key integer, currentTime integer, timestamp integer, '
+            'api_error_count integer)')
+        engine.execute('create table fuel (id integer primary key, '
+            'tower_id integer, fuelTypeID integer, delta integer, '
+            'timestamp integer, value integer)')
+
+        # not started before it is migrated.
+        self.assertRaises(migration.SchemaVersionError,
+            sql.SQLAlchemyBackend, self.src)
+        self.assertEqual(migration.getVersion(engine, sql.Base.metadata), 0)
+
+        self.assertEqual([v for v, d in sql.migrateSchema(engine)],
+            [v for v, d, m in migration.MIGRATIONS])
+        self.assertEqual([r.version for r in engine.execute(
+                'select version from schema_version order by id')],
+            [v for v, d, m in migration.MIGRATIONS])
+        self.assertEqual(sql.migrateSchema(engine), [])
+        backend = sql.SQLAlchemyBackend(self.src)
+        self.assertEqual(backend.getSchemaVersion(),
+            migration.SCHEMA_VERSION)
+
+        inspector = Inspector.from_engine(engine)
+        columns = [c['name'] for c in inspector.get_columns('tower_api')]
+        self.assertTrue('digest' in columns)
+        self.assertTrue('cachedUntil' in columns)
+        indexes = [i['name'] for i in inspector.get_indexes('fuel')]
+        self.assertTrue('ix_fuel_tower_id_fuelTypeID_id' in indexes)
+        indexes = [i['name'] for i in inspector.get_indexes('tower_log')]
+        self.assertTrue('ix_tower_log_tower_id_stateTimestamp_id' in indexes)
+        indexes = [i['name'] for i in inspector.get_indexes('audit')]
+        self.assertTrue('ix_audit_table_rowid_timestamp_id' in indexes)
+        self.assertTrue('ix_audit_timestamp_id' in indexes)
+
+        backend.setTowerApi(1, 123456, 10000, 10000, digest='0' * 40)
+        self.assertEqual(backend.getTowerApiDigests(), {1: '0' * 40})
+
+    def test_0101_migrate_tower_api_digest(self):
+        engine = create_engine(self.src)
+        engine.execute('create table tower_api (tower_id integer primary '
+            'key, api_key integer, currentTime integer, timestamp integer, '
+            'api_error_count integer)')
+        engine.execute('insert into tower_api values '
+            '(1, 123456, 10000, 10000, 0)')
+
+        sql.migrateSchema(engine)
+        backend = sql.SQLAlchemyBackend(self.src)
+        # the details of the existing towers are processed again.
+        self.assertEqual(backend.getTowerApiDigests(), {})
+        backend.setTowerApi(1, 123456, 10001, 10001, digest='1' * 40)
+        self.assertEqual(backend.getTowerApiDigests(), {1: '1' * 40})
+
+    def test_0102_migrate_tower_api_cached_until(self):
+        engine = create_engine(self.src)
+        engine.execute('create table tower_api (tower_id integer primary '
+            'key, api_key integer, currentTime integer, timestamp integer, '
+            'api_error_count integer)')
+        engine.execute('insert into tower_api values '
+            '(1, 123456, 10000, 10000, 0)')
+
+        sql.migrateSchema(engine)
+        backend = sql.SQLAlchemyBackend(self.src)
+        backend.addTower(1000001, 12235, 30004608, 40291202, 4,
+            1325376000, 1306886400, 498125261)
+        # the details of the existing towers are requested again.
+        self.assertEqual(backend.getCachedTowerApis(123456, 10000), {})
+        backend.setTowerApi(1, 123456, 10001, 10001, cachedUntil=20000)
+        self.assertEqual(list(backend.getCachedTowerApis(123456, 10000)),
+            [(1000001, 40291202)])
+
+    def test_0200_explain(self):
+        backend = sql.SQLAlchemyBackend(self.src)
+        plans = backend.explainHotQueries()
+        self.assertEqual([n for n, p in plans],
+            [n for n, q in backend.hotQueries()])
+        for name, plan in plans:
+            self.assertTrue(plan, name)
+        # without the backend.
+        self.assertEqual(sql.explainHotQueries(create_engine(self.src)),
+            plans)
+
+
 def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(SqlBackendTestCase))
+    suite.addTest(makeSuite(QueryLatestTestCase))
+    suite.addTest(makeSuite(MigrationTestCase))
     return suite
@@ -0,0 +1,119 @@
+import json
+import threading
+from unittest import TestSuite, makeSuite
+
+from zope.component.hooks import getSiteManager
+
+from mtj.eve.tracker.interfaces import IAPIKeyManager, ITowerManager
+from mtj.eve.tracker.manager import TowerManager
+from mtj.eve.tracker.frontend.cache import ResponseCache
+
+from .base import setUp, tearDown
+from .dummyevelink import DummyKeyManager
+
+try:
+    from tornado.testing import AsyncHTTPTestCase, AsyncTestCase
+    from tornado.web import Application
+    from mtj.eve.tracker.frontend.tornado import Executor, jsonHandlers
+    HAS_TORNADO = True
+except ImportError:
+    HAS_TORNADO = False
+    AsyncHTTPTestCase = AsyncTestCase = object
+
+
+class JsonHandlersTestCase(AsyncHTTPTestCase):
+    """
+    The tornado handlers for the JSON endpoints.
+    """
+
+    def setUp(self):
+        setUp(self)
+        sm = getSiteManager()
+        sm.registerUtility(DummyKeyManager(), IAPIKeyManager)
+        self.manager = TowerManager()
+        sm.registerUtility(self.manager, ITowerManager)
+        self.manager.importAll()
+        super(JsonHandlersTestCase, self).setUp()
+
+    def tearDown(self):
+        super(JsonHandlersTestCase, self).tearDown()
+        tearDown(self)
+
+    def get_app(self):
+        # the in-memory database is only available to this thread.
+        return Application(jsonHandlers('/json', Executor(0),
+            cache=ResponseCache(), admin_key='admin'))
+
+    def test_0000_overview(self):
+        response = self.fetch('/json/overview')
+        self.assertEqual(response.code, 200)
+        self.assertTrue('api_usage' in json.loads(response.body))
+        etag = response.headers['Etag']
+
+        response = self.fetch('/json/overview',
+            headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+
+    def test_0001_tower(self):
+        response = self.fetch('/json/tower/1')
+        self.assertEqual(json.loads(response.body)['tower']['id'], 1)
+
+    def test_0100_reload(self):
+        response = self.fetch('/json/reload', method='POST',
+            body=json.dumps({'key': 'invalid'}))
+        self.assertEqual(response.code, 403)
+
+        response = self.fetch('/json/reload', method='POST',
+            body=json.dumps({'key': 'admin'}))
+        self.assertEqual(response.code, 202)
+        job_id = json.loads(response.body)['job']
+
+        job = json.loads(self.fetch('/json/job/%s' % job_id).body)['result']
+        self.assertEqual(job['state'], 'done')
+        self.assertEqual(job['result'], 1)
+
+        self.assertEqual(self.fetch('/json/job/100').code, 404)
+
+
+class ExecutorTestCase(AsyncTestCase):
+
+    def test_0000_threads(self):
+        executor = Executor(2)
+        results = []
+
+        def callback(result, exc_info):
+            results.append((result, exc_info, threading.current_thread()))
+            self.stop()
+
+        executor.submit(threading.current_thread, callback)
+        self.wait()
+        executor.close()
+
+        worker, exc_info, thread = results[0]
+        self.assertEqual(exc_info, None)
+        self.assertNotEqual(worker, thread)
+        self.assertEqual(thread, threading.current_thread())
+
+    def test_0001_error(self):
+        executor = Executor(1)
+        results = []
+
+        def fail():
+            raise ValueError('failed')
+
+        def callback(result, exc_info):
+            results.append(exc_info)
+            self.stop()
+
+        executor.submit(fail, callback)
+        self.wait()
+        executor.close()
+        self.assertEqual(results[0][0], ValueError)
+
+
+def test_suite():
+    suite = TestSuite()
+    if HAS_TORNADO:
+        suite.addTest(makeSuite(JsonHandlersTestCase))
+        suite.addTest(makeSuite(ExecutorTestCase))
+    return suite
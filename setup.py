@@ -31,6 +31,9 @@ setup(name='mtj.eve.tracker',
           'requests',
           'mtj.f3u1',
       ],
+      extras_require={
+          'numpy': ['numpy'],
+      },
       entry_points="""
       # -*- Entry points: -*-
       """,